@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -46,7 +47,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'cars.metrics.PerformanceMiddleware',
+    'cars.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # Przed middleware, które czytają lub zmieniają treść odpowiedzi
+    'cars.compression.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -62,12 +67,20 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'cars.context_processors.catalogue',
+            ],
+            # Skompilowane szablony trzymane w pamięci workera (także przy DEBUG;
+            # runserver i tak przeładowuje je po zmianie pliku)
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
             ],
         },
     },
@@ -76,6 +89,60 @@ TEMPLATES = [
 WSGI_APPLICATION = 'car4u.wsgi.application'
 
 
+# Cache: domyślnie w pamięci workera; REDIS_URL daje wspólny cache dla wszystkich workerów
+# (wymaga pakietu redis). Fragmenty szablonów ({% cache %}) mają osobny alias, żeby nie
+# wypierały innych wpisów - ich klucze zawierają wersję katalogu, więc nie trzeba ich czyścić.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+            'KEY_PREFIX': 'car4u',
+        },
+        'template_fragments': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+            'KEY_PREFIX': 'car4u-fragments',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'car4u-default',
+        },
+        'template_fragments': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'car4u-fragments',
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        },
+    }
+
+# Czas życia fragmentów szablonów w sekundach
+CARS_FRAGMENT_CACHE_TIMEOUT = int(os.environ.get('CARS_FRAGMENT_CACHE_TIMEOUT', 600))
+
+# Sesje: cached_db czyta z cache i zapisuje do bazy tylko zmienione sesje, cache nie
+# dotyka bazy wcale - oba tylko ze wspólnym Redisem (REDIS_URL). Cache w pamięci workera
+# nie widzi wylogowania ani zmian sesji z innych workerów, więc bez Redisa domyślnie db
+SESSION_BACKENDS = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_BACKEND = os.environ.get('CARS_SESSION_BACKEND', 'cached_db' if os.environ.get('REDIS_URL') else 'db')
+if SESSION_BACKEND not in SESSION_BACKENDS:
+    raise ImproperlyConfigured(
+        f"Nieznany CARS_SESSION_BACKEND: {SESSION_BACKEND} (dostępne: {', '.join(SESSION_BACKENDS)})"
+    )
+if SESSION_BACKEND in ('cached_db', 'cache') and not os.environ.get('REDIS_URL'):
+    raise ImproperlyConfigured(
+        f"CARS_SESSION_BACKEND={SESSION_BACKEND} wymaga wspólnego cache (REDIS_URL); "
+        "cache w pamięci workera rozjeżdża sesje między workerami"
+    )
+SESSION_ENGINE = SESSION_BACKENDS[SESSION_BACKEND]
+
+
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
@@ -123,7 +190,83 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+# collectstatic: nazwy z hashem treści + wersje .gz/.br; WhiteNoise wysyła je z Cache-Control na rok
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'cars.storage.StaticFilesStorage',
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Artefakty pochodne katalogu aut (wersja katalogu, indeksy, tabele podobieństw).
+# Worker zadań (run_worker, startowany przez gunicorn.conf.py) musi widzieć ten sam katalog
+CARS_ARTIFACTS_DIR = Path(os.environ.get('CARS_ARTIFACTS_DIR', BASE_DIR / 'artifacts'))
+
+# Wątki na obliczenia rekomendacji (KNN, CF) w jednym workerze ASGI; 0 = bez puli
+CARS_COMPUTE_WORKERS = int(os.environ.get('CARS_COMPUTE_WORKERS', min(4, os.cpu_count() or 1)))
+
+# Kontrola dopuszczenia drogich widoków (na proces): limit równoczesnych obliczeń,
+# kolejka czekających, maksymalne czekanie w sekundach i Retry-After odpowiedzi 503.
+# Po przekroczeniu: recommend_car i quiz_results korzystają z gotowych wyników
+# (tabela sąsiadów, ranking ocen), recommend_batch zwraca 503; limit 0 = bez limitu
+CARS_ADMISSION_LIMITS = {
+    'recommend_car': {'limit': max(CARS_COMPUTE_WORKERS, 1), 'queue': 2 * max(CARS_COMPUTE_WORKERS, 1), 'timeout': 1.0, 'retry_after': 5},
+    'quiz_results': {'limit': max(CARS_COMPUTE_WORKERS, 1), 'queue': 2 * max(CARS_COMPUTE_WORKERS, 1), 'timeout': 0.5, 'retry_after': 5},
+    'recommend_batch': {'limit': 1, 'queue': 2, 'timeout': 2.0, 'retry_after': 10},
+}
+
+# Identyczne równoczesne rekomendacje liczone raz: wynik w cache przez TTL sekund,
+# blokada w cache między workerami najwyżej LOCK_TIMEOUT sekund (0 = bez cache wyniku)
+CARS_SINGLEFLIGHT_TTL = int(os.environ.get('CARS_SINGLEFLIGHT_TTL', 30))
+CARS_SINGLEFLIGHT_LOCK_TIMEOUT = int(os.environ.get('CARS_SINGLEFLIGHT_LOCK_TIMEOUT', 10))
+
+# Opóźnienie przebudowy artefaktów po zmianie katalogu/ocen (zmiany w tym oknie dają jedną przebudowę)
+CARS_JOB_DEBOUNCE_SECONDS = float(os.environ.get('CARS_JOB_DEBOUNCE_SECONDS', 5))
+# Ciągłe zmiany przesuwają przebudowę najwyżej o tyle sekund od pierwszego zaplanowania
+CARS_JOB_MAX_DELAY_SECONDS = float(os.environ.get('CARS_JOB_MAX_DELAY_SECONDS', 60))
+
+# /metrics (format Prometheusa) tylko z tych adresów
+CARS_METRICS_ALLOWED_IPS = os.environ.get('CARS_METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+
+# Kody cech w magazynie wektorów KNN: float32 (16 B/auto) albo int8 (4 B/auto); wyniki są dokładne w obu
+CARS_VECTOR_STORE_DTYPE = os.environ.get('CARS_VECTOR_STORE_DTYPE', 'float32')
+
+# Odbiorcy czasów etapów KNN/CF (funkcje: nazwa_etapu, sekundy)
+CARS_STAGE_SINKS = ['cars.profiling.metrics_sink']
+# Ułamek żądań profilowanych cProfile bez nagłówka X-Profile (0 = tylko na życzenie)
+CARS_PROFILE_SAMPLE_RATE = float(os.environ.get('CARS_PROFILE_SAMPLE_RATE', 0))
+# Liczba najnowszych profili trzymanych w CARS_ARTIFACTS_DIR/profiles/ (starsze są usuwane)
+CARS_PROFILE_KEEP = int(os.environ.get('CARS_PROFILE_KEEP', 200))
+
+# Budżet startu workera (import aplikacji i URLconf), sprawdzany przez manage.py benchmark_startup
+CARS_STARTUP_BUDGET_MS = float(os.environ.get('CARS_STARTUP_BUDGET_MS', 600))
+# Pakiety ładowane leniwie przy pierwszym użyciu - nie mogą być importowane przy starcie
+CARS_STARTUP_LAZY_MODULES = ['pandas', 'sklearn', 'scipy']
+
+# Jeden wiersz JSON na żądanie w logu cars.performance (czas, SQL, cache, etapy)
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'cars.performance': {
+            'handlers': ['console'],
+            'level': os.environ.get('PERFORMANCE_LOG_LEVEL', 'WARNING' if DEBUG else 'INFO'),
+            'propagate': False,
+        },
+        'cars.profiling': {
+            'handlers': ['console'],
+            'level': os.environ.get('PERFORMANCE_LOG_LEVEL', 'WARNING' if DEBUG else 'INFO'),
+            'propagate': False,
+        },
+    },
+}
@@ -0,0 +1,168 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+
+from .metrics import record_timing, registry
+
+DEFAULT_RETRY_AFTER = 5
+
+
+class Overloaded(Exception):
+    """Limit widoku jest zajęty, a kolejka pełna (albo minął czas oczekiwania)."""
+
+
+def _wake(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class AdmissionLimiter:
+    """
+    Limit równoczesnych obliczeń jednego widoku z ograniczoną kolejką.
+
+    Najwyżej `limit` żądań liczy się naraz, kolejne czekają w kolejce FIFO
+    (najwyżej `queue` żądań, każde najwyżej `timeout` sekund), a nadmiarowe
+    są odrzucane od razu - zanim zajmą wątek z puli obliczeń i opóźnią
+    tanie widoki tego samego workera. Limit dotyczy jednego procesu.
+
+    Args:
+        name: nazwa widoku (etykieta w /metrics)
+        limit: liczba równoczesnych obliczeń
+        queue: liczba żądań czekających na wolne miejsce
+        timeout: maksymalne czekanie w kolejce w sekundach
+        retry_after: wartość nagłówka Retry-After przy odrzuceniu
+    """
+
+    def __init__(self, name, limit, queue=0, timeout=0.0, retry_after=DEFAULT_RETRY_AFTER):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.active = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+        self._publish()
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+    def _publish(self):
+        registry.set_admission_state(self.name, self.active, len(self._waiters), self.limit)
+
+    async def acquire(self):
+        """True, jeśli żądanie dostało miejsce (wtedy trzeba wywołać release())."""
+        with self._lock:
+            if self.active < self.limit and not self._waiters:
+                self.active += 1
+                self._publish()
+                registry.count_admission(self.name, "admitted")
+                return True
+            if len(self._waiters) >= self.queue or self.timeout <= 0:
+                registry.count_admission(self.name, "rejected")
+                return False
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            self._publish()
+
+        start = time.perf_counter()
+        try:
+            await asyncio.wait((waiter,), timeout=self.timeout)
+        except asyncio.CancelledError:
+            # Klient się rozłączył - miejsce przekazane w międzyczasie trzeba oddać
+            if not self._withdraw(waiter):
+                self.release()
+            raise
+        record_timing("admission_wait", time.perf_counter() - start)
+        if self._withdraw(waiter):
+            registry.count_admission(self.name, "timeout")
+            return False
+        registry.count_admission(self.name, "queued")
+        return True
+
+    def _withdraw(self, waiter):
+        """Usuwa czekającego z kolejki; False, jeśli zdążył już dostać miejsce."""
+        with self._lock:
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                return False
+            self._publish()
+            return True
+
+    def release(self):
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                try:
+                    # Miejsce przechodzi na pierwszego czekającego (active bez zmian)
+                    waiter.get_loop().call_soon_threadsafe(_wake, waiter)
+                    break
+                except RuntimeError:
+                    continue  # pętla zdarzeń czekającego jest już zamknięta
+            else:
+                self.active -= 1
+            self._publish()
+
+    @asynccontextmanager
+    async def admit(self):
+        admitted = await self.acquire()
+        try:
+            yield admitted
+        finally:
+            if admitted:
+                self.release()
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(name):
+    """
+    Limiter widoku wg CARS_ADMISSION_LIMITS albo None (widok bez limitu).
+
+    Limiter jest tworzony od nowa tylko po zmianie konfiguracji widoku.
+    """
+    config = getattr(settings, "CARS_ADMISSION_LIMITS", {}).get(name)
+    if not config or not config.get("limit"):
+        return None
+    key = tuple(sorted(config.items()))
+    with _limiters_lock:
+        entry = _limiters.get(name)
+        if entry is None or entry[0] != key:
+            entry = _limiters[name] = (key, AdmissionLimiter(name, **config))
+    return entry[1]
+
+
+@asynccontextmanager
+async def admission(name):
+    """
+    Dopuszczenie drogiego obliczenia widoku; zwraca False przy przeciążeniu.
+
+    Przykład:
+        async with admission("quiz_results") as admitted:
+            if admitted:
+                recommendations = await run_compute(recommend_cars_hybrid, user)
+            else:
+                recommendations = ...  # wynik gotowy albo odpowiedź 503
+    """
+    limiter = get_limiter(name)
+    if limiter is None:
+        yield True
+        return
+    async with limiter.admit() as admitted:
+        yield admitted
+
+
+def reject(response, name):
+    """Oznacza odpowiedź jako 503 z nagłówkiem Retry-After z konfiguracji widoku."""
+    limiter = get_limiter(name)
+    response.status_code = 503
+    response["Retry-After"] = str(limiter.retry_after if limiter else DEFAULT_RETRY_AFTER)
+    return response
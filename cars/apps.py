@@ -1,6 +1,18 @@
+import os
+
 from django.apps import AppConfig
 
 
 class CarsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cars'
+
+    def ready(self):
+        from . import signals  # noqa: F401 - rejestracja odbiorników sygnałów
+
+        # gunicorn.conf.py (preload_app) ustawia CARS_PRELOAD w masterze:
+        # rozgrzewka odbywa się raz, przed fork() workerów. Komendy manage.py
+        # i testy nie dotykają bazy przy starcie.
+        if os.environ.get('CARS_PRELOAD') == '1':
+            from .warmup import warm_up
+            warm_up()
@@ -0,0 +1,422 @@
+import csv
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import django
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import transaction
+from django.test import Client
+
+from .catalogue import bump_catalogue_version, bump_ratings_version
+from .lookups import FUEL_TYPES, HYBRID, PLUG_IN_HYBRID
+from .models import Brand, Car, CarModel, FuelType, UserCarRating
+
+# Rozmiary danych syntetycznych: (auta, użytkownicy)
+SCALES = {
+    "small": (1_000, 100),
+    "medium": (10_000, 1_000),
+    "large": (100_000, 10_000),
+    "xl": (1_000_000, 100_000),
+}
+
+BRANDS = (
+    "Audi", "BMW", "Bentley", "Bugatti", "Cadillac", "Chevrolet", "Citroen", "Dacia",
+    "Ferrari", "Fiat", "Ford", "Honda", "Hyundai", "Jaguar", "Jeep", "Kia",
+    "Lamborghini", "Land Rover", "Lexus", "Mazda", "Mercedes", "Mini", "Nissan", "Opel",
+    "Peugeot", "Porsche", "Renault", "Rolls Royce", "Seat", "Skoda", "Subaru", "Suzuki",
+    "Tesla", "Toyota", "Volkswagen", "Volvo",
+)
+MODEL_PREFIXES = ("GT", "Sport", "Line", "Cross", "City", "Touring", "Coupe", "X")
+ENGINES = ("R3", "R4", "V6", "V8", "V10", "V12", "Electric Motor", "Hybrid R4")
+FUELS = FUEL_TYPES[:3] + (HYBRID, PLUG_IN_HYBRID, "Petrol/Diesel")
+SEATS = (2, 4, 5, 5, 5, 5, 7, 8)
+
+# Część aut bez kompletu cech, jak w prawdziwym pliku CSV
+MISSING_RATE = 0.03
+
+
+def synthetic_cars(count, seed=0):
+    """
+    Powtarzalny strumień aut o rozkładach zbliżonych do Cars Datasets 2025.
+
+    Moc ma rozkład logarytmiczno-normalny, a prędkość i cena rosną z mocą,
+    więc KNN ma sensownych sąsiadów. Ten sam seed daje te same dane.
+
+    Returns:
+        generator słowników z polami modelu Car (nazwy tekstowe)
+    """
+    rng = random.Random(seed)
+    for i in range(count):
+        brand = BRANDS[i % len(BRANDS)]
+        horsepower = round(min(max(rng.lognormvariate(5.3, 0.45), 60), 1600))
+        total_speed = int(min(140 + horsepower * 0.22 + rng.gauss(0, 12), 420))
+        cars_price = round(8000 + horsepower ** 1.6 * rng.uniform(4, 9), -2)
+        car = {
+            "company_name": brand,
+            "car_name": f"{rng.choice(MODEL_PREFIXES)} {rng.randrange(1, 60)}",
+            "engine": rng.choice(ENGINES),
+            "horsepower": float(horsepower),
+            "total_speed": total_speed,
+            "cars_price": cars_price,
+            "fuel_type": rng.choice(FUELS),
+            "seats": rng.choice(SEATS),
+        }
+        if rng.random() < MISSING_RATE:
+            car[rng.choice(("horsepower", "total_speed", "cars_price"))] = None
+        yield car
+
+
+def populate_catalogue(count, seed=0, batch_size=5000):
+    """
+    Wstawia `count` syntetycznych aut przez bulk_create (bez Car.save()).
+
+    Klucze do słowników są ustawiane z pamięci, a wersja katalogu jest
+    podbijana raz na końcu - tak jak po imporcie.
+    """
+    brands = {name: Brand.objects.get_or_create(name=name)[0] for name in BRANDS}
+    fuels = {name: FuelType.objects.get_or_create(name=name)[0] for name in FUELS}
+    car_models = {(m.brand_id, m.name): m for m in CarModel.objects.all()}
+
+    def flush(rows):
+        missing = {
+            (brands[row["company_name"]].id, row["car_name"])
+            for row in rows
+        } - car_models.keys()
+        created = CarModel.objects.bulk_create([CarModel(brand_id=b, name=n) for b, n in missing])
+        car_models.update({(m.brand_id, m.name): m for m in created})
+        Car.objects.bulk_create([
+            Car(
+                **row,
+                brand=brands[row["company_name"]],
+                car_model=car_models[(brands[row["company_name"]].id, row["car_name"])],
+                fuel=fuels[row["fuel_type"]],
+            )
+            for row in rows
+        ])
+
+    rows = []
+    for row in synthetic_cars(count, seed):
+        rows.append(row)
+        if len(rows) >= batch_size:
+            flush(rows)
+            rows = []
+    if rows:
+        flush(rows)
+    bump_catalogue_version()
+
+
+def populate_ratings(users, ratings_per_user=10, seed=0, batch_size=10000):
+    """
+    Tworzy `users` użytkowników, każdy z `ratings_per_user` ocenami (1-5).
+
+    Oceny zależą od "gustu" użytkownika (tanie albo mocne auta), żeby
+    collaborative filtering znajdował podobnych użytkowników.
+    """
+    rng = random.Random(seed)
+    car_ids = list(Car.objects.values_list("id", "cars_price"))
+    if not car_ids:
+        return
+
+    start = User.objects.count()
+    User.objects.bulk_create(
+        [User(username=f"bench_{start + i}", password="!") for i in range(users)],
+        batch_size=batch_size,
+    )
+    user_ids = User.objects.filter(username__startswith="bench_").order_by("-id").values_list("id", flat=True)[:users]
+
+    batch = []
+    for user_id in user_ids:
+        likes_expensive = rng.random() < 0.5
+        for car_id, price in rng.sample(car_ids, min(ratings_per_user, len(car_ids))):
+            expensive = (price or 0) > 60000
+            base = 4 if expensive == likes_expensive else 2
+            batch.append(UserCarRating(user_id=user_id, car_id=car_id, rating=min(max(base + rng.randint(-1, 1), 1), 5)))
+        if len(batch) >= batch_size:
+            UserCarRating.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        UserCarRating.objects.bulk_create(batch)
+    bump_ratings_version()
+
+
+def write_synthetic_csv(path, count, seed=0):
+    """Plik w formacie Cars Datasets 2025 (wejście dla import_cars --csv)."""
+    with open(path, "w", newline="", encoding="cp1252") as f:
+        writer = csv.writer(f)
+        writer.writerow([
+            "Company Names", "Cars Names", "Engines", "HorsePower",
+            "Total Speed", "Cars Prices", "Fuel Types", "Seats",
+        ])
+        for car in synthetic_cars(count, seed):
+            writer.writerow([
+                car["company_name"].upper(),
+                car["car_name"],
+                car["engine"],
+                f"{car['horsepower']:.0f} hp" if car["horsepower"] is not None else "",
+                f"{car['total_speed']} km/h" if car["total_speed"] is not None else "",
+                f"${car['cars_price']:,.0f}" if car["cars_price"] is not None else "",
+                car["fuel_type"],
+                car["seats"],
+            ])
+    return path
+
+
+def measure(func, rounds=5, warmup=1):
+    """
+    Czasy wywołań func() (sekundy): min, mediana, średnia, p95.
+
+    Rozgrzewka nie jest liczona - pierwsze wywołanie buduje leniwe
+    artefakty (snapshot, indeksy) i nie opisuje stanu ustalonego.
+    """
+    for _ in range(warmup):
+        func()
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return {
+        "rounds": rounds,
+        "min": times[0],
+        "median": statistics.median(times),
+        "mean": statistics.fmean(times),
+        "p95": times[min(len(times) - 1, int(round(0.95 * (len(times) - 1))))],
+    }
+
+
+class BenchmarkContext:
+    """Dane wspólne dla przypadków: przykładowy użytkownik i wektor wyszukiwania."""
+
+    def __init__(self, workdir, seed=0):
+        self.workdir = workdir
+        self.seed = seed
+        self.client = Client()
+        self.user = User.objects.filter(usercarrating__isnull=False).order_by("id").first()
+        self.user_vector = {"horsepower": 300.0, "total_speed": 250.0, "cars_price": 90000.0, "seats": 5}
+
+
+def bench_knn(context):
+    from .knn import find_top_similar_cars
+    return lambda: find_top_similar_cars(Car.objects.all(), context.user_vector, top_n=5)
+
+
+def bench_collaborative(context):
+    from .collaborative_filtering import recommend_cars_collaborative
+    if context.user is None:
+        return None
+    return lambda: recommend_cars_collaborative(context.user, top_n=5)
+
+
+def bench_hybrid(context):
+    from .hybrid import recommend_cars_hybrid
+    if context.user is None:
+        return None
+    return lambda: recommend_cars_hybrid(context.user, top_n=5)
+
+
+def bench_quiz_sample(context):
+    from .collaborative_filtering import get_random_cars_for_quiz
+    return lambda: get_random_cars_for_quiz(10)
+
+
+def bench_search(context):
+    def run():
+        response = context.client.get("/search/", {"q": "porsche gt", "min_power": 200, "page": 2})
+        assert response.status_code == 200, response.status_code
+    return run
+
+
+def bench_download_csv(context):
+    def run():
+        response = context.client.get("/download/", {"fuel_type": "Petrol"})
+        assert response.status_code == 200, response.status_code
+    return run
+
+
+def bench_import(context, rows=2000):
+    # Każde powtórzenie importuje ten sam plik i jest wycofywane, żeby
+    # kolejne przebiegi startowały z tym samym katalogiem; podbicia wersji
+    # i zapis snapshotu czekają na commit, więc po wycofaniu artefakty
+    # zostają nietknięte. Wynik to też wiersze/s
+    path = write_synthetic_csv(os.path.join(context.workdir, "import.csv"), rows, context.seed + 1)
+
+    def run():
+        with transaction.atomic():
+            call_command("import_cars", csv=path, stdout=io.StringIO())
+            transaction.set_rollback(True)
+    run.items = rows
+    return run
+
+
+# Nazwa -> przygotowanie przypadku (zwraca funkcję do pomiaru albo None,
+# jeśli przypadek nie ma sensu dla danych). Import jest wycofywany i nie
+# zmienia katalogu ani artefaktów, więc kolejność przypadków jest dowolna.
+BENCHMARKS = {
+    "knn.find_top_similar_cars": bench_knn,
+    "cf.recommend_cars_collaborative": bench_collaborative,
+    "hybrid.recommend_cars_hybrid": bench_hybrid,
+    "quiz.get_random_cars_for_quiz": bench_quiz_sample,
+    "view.search": bench_search,
+    "view.download_csv": bench_download_csv,
+    "command.import_cars": bench_import,
+}
+
+
+def run_benchmarks(context, rounds=5, warmup=1, only=None, progress=None):
+    """
+    Wykonuje przypadki z BENCHMARKS (albo tylko te z listy `only`).
+
+    Returns:
+        dict {nazwa: statystyki z measure()}; przypadki z atrybutem items
+        mają też przepustowość "items_per_second" (z mediany)
+    """
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if only and name not in only:
+            continue
+        func = setup(context)
+        if func is None:
+            continue
+        if progress:
+            progress(name)
+        stats = measure(func, rounds=rounds, warmup=warmup)
+        items = getattr(func, "items", None)
+        if items:
+            stats["items_per_second"] = items / stats["median"]
+        results[name] = stats
+    return results
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "executable": sys.executable,
+    }
+
+
+def build_report(results, cars, users, ratings_per_user, seed):
+    """Wynik w formacie JSON zapisywanym przez manage.py benchmark --output."""
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "data": {"cars": cars, "users": users, "ratings_per_user": ratings_per_user, "seed": seed},
+        "environment": environment(),
+        "results": results,
+    }
+
+
+def load_report(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare_reports(report, baseline, tolerance=0.25):
+    """
+    Porównuje mediany z zapisaną bazą.
+
+    Args:
+        report: bieżący wynik (build_report)
+        baseline: wcześniejszy wynik dla tych samych danych
+        tolerance: dopuszczalny wzrost mediany (0.25 = 25%)
+
+    Returns:
+        lista krotek (nazwa, mediana bazowa, mediana bieżąca, stosunek, regresja)
+
+    Przykład:
+        [("knn.find_top_similar_cars", 0.120, 0.180, 1.5, True)]
+    """
+    if report["data"] != baseline["data"]:
+        raise ValueError(
+            f"Baza dotyczy innych danych ({baseline['data']}) niż bieżący pomiar ({report['data']})"
+        )
+
+    rows = []
+    for name, stats in report["results"].items():
+        previous = baseline["results"].get(name)
+        if previous is None:
+            continue
+        ratio = stats["median"] / previous["median"] if previous["median"] else float("inf")
+        rows.append((name, previous["median"], stats["median"], ratio, ratio > 1 + tolerance))
+    return rows
+
+
+# Start workera: ustawienia, aplikacje, URLconf z widokami (to samo, co
+# gunicorn robi przed pierwszym żądaniem)
+STARTUP_SCRIPT = """
+import json, resource, sys, time
+start = time.perf_counter()
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    "seconds": elapsed,
+    "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "modules": sorted({name.partition(".")[0] for name in sys.modules}),
+}))
+"""
+
+
+def parse_importtime(stderr):
+    """
+    Skumulowany czas importu (sekundy) pakietów najwyższego poziomu
+    z wyjścia python -X importtime.
+    """
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # Wcięcie nazwy oznacza import zagnieżdżony - liczony w rodzicu
+        if name.startswith("  ") or not cumulative.strip().isdigit():
+            continue
+        package = name.strip().partition(".")[0]
+        packages[package] = packages.get(package, 0) + int(cumulative) / 1e6
+    return packages
+
+
+def measure_startup(rounds=3):
+    """
+    Czas i pamięć startu aplikacji w świeżym interpreterze.
+
+    Każdy pomiar to osobny proces `python -X importtime`, więc cache
+    modułów z bieżącego procesu nie zaniża wyniku.
+
+    Returns:
+        dict z medianą czasu ("seconds"), pamięcią ("max_rss_mb"),
+        zaimportowanymi pakietami ("modules") i czasem importu pakietów
+        z ostatniego pomiaru ("packages")
+    """
+    from django.conf import settings
+
+    env = {**os.environ, "DJANGO_SETTINGS_MODULE": settings.SETTINGS_MODULE}
+    runs = []
+    for _ in range(rounds):
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", STARTUP_SCRIPT],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+        )
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        result["packages"] = parse_importtime(process.stderr)
+        runs.append(result)
+
+    last = runs[-1]
+    return {
+        "seconds": statistics.median(run["seconds"] for run in runs),
+        "max_rss_mb": last["max_rss_kb"] / 1024,
+        "modules": last["modules"],
+        "packages": last["packages"],
+    }
@@ -0,0 +1,379 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.dispatch import Signal
+
+from .metrics import record_cache
+
+# Wysyłany po każdej zmianie katalogu aut (kwargs: version, car_ids)
+catalogue_changed = Signal()
+# Wysyłany po każdej zmianie ocen użytkowników (kwargs: version, car_ids)
+ratings_changed = Signal()
+
+VERSION_FILENAME = "catalogue.version"
+RATINGS_VERSION_FILENAME = "ratings.version"
+# Zastosowane migracje aplikacji cars, dla których zbudowano artefakty
+SCHEMA_FILENAME = "schema.version"
+# Dziennik aut zmienionych w kolejnych wersjach (przycinany o połowę po przekroczeniu limitu)
+CHANGES_SUFFIX = ".changes"
+MAX_CHANGES_BYTES = 1 << 20
+
+_state = threading.local()
+_version_lock = threading.Lock()
+_version_memo = {}
+
+
+def artifacts_dir():
+    """Katalog na artefakty pochodne katalogu (indeksy, tabele, snapshoty)."""
+    path = Path(settings.CARS_ARTIFACTS_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def atomic_write_bytes(path, data):
+    """Zapisuje plik przez plik tymczasowy + rename, żeby czytelnicy nie widzieli połówek."""
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _seed_version(path):
+    """
+    Pierwsza wersja w nowym (albo wyczyszczonym) katalogu artefaktów:
+    znacznik czasu w mikrosekundach zamiast 0. Wersje z różnych katalogów
+    się nie powtarzają, więc proces nie weźmie artefaktu z pamięci,
+    zbudowanego dla innego katalogu, za aktualny. Z kilku workerów
+    zapisuje tylko pierwszy (link nie nadpisuje istniejącego pliku).
+    """
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.seed")
+    tmp_path.write_text(str(time.time_ns() // 1000))
+    try:
+        os.link(tmp_path, path)
+    except FileExistsError:
+        pass
+    finally:
+        tmp_path.unlink()
+    return path.stat()
+
+
+def _read_version(filename):
+    path = artifacts_dir() / filename
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        stat = _seed_version(path)
+
+    key = (str(path), stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    memo = _version_memo.get(filename)
+    if memo is not None and memo[0] == key:
+        return memo[1]
+
+    try:
+        version = int(path.read_text().strip() or 0)
+    except (OSError, ValueError):
+        version = 0
+
+    _version_memo[filename] = (key, version)
+    return version
+
+
+def _write_next_version(filename, car_ids=None):
+    with _version_lock:
+        version = _read_version(filename) + 1
+        atomic_write_bytes(artifacts_dir() / filename, str(version).encode())
+        _log_changes(filename, version, car_ids)
+    return version
+
+
+def _log_changes(filename, version, car_ids):
+    """
+    Dopisuje wiersz "wersja id,id,..." ("wersja *" = nieznane auta) do
+    dziennika zmian obok pliku wersji. Dopisanie krótkiego wiersza jest
+    tańsze niż przepisywanie artefaktów przy każdym zapisie; zadania
+    w tle czytają z dziennika, które auta zmieniły się od ich wersji.
+    """
+    path = artifacts_dir() / (filename + CHANGES_SUFFIX)
+    ids = "*" if car_ids is None else ",".join(str(car_id) for car_id in sorted(set(car_ids)))
+    with open(path, "a") as f:
+        f.write(f"{version} {ids}\n")
+    if path.stat().st_size > MAX_CHANGES_BYTES:
+        lines = path.read_bytes().splitlines(keepends=True)
+        atomic_write_bytes(path, b"".join(lines[len(lines) // 2:]))
+
+
+def _changes_since(filename, since, until):
+    if since is None or since > until:
+        return None
+    if since == until:
+        return set()
+    path = artifacts_dir() / (filename + CHANGES_SUFFIX)
+    try:
+        lines = path.read_text().splitlines()
+    except OSError:
+        return None
+
+    changed = set()
+    seen = set()
+    for line in lines:
+        version, _, ids = line.partition(" ")
+        try:
+            version = int(version)
+        except ValueError:
+            continue
+        if not since < version <= until:
+            continue
+        if ids.strip() == "*":
+            return None
+        seen.add(version)
+        changed.update(int(car_id) for car_id in ids.split(",") if car_id.strip())
+    # Brak wiersza (dziennik przycięty albo jeszcze niedopisany) = nie wiadomo
+    if len(seen) != until - since:
+        return None
+    return changed
+
+
+def get_catalogue_version():
+    """
+    Zwraca bieżącą wersję katalogu aut.
+
+    Wersja jest trzymana w pliku w katalogu artefaktów, dzięki czemu jest
+    wspólna dla wszystkich workerów i komendy import_cars. Plik jest czytany
+    ponownie tylko wtedy, gdy zmieni się jego mtime.
+    """
+    return _read_version(VERSION_FILENAME)
+
+
+def get_ratings_version():
+    """Bieżąca wersja ocen użytkowników (ten sam mechanizm co wersja katalogu)."""
+    return _read_version(RATINGS_VERSION_FILENAME)
+
+
+def catalogue_changes_since(since, until):
+    """
+    Id aut zmienionych w wersjach katalogu (since, until].
+
+    Returns:
+        Zbiór id albo None, jeśli nie wiadomo (nieznane auta, przycięty
+        dziennik, since=None) - wtedy artefakt trzeba zbudować od nowa
+    """
+    return _changes_since(VERSION_FILENAME, since, until)
+
+
+def ratings_changes_since(since, until):
+    """Id aut, których oceny zmieniły się w wersjach ocen (since, until]; jak catalogue_changes_since."""
+    return _changes_since(RATINGS_VERSION_FILENAME, since, until)
+
+
+def bump_catalogue_version(car_ids=None):
+    """
+    Podbija wersję katalogu i wysyła sygnał catalogue_changed.
+
+    Wewnątrz batch_update() podbicie jest odkładane do końca bloku.
+    """
+    if getattr(_state, "batch_depth", 0):
+        _state.pending = True
+        if car_ids is None:
+            _state.car_ids = None
+        elif _state.car_ids is not None:
+            _state.car_ids.update(car_ids)
+        return None
+
+    version = _write_next_version(VERSION_FILENAME, car_ids)
+
+    catalogue_changed.send(
+        sender=None,
+        version=version,
+        car_ids=list(car_ids) if car_ids is not None else None,
+    )
+    return version
+
+
+def invalidate_catalogue_artifacts():
+    """
+    Podbija wersję katalogu bez sygnału catalogue_changed.
+
+    Artefakty kluczowane wersją (snapshot, magazyn wektorów, facety, tabela
+    sąsiadów, rankingi) są przebudowywane przy następnym odczycie.
+    """
+    return _write_next_version(VERSION_FILENAME)
+
+
+def sync_schema_version():
+    """
+    Unieważnia artefakty katalogu, jeśli od ich zapisu zmienił się zbiór
+    zastosowanych migracji aplikacji cars.
+
+    Migracje danych (bulk_update) nie wysyłają sygnałów i nie mogą zależeć
+    od kodu aplikacji, więc artefakty zbudowane przed nimi unieważnia
+    rozgrzewka po wdrożeniu (warmup), a nie sama migracja.
+
+    Returns:
+        True, jeśli artefakty zostały unieważnione
+    """
+    from django.db import connection
+    from django.db.migrations.recorder import MigrationRecorder
+
+    applied = sorted(name for app, name in MigrationRecorder(connection).applied_migrations() if app == "cars")
+    marker = "\n".join(applied)
+    path = artifacts_dir() / SCHEMA_FILENAME
+    try:
+        previous = path.read_text()
+    except OSError:
+        previous = None
+    if previous == marker:
+        return False
+    # Brak pliku (artefakty sprzed tego mechanizmu) też oznacza nieznany schemat
+    invalidate_catalogue_artifacts()
+    atomic_write_bytes(path, marker.encode())
+    return True
+
+
+def bump_ratings_version(car_ids=None):
+    """
+    Podbija wersję ocen i wysyła sygnał ratings_changed.
+
+    car_ids to auta, których oceny się zmieniły (None = nie wiadomo, np.
+    masowy zapis). Wewnątrz batch_update() podbicie jest odkładane do końca
+    bloku, a auta sumowane.
+    """
+    if getattr(_state, "batch_depth", 0):
+        _state.ratings_pending = True
+        if car_ids is None:
+            _state.rated_car_ids = None
+        elif _state.rated_car_ids is not None:
+            _state.rated_car_ids.update(car_ids)
+        return None
+
+    version = _write_next_version(RATINGS_VERSION_FILENAME, car_ids)
+    ratings_changed.send(
+        sender=None,
+        version=version,
+        car_ids=list(car_ids) if car_ids is not None else None,
+    )
+    return version
+
+
+def _bump_on_commit(name, bump, car_ids):
+    """
+    Wywołuje bump(car_ids) po zatwierdzeniu bieżącej transakcji (poza
+    transakcją od razu). Zapisy jednej transakcji dają jedno podbicie z
+    sumą aut, a wycofana transakcja nie zmienia wersji ani dziennika.
+    """
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        return bump(car_ids)
+
+    # Zewnętrzny blok atomic aplikacji; bloki TestCase (klasa, test) udają
+    # transakcje, więc w testach liczy się blok najbliższy zapisowi
+    blocks = [block for block in connection.atomic_blocks if not getattr(block, "_from_testcase", False)]
+    scope = blocks[0] if blocks else connection.atomic_blocks[-1]
+
+    pending = getattr(_state, name, None)
+    # Po wycofaniu transakcji jej flush wypada z kolejki on_commit - zaczynamy od nowa
+    if (
+        pending is None
+        or pending["scope"] is not scope
+        or not any(entry[1] is pending["flush"] for entry in connection.run_on_commit)
+    ):
+        def flush():
+            if getattr(_state, name, None) is pending:
+                setattr(_state, name, None)
+            bump(pending["car_ids"])
+
+        pending = {"car_ids": set(), "flush": flush, "scope": scope}
+        setattr(_state, name, pending)
+        transaction.on_commit(flush)
+
+    if car_ids is None:
+        pending["car_ids"] = None
+    elif pending["car_ids"] is not None:
+        pending["car_ids"].update(car_ids)
+    return None
+
+
+def bump_catalogue_version_on_commit(car_ids=None):
+    """bump_catalogue_version po zatwierdzeniu transakcji (dla odbiorców post_save/post_delete)."""
+    return _bump_on_commit("catalogue_commit", bump_catalogue_version, car_ids)
+
+
+def bump_ratings_version_on_commit(car_ids=None):
+    """bump_ratings_version po zatwierdzeniu transakcji."""
+    return _bump_on_commit("ratings_commit", bump_ratings_version, car_ids)
+
+
+@contextmanager
+def batch_update():
+    """
+    Grupuje wiele zapisów aut (np. import CSV) albo ocen (quiz) w jedno
+    podbicie wersji.
+
+    Przykład:
+        with batch_update():
+            for row in rows:
+                Car(...).save()
+    """
+    depth = getattr(_state, "batch_depth", 0)
+    if depth == 0:
+        _state.pending = False
+        _state.ratings_pending = False
+        _state.car_ids = set()
+        _state.rated_car_ids = set()
+    _state.batch_depth = depth + 1
+    try:
+        yield
+    finally:
+        _state.batch_depth -= 1
+        if _state.batch_depth == 0 and _state.pending:
+            car_ids = _state.car_ids
+            _state.pending = False
+            _state.car_ids = set()
+            bump_catalogue_version(car_ids)
+        if _state.batch_depth == 0 and _state.ratings_pending:
+            rated_car_ids = _state.rated_car_ids
+            _state.ratings_pending = False
+            _state.rated_car_ids = set()
+            bump_ratings_version(rated_car_ids)
+
+
+class VersionedArtifact:
+    """
+    Leniwie budowany obiekt w pamięci procesu, przebudowywany po zmianie
+    wersji katalogu.
+
+    Args:
+        build: funkcja bez argumentów zwracająca nową wartość artefaktu
+        name: nazwa w metrykach cache (trafienie = bez przebudowy)
+    """
+
+    def __init__(self, build, name=None):
+        self._build = build
+        self._name = name
+        self._lock = threading.Lock()
+        self._version = None
+        self._value = None
+
+    def get(self):
+        version = get_catalogue_version()
+        hit = self._version == version
+        if not hit:
+            with self._lock:
+                if self._version != version:
+                    self._value = self._build()
+                    self._version = version
+        if self._name:
+            record_cache(self._name, hit)
+        return self._value
+
+    def invalidate(self):
+        with self._lock:
+            self._version = None
+            self._value = None
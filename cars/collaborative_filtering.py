@@ -1,7 +1,16 @@
+import io
+import threading
 import numpy as np
 from collections import defaultdict
+from .catalogue import artifacts_dir, atomic_write_bytes, get_ratings_version
+from .metrics import record_cache, timed
+from .profiling import StageTimer
 from .models import UserCarRating, Car
 
+RATINGS_FILENAME = "ratings.npz"
+
+_ratings_memo = {"key": None, "matrix": None}
+
 def calculate_user_similarity(user1_ratings, user2_ratings):
     """
     Oblicza podobieństwo między dwoma użytkownikami używając korelacji Pearsona.
@@ -43,6 +52,7 @@ def get_user_ratings_dict(user):
     return {r.car_id: r.rating for r in ratings}
 
 
+@timed("cf")
 def recommend_cars_collaborative(user, top_n=5):
     """
     Rekomenduje auta używając collaborative filtering.
@@ -58,35 +68,42 @@ def recommend_cars_collaborative(user, top_n=5):
         top_n: liczba rekomendacji do zwrócenia
     
     Returns:
-        list: [(car, predicted_rating), ...]
+        list: [(CarRecord, predicted_rating), ...] - rekordy ze snapshotu
+        katalogu, także gdy wynik pochodzi z fallbacku get_top_rated_cars
     """
+    from .records import get_catalogue_snapshot
+
+    timer = StageTimer("cf")
+
     # 1. Pobierz oceny obecnego użytkownika
     current_user_ratings = get_user_ratings_dict(user)
     
     if not current_user_ratings:
         raise ValueError("Użytkownik nie ocenił jeszcze żadnych aut!")
     
-    # 2. Znajdź wszystkich innych użytkowników
-    all_users = UserCarRating.objects.values_list('user', flat=True).distinct()
-    other_users = [u for u in all_users if u != user.id]
+    # 2. Pobierz oceny wszystkich innych użytkowników jednym zapytaniem
+    ratings_by_user = get_all_ratings_by_user(exclude_user_id=user.id)
+    other_users = list(ratings_by_user)
+    timer.mark("fetch")
     
     if not other_users:
         # Jeśli brak innych użytkowników, zwróć najwyżej ocenione auta z bazy
-        return get_top_rated_cars(user, top_n)
+        return get_top_rated_cars(user, top_n, exclude_ids=current_user_ratings)
     
     # 3. Oblicz podobieństwo do każdego użytkownika
     user_similarities = []
     
     for other_user_id in other_users:
-        other_user_ratings = get_user_ratings_dict_by_id(other_user_id)
+        other_user_ratings = ratings_by_user[other_user_id]
         similarity = calculate_user_similarity(current_user_ratings, other_user_ratings)
         
         if similarity > 0:  # Tylko pozytywnie skorelowani użytkownicy
             user_similarities.append((other_user_id, similarity))
+    timer.mark("similarity")
     
     if not user_similarities:
         # Jeśli brak podobnych użytkowników
-        return get_top_rated_cars(user, top_n)
+        return get_top_rated_cars(user, top_n, exclude_ids=current_user_ratings)
     
     # Sortuj według podobieństwa (malejąco)
     user_similarities.sort(key=lambda x: x[1], reverse=True)
@@ -96,7 +113,7 @@ def recommend_cars_collaborative(user, top_n=5):
     
     # Weź top 10 najbardziej podobnych użytkowników
     for similar_user_id, similarity in user_similarities[:10]:
-        similar_user_ratings = get_user_ratings_dict_by_id(similar_user_id)
+        similar_user_ratings = ratings_by_user[similar_user_id]
         
         for car_id, rating in similar_user_ratings.items():
             if car_id not in current_user_ratings:  # Auto jeszcze nieocenione
@@ -111,43 +128,181 @@ def recommend_cars_collaborative(user, top_n=5):
     
     # Sortuj według przewidywanej oceny
     car_scores.sort(key=lambda x: x[1], reverse=True)
-    
-    # 6. Pobierz obiekty Car dla top N
-    recommendations = []
-    for car_id, score in car_scores[:top_n]:
-        try:
-            car = Car.objects.get(id=car_id)
-            recommendations.append((car, round(score, 2)))
-        except Car.DoesNotExist:
-            continue
+    timer.mark("score")
+    
+    # 6. Rekordy aut dla top N ze snapshotu, jak w fallbacku (kolejność wg wyniku)
+    top_scores = car_scores[:top_n]
+    cars_by_id = get_catalogue_snapshot().in_bulk([car_id for car_id, _ in top_scores])
+    recommendations = [
+        (cars_by_id[car_id], round(score, 2))
+        for car_id, score in top_scores
+        if car_id in cars_by_id
+    ]
+    timer.mark("hydrate")
     
     return recommendations
 
 
+def get_all_ratings_by_user(exclude_user_id=None):
+    """
+    Zwraca {user_id: {car_id: rating}} dla wszystkich użytkowników.
+
+    Korzysta z macierzy ocen zbudowanej w tle (run_worker), jeśli jest
+    aktualna, a w przeciwnym razie pobiera oceny jednym zapytaniem.
+    """
+    matrix = get_ratings_matrix()
+    record_cache("ratings_matrix", matrix is not None)
+    if matrix is not None:
+        return matrix.by_user(exclude_user_id)
+
+    ratings = UserCarRating.objects.all()
+    if exclude_user_id is not None:
+        ratings = ratings.exclude(user_id=exclude_user_id)
+
+    ratings_by_user = defaultdict(dict)
+    for user_id, car_id, rating in ratings.values_list('user_id', 'car_id', 'rating'):
+        ratings_by_user[user_id][car_id] = rating
+    return dict(ratings_by_user)
+
+
+class RatingsMatrix:
+    """
+    Wszystkie oceny jako trzy równoległe tablice (user_id, car_id, rating)
+    w tej samej kolejności co zapytanie w get_all_ratings_by_user.
+    """
+
+    def __init__(self, version, user_ids, car_ids, ratings):
+        self.version = version
+        self.user_ids = user_ids
+        self.car_ids = car_ids
+        self.ratings = ratings
+        self._grouped = None
+        self._grouped_lock = threading.Lock()
+
+    @classmethod
+    def from_database(cls, version):
+        rows = list(UserCarRating.objects.values_list('user_id', 'car_id', 'rating'))
+        columns = list(zip(*rows)) if rows else [(), (), ()]
+        return cls(
+            version,
+            np.array(columns[0], dtype=np.int64),
+            np.array(columns[1], dtype=np.int64),
+            np.array(columns[2], dtype=np.int16),
+        )
+
+    def _group_by_user(self):
+        """
+        {user_id: {car_id: rating}} liczone raz na macierz (wersję ocen).
+
+        Oceny są sortowane po użytkowniku (np.unique wyznacza granice
+        wycinków), a użytkownicy zostają w kolejności pierwszej oceny -
+        tak jak przy zapytaniu w get_all_ratings_by_user.
+        """
+        with self._grouped_lock:
+            if self._grouped is None:
+                order = np.argsort(self.user_ids, kind="stable")
+                user_ids, starts = np.unique(self.user_ids[order], return_index=True)
+                bounds = np.append(starts, len(order))
+                car_ids = self.car_ids[order].tolist()
+                ratings = self.ratings[order].tolist()
+                grouped = {}
+                for i in np.argsort(order[starts], kind="stable").tolist():
+                    start, end = int(bounds[i]), int(bounds[i + 1])
+                    grouped[int(user_ids[i])] = dict(zip(car_ids[start:end], ratings[start:end]))
+                self._grouped = grouped
+            return self._grouped
+
+    def by_user(self, exclude_user_id=None):
+        """
+        {user_id: {car_id: rating}} bez exclude_user_id.
+
+        Wewnętrzne dicty są wspólne dla wszystkich wywołań - tylko do odczytu.
+        """
+        grouped = self._group_by_user()
+        if exclude_user_id not in grouped:
+            return dict(grouped)
+        return {user_id: ratings for user_id, ratings in grouped.items() if user_id != exclude_user_id}
+
+    def to_bytes(self):
+        buffer = io.BytesIO()
+        np.savez(
+            buffer,
+            version=np.array(self.version),
+            user_ids=self.user_ids,
+            car_ids=self.car_ids,
+            ratings=self.ratings,
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_file(cls, path):
+        with np.load(path) as data:
+            return cls(int(data["version"]), data["user_ids"], data["car_ids"], data["ratings"])
+
+
+def build_ratings_matrix():
+    # Wersja przed odczytem: ocena dodana w trakcie budowy unieważni wynik
+    return RatingsMatrix.from_database(get_ratings_version())
+
+
+def save_ratings_matrix(matrix):
+    path = artifacts_dir() / RATINGS_FILENAME
+    atomic_write_bytes(path, matrix.to_bytes())
+    return path
+
+
+def get_ratings_matrix():
+    """Macierz ocen, jeśli istnieje i pasuje do bieżącej wersji ocen, w przeciwnym razie None."""
+    path = artifacts_dir() / RATINGS_FILENAME
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+
+    key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    if _ratings_memo["key"] != key:
+        try:
+            _ratings_memo["matrix"] = RatingsMatrix.from_file(path)
+        except (OSError, ValueError, KeyError):
+            _ratings_memo["matrix"] = None
+        _ratings_memo["key"] = key
+
+    matrix = _ratings_memo["matrix"]
+    if matrix is None or matrix.version != get_ratings_version():
+        return None
+    return matrix
+
+
 def get_user_ratings_dict_by_id(user_id):
     """Pomocnicza funkcja - zwraca dict ocen dla user_id"""
     ratings = UserCarRating.objects.filter(user_id=user_id)
     return {r.car_id: r.rating for r in ratings}
 
 
-def get_top_rated_cars(user, top_n=5):
+def get_top_rated_cars(user, top_n=5, exclude_ids=None, segment=None):
     """
     Fallback: zwraca najlepiej ocenione auta globalnie (jeśli brak danych CF)
+
+    Wycinek gotowego rankingu (średnia bayesowska, leaderboards.py) bez
+    aut już ocenionych przez użytkownika - bez złączenia i sortowania ocen.
+
+    Args:
+        user: obiekt User
+        top_n: liczba aut
+        exclude_ids: id aut ocenionych przez użytkownika, jeśli są już znane
+        segment: opcjonalny segment rankingu, np. ("fuel_type", "Petrol")
+
+    Returns:
+        list: [(CarRecord, średnia bayesowska), ...]
     """
-    # Pobierz auta już ocenione przez użytkownika
-    rated_car_ids = UserCarRating.objects.filter(user=user).values_list('car_id', flat=True)
-    
-    # Znajdź średnie oceny dla każdego auta
-    from django.db.models import Avg
-    top_cars = (
-        Car.objects
-        .exclude(id__in=rated_car_ids)
-        .annotate(avg_rating=Avg('usercarrating__rating'))
-        .filter(avg_rating__isnull=False)
-        .order_by('-avg_rating')[:top_n]
-    )
-    
-    return [(car, car.avg_rating) for car in top_cars]
+    from .leaderboards import get_leaderboards
+    from .records import get_catalogue_snapshot
+
+    if exclude_ids is None:
+        exclude_ids = UserCarRating.objects.filter(user=user).values_list('car_id', flat=True)
+    top = get_leaderboards().top(top_n, exclude=exclude_ids, segment=segment)
+    cars_by_id = get_catalogue_snapshot().in_bulk([car_id for car_id, _ in top])
+    return [(cars_by_id[car_id], round(score, 2)) for car_id, score in top if car_id in cars_by_id]
 
 
 def get_random_cars_for_quiz(n=10):
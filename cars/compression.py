@@ -0,0 +1,59 @@
+import re
+
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # brotli jest opcjonalny - bez niego zostaje gzip
+    brotli = None
+
+# Typy, które warto kompresować; obrazy i pliki już skompresowane tylko by urosły
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "application/xml", "image/svg+xml")
+# Jakość 5 to kompromis dla odpowiedzi generowanych per żądanie (11 tylko przy budowaniu statyków)
+BROTLI_QUALITY = 5
+# Krótsze odpowiedzi nie zyskują na kompresji (ten sam próg co GZipMiddleware)
+MIN_LENGTH = 200
+
+ACCEPTS_BR_RE = re.compile(r"\bbr\b")
+
+
+def is_compressible(response):
+    content_type = response.get("Content-Type", "")
+    return content_type.startswith(COMPRESSIBLE_TYPES) and not response.has_header("Content-Encoding")
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Kompresja HTML i JSON: brotli, jeśli klient go akceptuje i pakiet jest
+    zainstalowany, w przeciwnym razie gzip (GZipMiddleware Django).
+
+    Pliki statyczne WhiteNoise wysyła już skompresowane przy collectstatic
+    (Content-Encoding ustawiony), więc nie są kompresowane drugi raz.
+    Tokeny CSRF są maskowane osobno w każdej odpowiedzi, co chroni je
+    przed atakami typu BREACH.
+    """
+
+    def process_response(self, request, response):
+        if not is_compressible(response):
+            return response
+        accept_encoding = request.META.get("HTTP_ACCEPT_ENCODING", "")
+        if brotli is None or response.streaming or not ACCEPTS_BR_RE.search(accept_encoding):
+            return super().process_response(request, response)
+
+        if len(response.content) < MIN_LENGTH:
+            return response
+        patch_vary_headers(response, ("Accept-Encoding",))
+
+        compressed = brotli.compress(response.content, quality=BROTLI_QUALITY)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response.headers["Content-Length"] = str(len(compressed))
+
+        # Treść po kompresji nie jest identyczna bajt w bajt z oryginałem
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = "br"
+        return response
@@ -0,0 +1,16 @@
+from django.conf import settings
+
+from .catalogue import get_catalogue_version
+
+
+def catalogue(request):
+    """
+    Wersja katalogu i czas życia fragmentów dla {% cache %} w szablonach.
+
+    Wersja jest częścią klucza fragmentu, więc po zmianie katalogu
+    szablony renderują się od nowa bez ręcznego czyszczenia cache.
+    """
+    return {
+        "catalogue_version": get_catalogue_version(),
+        "fragment_cache_timeout": getattr(settings, "CARS_FRAGMENT_CACHE_TIMEOUT", 600),
+    }
@@ -0,0 +1,66 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+_lock = threading.Lock()
+_executor = None
+
+
+def compute_workers():
+    """
+    Liczba wątków na obliczenia rekomendacji (KNN, CF) w jednym procesie.
+
+    0 = liczenie w wątku obsługującym ORM dla widoków async (bez puli);
+    używane w testach, gdzie dane istnieją tylko w transakcji głównego wątku.
+    """
+    default = min(4, os.cpu_count() or 1)
+    return getattr(settings, "CARS_COMPUTE_WORKERS", default)
+
+
+def get_executor():
+    """Wspólna, ograniczona pula wątków (tworzona przy pierwszym użyciu)."""
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=max(compute_workers(), 1),
+                    thread_name_prefix="cars-compute",
+                )
+    return _executor
+
+
+def _with_connection_cleanup(func):
+    # Wątki puli nie przechodzą przez request_started/finished, więc same
+    # zamykają połączenia z bazą starsze niż CONN_MAX_AGE
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return run
+
+
+async def run_compute(func, *args, **kwargs):
+    """
+    Uruchamia obliczenie CPU (numpy/sklearn) poza pętlą zdarzeń.
+
+    Przy kilku wątkach w puli wolne rekomendacje nie blokują tanich
+    zapytań JSON (listy modeli i silników) obsługiwanych przez tego samego
+    workera ASGI, a rozmiar puli ogranicza liczbę równoległych obliczeń.
+
+    Przykład:
+        results = await run_compute(recommend_similar, company, model, constraints)
+    """
+    if compute_workers() == 0:
+        return await sync_to_async(func)(*args, **kwargs)
+    return await sync_to_async(
+        _with_connection_cleanup(func),
+        thread_sensitive=False,
+        executor=get_executor(),
+    )(*args, **kwargs)
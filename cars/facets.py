@@ -0,0 +1,229 @@
+import pickle
+from collections import defaultdict
+
+import numpy as np
+
+from .catalogue import artifacts_dir, atomic_write_bytes, catalogue_changes_since, get_catalogue_version
+from .models import Car
+
+FACET_FIELDS = ("horsepower", "total_speed", "cars_price", "seats")
+GROUP_FIELDS = ("company_name", "fuel_type")
+BIN_COUNT = 20
+
+# v2: rozkłady także dla par (marka, paliwo) - starszy plik budowany od nowa
+FACETS_FILENAME = "facets.v2.pickle"
+
+_memo = {"version": None, "stats": None}
+
+
+def _bin_edges(distribution, bins=BIN_COUNT):
+    """
+    Granice przedziałów histogramu z rozkładu cechy (Distribution).
+
+    Dla cech o małej liczbie wartości (np. miejsca) każda wartość dostaje
+    własny przedział, dla pozostałych granice to kwantyle, żeby ceny
+    o długim ogonie nie lądowały w jednym przedziale. Kwantyle są czytane
+    z sum skumulowanych, bez rozwijania wartości do listy aut.
+    """
+    values = distribution.values
+    if len(values) == 0:
+        return np.array([0.0, 1.0])
+    if len(values) <= bins:
+        return np.append(values, values[-1] + 1)
+    ranks = np.linspace(0, distribution.cumulative[-1] - 1, bins + 1)
+    return np.unique(values[np.searchsorted(distribution.cumulative[1:], ranks, side="right")])
+
+
+class Distribution:
+    """
+    Rozkład jednej cechy w jednej grupie: posortowane różne wartości
+    i skumulowana liczba aut (z zerem na początku).
+    """
+
+    __slots__ = ("values", "cumulative")
+
+    def __init__(self, values, counts):
+        self.values = values
+        self.cumulative = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+
+    @property
+    def counts(self):
+        return np.diff(self.cumulative)
+
+    def merge(self, values):
+        """Zwraca nowy rozkład z dołączonymi wartościami."""
+        merged, inverse = np.unique(np.concatenate((self.values, values)), return_inverse=True)
+        weights = np.concatenate((self.counts, np.ones(len(values), dtype=np.int64)))
+        return Distribution(merged, np.bincount(inverse, weights=weights).astype(np.int64))
+
+    def count_between(self, min_value=None, max_value=None):
+        start = 0 if min_value is None else np.searchsorted(self.values, min_value, side="left")
+        end = len(self.values) if max_value is None else np.searchsorted(self.values, max_value, side="right")
+        return max(int(self.cumulative[end] - self.cumulative[start]), 0)
+
+
+EMPTY_DISTRIBUTION = Distribution(np.array([], dtype=np.float64), np.array([], dtype=np.int64))
+
+
+class FacetStats:
+    """
+    Rozkłady cech liczbowych (moc, prędkość, cena, miejsca) dla całego
+    katalogu oraz osobno dla każdej marki, rodzaju paliwa i pary marka+paliwo.
+
+    Liczba aut w zakresie to różnica dwóch sum skumulowanych (bez zapytania
+    COUNT do bazy), a histogram to te same liczby zsumowane w przedziały.
+    """
+
+    def __init__(self):
+        self.edges = {field: _bin_edges(EMPTY_DISTRIBUTION) for field in FACET_FIELDS}
+        self.distributions = {}
+        self.max_id = 0
+
+    @classmethod
+    def build(cls, rows):
+        stats = cls()
+        stats.add(rows)
+        return stats
+
+    @classmethod
+    def from_database(cls):
+        return cls.build(_facet_rows(Car.objects.all()))
+
+    def add(self, rows):
+        """Dolicza auta (wiersze z _facet_rows) do rozkładów."""
+        rows = list(rows)
+        if not rows:
+            return
+        self.max_id = max(self.max_id, max(row[0] for row in rows))
+        columns = _numeric_columns(rows)
+        groups = _group_rows(rows)
+
+        for field in FACET_FIELDS:
+            values = columns[field]
+            for (group_field, label), indexes in groups.items():
+                selected = values[indexes]
+                selected = selected[~np.isnan(selected)]
+                if not len(selected):
+                    continue
+                key = (field, group_field, label)
+                self.distributions[key] = self.distributions.get(key, EMPTY_DISTRIBUTION).merge(selected)
+            # Granice z całego rozkładu po dołączeniu - nowe wartości spoza
+            # dotychczasowego zakresu nie lądują w skrajnych przedziałach
+            self.edges[field] = _bin_edges(self.distributions.get((field, None, None), EMPTY_DISTRIBUTION))
+
+    def _distribution(self, field, company_name=None, fuel_type=None):
+        if company_name and fuel_type:
+            key = (field, GROUP_FIELDS, (company_name, fuel_type))
+        elif company_name:
+            key = (field, "company_name", company_name)
+        elif fuel_type:
+            key = (field, "fuel_type", fuel_type)
+        else:
+            key = (field, None, None)
+        return self.distributions.get(key, EMPTY_DISTRIBUTION)
+
+    def histogram(self, field, company_name=None, fuel_type=None):
+        """Zwraca listę przedziałów {min, max, count}."""
+        edges = self.edges[field]
+        distribution = self._distribution(field, company_name, fuel_type)
+        indexes = np.clip(np.searchsorted(edges, distribution.values, side="right") - 1, 0, len(edges) - 2)
+        counts = np.bincount(indexes, weights=distribution.counts, minlength=len(edges) - 1)
+        return [
+            {"min": float(edges[i]), "max": float(edges[i + 1]), "count": int(counts[i])}
+            for i in range(len(edges) - 1)
+        ]
+
+    def count_between(self, field, min_value=None, max_value=None, company_name=None, fuel_type=None):
+        """
+        Liczba aut z wartością cechy w [min_value, max_value].
+
+        Zakres dotyczy tylko jednej cechy (field) - zakresy innych cech
+        nie są uwzględniane, stąd licznik jest przybliżeniem wyników
+        wyszukiwania.
+        """
+        return self._distribution(field, company_name, fuel_type).count_between(min_value, max_value)
+
+
+def _facet_rows(queryset):
+    return queryset.values_list("id", *GROUP_FIELDS, *FACET_FIELDS).iterator()
+
+
+def _group_rows(rows):
+    """
+    {(pole grupy, etykieta): indeksy wierszy}: (None, None) to cały
+    katalog, (GROUP_FIELDS, (marka, paliwo)) to para marka+paliwo.
+    """
+    groups = defaultdict(list)
+    for index, row in enumerate(rows):
+        groups[(None, None)].append(index)
+        labels = row[1:1 + len(GROUP_FIELDS)]
+        for group_field, label in zip(GROUP_FIELDS, labels):
+            if label:
+                groups[(group_field, label)].append(index)
+        if all(labels):
+            groups[(GROUP_FIELDS, tuple(labels))].append(index)
+    return {key: np.array(indexes, dtype=np.int64) for key, indexes in groups.items()}
+
+
+def _numeric_columns(rows):
+    offset = 1 + len(GROUP_FIELDS)
+    return {
+        field: np.array(
+            [np.nan if row[offset + i] is None else row[offset + i] for row in rows],
+            dtype=np.float64,
+        )
+        for i, field in enumerate(FACET_FIELDS)
+    }
+
+
+def _load(path):
+    try:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None, None
+
+
+def _save(path, version, stats):
+    atomic_write_bytes(path, pickle.dumps((version, stats), protocol=pickle.HIGHEST_PROTOCOL))
+    _memo["version"] = version
+    _memo["stats"] = stats
+
+
+def get_facet_stats():
+    """
+    Statystyki dla bieżącej wersji katalogu.
+
+    Kolejność: pamięć procesu -> plik w katalogu artefaktów (dociągnięty
+    do bieżącej wersji przez refresh_facets) -> przeliczenie z bazy.
+    """
+    version = get_catalogue_version()
+    if _memo["version"] == version:
+        return _memo["stats"]
+    return refresh_facets(version)
+
+
+def refresh_facets(version=None):
+    """
+    Doprowadza statystyki w pliku do wersji katalogu (zadanie 'facets').
+
+    Jeśli od zapisanej wersji doszły wyłącznie nowe auta (typowy import),
+    są one dopisywane do rozkładów; po zmianie lub usunięciu istniejących
+    aut statystyki są budowane od nowa.
+    """
+    if version is None:
+        version = get_catalogue_version()
+    path = artifacts_dir() / FACETS_FILENAME
+    stored_version, stats = _load(path)
+
+    if stats is None or stored_version != version:
+        car_ids = catalogue_changes_since(stored_version, version) if stats is not None else None
+        if car_ids is not None and (not car_ids or min(car_ids) > stats.max_id):
+            stats.add(_facet_rows(Car.objects.filter(id__in=car_ids)))
+        else:
+            stats = FacetStats.from_database()
+        _save(path, version, stats)
+    else:
+        _memo["version"] = version
+        _memo["stats"] = stats
+    return stats
@@ -1,7 +1,16 @@
+from functools import partial
+
 from django import forms
-from .models import Car
+from .models import Brand, Car
+from .utils import lookup_filter
 
 class CarFilterForm(forms.Form):
+    q = forms.CharField(
+        required=False,
+        label="Szukaj",
+        max_length=200,
+        widget=forms.TextInput(attrs={'list': 'suggest-list', 'autocomplete': 'off'})
+    )
     company_name = forms.ChoiceField(required=False)
     car_name = forms.ChoiceField(required=False, choices=[], label="Model")
     engine = forms.MultipleChoiceField(required=False, choices=[])
@@ -11,9 +20,32 @@ class CarFilterForm(forms.Form):
     max_speed = forms.IntegerField(required=False)
     min_price = forms.FloatField(required=False)
     max_price = forms.FloatField(required=False)
-    fuel_type = forms.ChoiceField(required=False, choices=[('', 'Wszystkie'), ('Petrol','Petrol'),('Diesel','Diesel'),('Electric','Electric'),('Hybrid','Hybrid'),('plug in hybrid','plug in hybrid')])
+    fuel_type = forms.ChoiceField(required=False, choices=[('', 'Wszystkie'), ('Petrol','Petrol'),('Diesel','Diesel'),('Electric','Electric'),('Hybrid','Hybrid'),('Plug-in Hybrid','Plug-in Hybrid')])
     seats = forms.IntegerField(required=False)
 
+def company_choices():
+    """Marki z katalogu jako wybory pola formularza."""
+    companies = (
+        Car.objects
+        .values_list("company_name", flat=True)
+        .distinct()
+        .order_by("company_name")
+    )
+    return [(c, c) for c in companies if c]
+
+
+def model_choices(company_name):
+    """Modele wybranej marki jako wybory pola formularza."""
+    models = (
+        Car.objects
+        .filter(lookup_filter("brand", Brand, name=company_name))
+        .values_list("car_name", flat=True)
+        .distinct()
+        .order_by("car_name")
+    )
+    return [(m, m) for m in models if m]
+
+
 class CarSelectForm(forms.Form):
     company_name = forms.ChoiceField(label="Marka")
     car_name = forms.ChoiceField(label="Model", required=False)
@@ -21,29 +53,15 @@ class CarSelectForm(forms.Form):
     def __init__(self, *args, company_name=None, **kwargs):
         super().__init__(*args, **kwargs)
 
+        # Wybory jako funkcje: lista powstaje dopiero przy renderowaniu albo
+        # walidacji, więc fragment szablonu z cache nie odpytuje bazy
+
         # MARKI
-        companies = (
-            Car.objects
-            .values_list("company_name", flat=True)
-            .distinct()
-            .order_by("company_name")
-        )
-        self.fields["company_name"].choices = [
-            (c, c) for c in companies if c
-        ]
+        self.fields["company_name"].choices = company_choices
 
         # MODELE (dopiero po wyborze marki)
         if company_name:
-            models = (
-                Car.objects
-                .filter(company_name=company_name)
-                .values_list("car_name", flat=True)
-                .distinct()
-                .order_by("car_name")
-            )
-            self.fields["car_name"].choices = [
-                (m, m) for m in models if m
-            ]
+            self.fields["car_name"].choices = partial(model_choices, company_name)
         else:
             self.fields["car_name"].choices = []
 
@@ -80,7 +98,7 @@ class CompanyConstraintsForm(forms.Form):
             ('Diesel', 'Diesel'),
             ('Electric', 'Elektryczny'),
             ('Hybrid', 'Hybrydowy'),
-            ('plug in hybrid', 'Plug-in Hybrid')
+            ('Plug-in Hybrid', 'Plug-in Hybrid')
         ]
     )
     max_seats = forms.IntegerField(
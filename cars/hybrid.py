@@ -0,0 +1,308 @@
+import threading
+
+import numpy as np
+
+from .catalogue import VersionedArtifact, get_ratings_version
+from .collaborative_filtering import RatingsMatrix, get_ratings_matrix
+from .leaderboards import PRIOR_WEIGHT, get_leaderboards
+from .metrics import record_cache, timed
+from .models import UserCarRating
+from .profiling import StageTimer
+from .records import get_catalogue_snapshot
+from .similar_cars import get_similar_cars_table
+from .vector_store import FEATURES, get_vector_store
+
+# Limity generowania kandydatów - koszt żądania nie zależy od wielkości
+# katalogu ani liczby ocen, tylko od tych stałych
+SEED_CARS = 10              # najwyżej ocenione auta użytkownika, od których szukamy sąsiadów
+NEIGHBOURS_PER_SEED = 10    # sąsiedzi KNN na auto bazowe
+RATERS_PER_CAR = 500        # oceniający jedno auto brani pod uwagę przy szukaniu podobnych użytkowników
+MAX_SIMILAR_USERS = 100     # podobni użytkownicy (najwięcej wspólnych ocen)
+RATINGS_PER_USER = 200      # oceny podobnego użytkownika brane jako kandydaci
+CF_CANDIDATES = 150
+POPULAR_CANDIDATES = 50
+MAX_CANDIDATES = 300
+
+# Udział źródeł w końcowej ocenie (brakujące źródło nie obniża wyniku)
+WEIGHTS = {"cf": 0.5, "content": 0.3, "popular": 0.2}
+
+
+class RatingsIndex:
+    """
+    Oceny z RatingsMatrix posortowane po aucie i po użytkowniku, żeby
+    oceny jednego auta / użytkownika były wycinkiem tablicy zamiast
+    przejścia po wszystkich ocenach.
+    """
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+        self.car_keys, self.car_starts, self.by_car = self._group(matrix.car_ids)
+        self.user_keys, self.user_starts, self.by_user = self._group(matrix.user_ids)
+
+        ratings = matrix.ratings.astype(np.float64)
+        counts = np.diff(self.car_starts)
+        sums = np.add.reduceat(ratings[self.by_car], self.car_starts[:-1]) if len(ratings) else np.zeros(0)
+        self.global_mean = float(ratings.mean()) if len(ratings) else 3.0
+        # Średnia bayesowska: auta z kilkoma ocenami nie wyprzedzają sprawdzonych
+        self.car_scores = (sums + PRIOR_WEIGHT * self.global_mean) / (counts + PRIOR_WEIGHT)
+
+    @staticmethod
+    def _group(keys):
+        order = np.argsort(keys, kind="stable")
+        unique, starts = np.unique(keys[order], return_index=True)
+        return unique, np.append(starts, len(keys)), order
+
+    @staticmethod
+    def _rows(keys, starts, order, key, limit):
+        i = np.searchsorted(keys, key)
+        if i == len(keys) or keys[i] != key:
+            return order[:0]
+        return order[starts[i]:min(starts[i + 1], starts[i] + limit)]
+
+    def car_rows(self, car_id, limit=RATERS_PER_CAR):
+        return self._rows(self.car_keys, self.car_starts, self.by_car, car_id, limit)
+
+    def user_rows(self, user_id, limit=RATINGS_PER_USER):
+        return self._rows(self.user_keys, self.user_starts, self.by_user, user_id, limit)
+
+    def car_score(self, car_ids):
+        """Średnia bayesowska ocen aut (średnia globalna dla aut bez ocen)."""
+        if not len(self.car_keys):
+            return np.full(len(car_ids), self.global_mean)
+        positions = np.minimum(np.searchsorted(self.car_keys, car_ids), len(self.car_keys) - 1)
+        return np.where(self.car_keys[positions] == car_ids, self.car_scores[positions], self.global_mean)
+
+
+_index_lock = threading.Lock()
+_index_memo = {"matrix": None, "index": None}
+_local_matrix = {"version": None, "matrix": None}
+
+
+def get_ratings_index():
+    """
+    Indeks ocen dla bieżącej wersji ocen.
+
+    Korzysta z macierzy zbudowanej przez run_worker; bez niej buduje
+    macierz w procesie (jedno zapytanie na wersję ocen).
+    """
+    matrix = get_ratings_matrix()
+    record_cache("ratings_matrix", matrix is not None)
+    if matrix is None:
+        version = get_ratings_version()
+        if _local_matrix["version"] != version:
+            _local_matrix["matrix"] = RatingsMatrix.from_database(version)
+            _local_matrix["version"] = version
+        matrix = _local_matrix["matrix"]
+
+    with _index_lock:
+        if _index_memo["matrix"] is not matrix:
+            _index_memo["index"] = RatingsIndex(matrix)
+            _index_memo["matrix"] = matrix
+        return _index_memo["index"]
+
+
+def _build_feature_scale():
+    store = get_vector_store()
+    positions = np.flatnonzero(store.complete)
+    if not len(positions):
+        return np.ones(len(FEATURES))
+    return np.sqrt(store.scaling(positions))
+
+
+# Odchylenia standardowe cech całego katalogu (skala odległości w ocenie treściowej)
+_feature_scale = VersionedArtifact(_build_feature_scale, name="feature_scale")
+
+
+def knn_candidates(seed_ids):
+    """Sąsiedzi aut bazowych: z tabeli build_similar_cars, a bez niej z magazynu wektorów."""
+    table = get_similar_cars_table()
+    store = None
+    candidates = []
+    for car_id in seed_ids:
+        neighbours = table.lookup(car_id, top_n=NEIGHBOURS_PER_SEED) if table is not None else None
+        if neighbours is None:
+            # Bez tabeli: pełne przejście magazynu wektorów na auto bazowe
+            if store is None:
+                store = get_vector_store()
+            seed = store.positions([car_id])
+            if seed is None or not len(seed):
+                continue
+            user_row = [column[seed[0]] for column in store.exact]
+            positions, _ = store.top_k(np.flatnonzero(store.complete), user_row, NEIGHBOURS_PER_SEED + 1)
+            neighbours = [(int(store.ids[position]), None) for position in positions if position != seed[0]]
+        candidates.extend(neighbour for neighbour, _ in neighbours)
+    return candidates
+
+
+def similar_users(index, user_id, user_ratings):
+    """
+    Użytkownicy z największą liczbą wspólnych ocen i ich korelacja Pearsona
+    z użytkownikiem (liczona na wspólnych autach, jak calculate_user_similarity).
+
+    Returns:
+        (id użytkowników, podobieństwa) - tylko podobieństwa dodatnie
+    """
+    matrix = index.matrix
+    rated = list(user_ratings)
+    rows_per_car = [index.car_rows(car_id) for car_id in rated]
+    rows = np.concatenate(rows_per_car)
+    rows = rows[matrix.user_ids[rows] != user_id]
+    if not len(rows):
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+
+    users, overlap = np.unique(matrix.user_ids[rows], return_counts=True)
+    keep = overlap >= 2
+    users, overlap = users[keep], overlap[keep]
+    users = users[np.lexsort((users, -overlap))][:MAX_SIMILAR_USERS]
+    users.sort()
+    if not len(users):
+        return users, np.zeros(0)
+
+    # Macierz wspólnych ocen: podobni użytkownicy x auta użytkownika (NaN = brak)
+    R = np.full((len(users), len(rated)), np.nan)
+    for column, car_rows in enumerate(rows_per_car):
+        raters = matrix.user_ids[car_rows]
+        slot = np.minimum(np.searchsorted(users, raters), len(users) - 1)
+        hit = users[slot] == raters
+        R[slot[hit], column] = matrix.ratings[car_rows][hit]
+
+    mine = np.array([user_ratings[car_id] for car_id in rated], dtype=np.float64)
+    mask = ~np.isnan(R)
+    common = mask.sum(axis=1)
+    mine_mean = (mask * mine).sum(axis=1) / common
+    theirs_mean = np.nansum(R, axis=1) / common
+    mine_centered = np.where(mask, mine - mine_mean[:, None], 0.0)
+    theirs_centered = np.where(mask, R - theirs_mean[:, None], 0.0)
+    numerator = (mine_centered * theirs_centered).sum(axis=1)
+    denominator = np.sqrt((mine_centered ** 2).sum(axis=1) * (theirs_centered ** 2).sum(axis=1))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        similarity = np.where(denominator > 0, numerator / denominator, 0.0)
+
+    positive = similarity > 0
+    return users[positive], similarity[positive]
+
+
+def cf_predictions(index, users, similarities, exclude):
+    """
+    Przewidywane odchylenie oceny od średniej dla aut ocenionych przez
+    podobnych użytkowników: sum(sim * (ocena - średnia_v)) / sum(sim).
+
+    Returns:
+        dict {car_id: (odchylenie, suma podobieństw)}
+    """
+    matrix = index.matrix
+    totals = {}
+    for user_id, similarity in zip(users.tolist(), similarities.tolist()):
+        rows = index.user_rows(user_id)
+        ratings = matrix.ratings[rows].astype(np.float64)
+        centered = ratings - ratings.mean()
+        for car_id, deviation in zip(matrix.car_ids[rows].tolist(), centered.tolist()):
+            if car_id in exclude:
+                continue
+            weighted, weight = totals.get(car_id, (0.0, 0.0))
+            totals[car_id] = (weighted + similarity * deviation, weight + similarity)
+    return {car_id: (weighted / weight, weight) for car_id, (weighted, weight) in totals.items()}
+
+
+def content_predictions(candidate_ids, user_ratings):
+    """
+    Ocena z podobieństwa cech do aut ocenionych przez użytkownika: średnia
+    użytkownika + ważone jądrem exp(-d^2 / 2) odchylenia jego ocen.
+    """
+    snapshot = get_catalogue_snapshot()
+    scale = _feature_scale.get()
+    rated_ids = np.array(list(user_ratings), dtype=np.int64)
+
+    def features(car_ids):
+        positions = snapshot.positions(car_ids)
+        X = np.column_stack([snapshot.numeric[field][np.maximum(positions, 0)] for field in FEATURES]) / scale
+        X[positions < 0] = np.nan
+        return X
+
+    candidates = features(candidate_ids)
+    rated = features(rated_ids)
+    known = ~np.isnan(rated).any(axis=1)
+    ratings = np.array([user_ratings[car_id] for car_id in rated_ids.tolist()], dtype=np.float64)
+    mean = ratings.mean()
+    if not known.any():
+        return np.full(len(candidate_ids), np.nan)
+
+    diff = candidates[:, None, :] - rated[None, known, :]
+    kernel = np.exp(-0.5 * np.sum(diff ** 2, axis=2))
+    weight = kernel.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        prediction = mean + kernel @ (ratings[known] - mean) / weight
+    # Auto daleko od wszystkich ocenionych nie ma sygnału treściowego
+    prediction[~(weight > 1e-6)] = np.nan
+    return prediction
+
+
+@timed("hybrid")
+def recommend_cars_hybrid(user, top_n=5):
+    """
+    Rekomendacje dla użytkownika z ocenami: generowanie kandydatów z kilku
+    źródeł i ocena tylko tych kandydatów.
+
+    Etapy:
+    1. Kandydaci: sąsiedzi KNN najwyżej ocenionych aut, auta ocenione
+       przez podobnych użytkowników (CF) i najpopularniejsze auta - łącznie
+       najwyżej MAX_CANDIDATES.
+    2. Ocena: przewidywania CF, treściowe i popularności liczone
+       wektorowo dla kandydatów i łączone wagami WEIGHTS.
+
+    Args:
+        user: obiekt User
+        top_n: liczba rekomendacji do zwrócenia
+
+    Returns:
+        list: [(CarRecord, przewidywana ocena 1-5), ...]
+    """
+    timer = StageTimer("hybrid")
+    user_ratings = dict(UserCarRating.objects.filter(user=user).values_list("car_id", "rating"))
+    if not user_ratings:
+        raise ValueError("Użytkownik nie ocenił jeszcze żadnych aut!")
+    index = get_ratings_index()
+    timer.mark("fetch")
+
+    mean = float(np.mean(list(user_ratings.values())))
+    seeds = sorted(
+        (car_id for car_id, rating in user_ratings.items() if rating >= mean),
+        key=lambda car_id: (-user_ratings[car_id], car_id),
+    )[:SEED_CARS]
+    users, similarities = similar_users(index, user.id, user_ratings)
+    cf = cf_predictions(index, users, similarities, exclude=user_ratings)
+    cf_ranked = sorted(cf, key=lambda car_id: (-cf[car_id][0] * cf[car_id][1], car_id))[:CF_CANDIDATES]
+
+    popular = [car_id for car_id, _ in get_leaderboards().top(POPULAR_CANDIDATES, exclude=user_ratings)]
+    candidates = [
+        car_id for car_id in dict.fromkeys(knn_candidates(seeds) + cf_ranked + popular)
+        if car_id not in user_ratings
+    ][:MAX_CANDIDATES]
+    timer.mark("candidates")
+    if not candidates:
+        return []
+
+    candidate_ids = np.array(candidates, dtype=np.int64)
+    predictions = {
+        "cf": np.array([mean + cf[car_id][0] if car_id in cf else np.nan for car_id in candidates]),
+        "content": content_predictions(candidate_ids, user_ratings),
+        "popular": index.car_score(candidate_ids),
+    }
+    weighted = np.zeros(len(candidates))
+    weights = np.zeros(len(candidates))
+    for source, values in predictions.items():
+        present = ~np.isnan(values)
+        weighted[present] += WEIGHTS[source] * values[present]
+        weights[present] += WEIGHTS[source]
+    scores = np.clip(weighted / weights, 1, 5)
+    order = np.lexsort((candidate_ids, -scores))[:top_n]
+    timer.mark("score")
+
+    cars_by_id = get_catalogue_snapshot().in_bulk(candidate_ids[order].tolist())
+    recommendations = [
+        (cars_by_id[car_id], round(float(scores[i]), 2))
+        for i, car_id in zip(order.tolist(), candidate_ids[order].tolist())
+        if car_id in cars_by_id
+    ]
+    timer.mark("hydrate")
+    return recommendations
@@ -0,0 +1,62 @@
+import re
+from pathlib import Path
+
+# Szerokości wersji pochodnych: pełny ekran desktopu i telefon (2x gęstość)
+DEFAULT_WIDTHS = (1920, 960)
+SOURCE_SUFFIXES = (".jpg", ".jpeg", ".png")
+# Pliki pochodne mają szerokość w nazwie: car-hero-960.webp
+DERIVATIVE_RE = re.compile(r"-\d+$")
+
+
+def derivative_path(source, width, suffix):
+    """
+    Przykład:
+        derivative_path(Path("cars/car-hero.jpg"), 960, ".webp") -> cars/car-hero-960.webp
+    """
+    return source.with_name(f"{source.stem}-{width}{suffix}")
+
+
+def find_sources(directory):
+    """Oryginalne obrazy w katalogu (bez wcześniej wygenerowanych wersji)."""
+    return sorted(
+        path for path in Path(directory).iterdir()
+        if path.suffix.lower() in SOURCE_SUFFIXES and not DERIVATIVE_RE.search(path.stem)
+    )
+
+
+def build_derivatives(source, widths=DEFAULT_WIDTHS, quality=80, force=False):
+    """
+    Zmniejszone wersje WebP i JPEG (progresywny) obok oryginału.
+
+    Obraz nie jest powiększany - szerokość większa od oryginału daje kopię
+    w oryginalnym rozmiarze. Pliki nowsze od źródła są pomijane, chyba że
+    force=True.
+
+    Args:
+        source: ścieżka do oryginału
+        widths: docelowe szerokości w pikselach
+        quality: jakość kompresji (1-100)
+        force: generuj ponownie aktualne pliki
+
+    Returns:
+        lista krotek (ścieżka, rozmiar w bajtach) zapisanych plików
+    """
+    from PIL import Image  # Pillow potrzebny tylko przy budowaniu statyków
+
+    written = []
+    source = Path(source)
+    mtime = source.stat().st_mtime
+    with Image.open(source) as original:
+        image = original.convert("RGB")
+    for width in widths:
+        targets = [derivative_path(source, width, suffix) for suffix in (".webp", ".jpg")]
+        if not force and all(path.exists() and path.stat().st_mtime >= mtime for path in targets):
+            continue
+        resized = image
+        if image.width > width:
+            resized = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+        webp, jpeg = targets
+        resized.save(webp, "WEBP", quality=quality, method=6)
+        resized.save(jpeg, "JPEG", quality=quality, optimize=True, progressive=True)
+        written.extend((path, path.stat().st_size) for path in targets)
+    return written
@@ -0,0 +1,168 @@
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 3
+RETRY_DELAY_SECONDS = 30
+KEEP_FINISHED_DAYS = 7
+
+
+def _build_catalogue_snapshot():
+    from .records import save_catalogue_snapshot
+    save_catalogue_snapshot()
+
+
+def _build_similar_cars():
+    from .similar_cars import build_similar_cars_table, save_similar_cars_table
+    save_similar_cars_table(build_similar_cars_table())
+
+
+def _build_facets():
+    from .facets import refresh_facets
+    refresh_facets()
+
+
+def _build_ratings_matrix():
+    from .collaborative_filtering import build_ratings_matrix, save_ratings_matrix
+    save_ratings_matrix(build_ratings_matrix())
+
+
+def _build_leaderboards():
+    from .leaderboards import refresh_leaderboards
+    refresh_leaderboards()
+
+
+# Nazwa zadania -> funkcja przebudowująca artefakt. Każdy artefakt jest
+# oznaczony wersją, z której powstał, i podmieniany przez rename, więc
+# przebudowa nigdy nie jest widoczna w połowie.
+JOBS = {
+    'catalogue_snapshot': _build_catalogue_snapshot,
+    'similar_cars': _build_similar_cars,
+    'facets': _build_facets,
+    'ratings_matrix': _build_ratings_matrix,
+    'leaderboards': _build_leaderboards,
+}
+
+CATALOGUE_JOBS = ('catalogue_snapshot', 'similar_cars', 'facets', 'leaderboards')
+RATINGS_JOBS = ('ratings_matrix', 'leaderboards')
+
+
+def debounce_seconds():
+    return getattr(settings, 'CARS_JOB_DEBOUNCE_SECONDS', 5)
+
+
+def max_delay_seconds():
+    return getattr(settings, 'CARS_JOB_MAX_DELAY_SECONDS', 60)
+
+
+def enqueue(name, delay=None):
+    """Planuje jedno zadanie z opóźnieniem (debounce); zob. enqueue_many."""
+    enqueue_many([name], delay=delay)
+
+
+def enqueue_many(names, delay=None):
+    """
+    Planuje zadania z opóźnieniem (debounce).
+
+    Jeśli zadanie już czeka, jego termin jest przesuwany zamiast dodawania
+    kolejnego - seria zmian (np. import) daje jedną przebudowę. Termin nie
+    przesuwa się dalej niż CARS_JOB_MAX_DELAY_SECONDS od pierwszego
+    zaplanowania (run_by), więc zmiany częstsze niż debounce nie odkładają
+    przebudowy w nieskończoność.
+
+    Przy czekających zadaniach to jeden UPDATE na wszystkie nazwy; brakujące
+    są dodawane jednym INSERT.
+    """
+    names = set(names)
+    unknown = names - set(JOBS)
+    if unknown:
+        raise ValueError(f"Nieznane zadanie: {', '.join(sorted(unknown))}")
+
+    now = timezone.now()
+    run_after = now + timedelta(seconds=debounce_seconds() if delay is None else delay)
+    pending = Job.objects.filter(name__in=names, status=Job.PENDING)
+    updated = pending.update(run_after=Case(
+        When(run_by__lt=run_after, then=F('run_by')),
+        default=Value(run_after),
+    ))
+    if updated >= len(names):
+        return
+
+    run_by = max(run_after, now + timedelta(seconds=max_delay_seconds()))
+    with transaction.atomic():
+        missing = names - set(pending.values_list('name', flat=True))
+        Job.objects.bulk_create(
+            Job(name=name, run_after=run_after, run_by=run_by) for name in sorted(missing)
+        )
+
+
+def claim_next():
+    """
+    Zajmuje najstarsze zadanie gotowe do wykonania.
+
+    Zajęcie to warunkowy UPDATE (status pending -> running), więc kilka
+    workerów nie wykona tego samego zadania.
+    """
+    now = timezone.now()
+    candidates = Job.objects.filter(status=Job.PENDING, run_after__lte=now).values_list('id', flat=True)
+    for job_id in candidates[:10]:
+        claimed = Job.objects.filter(id=job_id, status=Job.PENDING).update(
+            status=Job.RUNNING,
+            started_at=now,
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return Job.objects.get(id=job_id)
+    return None
+
+
+def run_job(job):
+    """Wykonuje zajęte zadanie; błąd planuje ponowienie (do MAX_ATTEMPTS prób)."""
+    try:
+        JOBS[job.name]()
+    except Exception:
+        job.last_error = traceback.format_exc()
+        job.finished_at = timezone.now()
+        if job.attempts < MAX_ATTEMPTS:
+            job.status = Job.PENDING
+            job.run_after = job.finished_at + timedelta(seconds=RETRY_DELAY_SECONDS * job.attempts)
+            job.run_by = job.run_after + timedelta(seconds=max_delay_seconds())
+        else:
+            job.status = Job.FAILED
+        logger.exception("Zadanie %s nie powiodło się (próba %s)", job.name, job.attempts)
+    else:
+        job.status = Job.DONE
+        job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'run_after', 'run_by', 'last_error', 'finished_at'])
+    return job
+
+
+def run_pending(limit=None):
+    """Wykonuje gotowe zadania; zwraca liczbę wykonanych."""
+    done = 0
+    while limit is None or done < limit:
+        job = claim_next()
+        if job is None:
+            break
+        run_job(job)
+        done += 1
+    return done
+
+
+def requeue_interrupted():
+    """Przywraca zadania przerwane przez zatrzymanie workera (status running)."""
+    return Job.objects.filter(status=Job.RUNNING).update(status=Job.PENDING, run_after=timezone.now())
+
+
+def prune_finished():
+    cutoff = timezone.now() - timedelta(days=KEEP_FINISHED_DAYS)
+    return Job.objects.filter(status__in=[Job.DONE, Job.FAILED], finished_at__lt=cutoff).delete()[0]
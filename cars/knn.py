@@ -1,6 +1,23 @@
 import numpy as np
-from sklearn.neighbors import NearestNeighbors
-from sklearn.preprocessing import StandardScaler
+
+from .profiling import StageTimer
+from .vector_store import FEATURES, get_vector_store
+
+# scikit-learn jest importowany w funkcjach, a nie przy starcie modułu:
+# sam import zajmuje ~0.5-1 s i kilkadziesiąt MB na każdy worker, a tanie
+# widoki (np. /get-models/) nigdy go nie używają.
+
+def _feature_rows(cars_queryset, features):
+    """
+    Krotki (id, *cechy) bez tworzenia instancji modelu.
+
+    Dla QuerySet to jedno zapytanie values_list, dla listy obiektów
+    (Car albo CarRecord) - odczyt atrybutów.
+    """
+    if hasattr(cars_queryset, "values_list"):
+        return cars_queryset.values_list("id", *features).iterator()
+    return ((car.id, *(getattr(car, feature) for feature in features)) for car in cars_queryset)
+
 
 def find_most_similar_car(cars_queryset, user_vector):
     features = []
@@ -12,40 +29,43 @@ def find_most_similar_car(cars_queryset, user_vector):
     if not active_features:
         raise ValueError("Brak cech liczbowych do obliczenia podobieństwa")
 
-    for car in cars_queryset:
-        row = []
-        for feature in active_features:
-            value = getattr(car, feature)
-            if value is None:
-                break
-            row.append(value)
-        else:
-            features.append(row)
-            car_ids.append(car.id)
+    from sklearn.neighbors import NearestNeighbors
+    from sklearn.preprocessing import StandardScaler
+
+    timer = StageTimer("knn_single")
+    for car_id, *values in _feature_rows(cars_queryset, active_features):
+        if None not in values:
+            features.append(values)
+            car_ids.append(car_id)
+    timer.mark("fetch")
     if not features:
         raise ValueError("Brak danych do porównania po filtracji")
     X = np.array(features)
+    timer.mark("matrix")
 
     scaler = StandardScaler()
     X_scaled = scaler.fit_transform(X)
 
     user_row = np.array([[user_vector[f] for f in active_features]])
     user_scaled = scaler.transform(user_row)
+    timer.mark("scale")
 
     knn = NearestNeighbors(n_neighbors=1, metric="euclidean")
     knn.fit(X_scaled)
 
     distance, index = knn.kneighbors(user_scaled)
+    timer.mark("distance")
 
     return car_ids[index[0][0]], distance[0][0]
 
-import numpy as np
-from sklearn.preprocessing import StandardScaler
-
 def find_top_similar_cars(cars_queryset, user_vector, top_n=5):
     """
     Znajduje top N najbardziej podobnych samochodów do user_vector
     używając algorytmu K-Nearest Neighbors.
+
+    Odległości są liczone na zwartym magazynie wektorów (vector_store)
+    blokami, a kandydaci przeliczani dokładnie w float64 - wynik jest taki
+    sam jak przy standaryzacji całego podzbioru StandardScalerem.
     
     Args:
         cars_queryset: QuerySet z samochodami do porównania
@@ -55,10 +75,39 @@ def find_top_similar_cars(cars_queryset, user_vector, top_n=5):
     Returns:
         Lista krotek (car_id, distance) posortowana od najbardziej podobnego
     """
-    
-    if cars_queryset.count() == 0:
+    timer = StageTimer("knn")
+    if hasattr(cars_queryset, "values_list"):
+        car_ids = list(cars_queryset.values_list("id", flat=True))
+    else:
+        car_ids = [car.id for car in cars_queryset]
+    if not car_ids:
         raise ValueError("Brak samochodów do porównania!")
-    
+
+    store = get_vector_store()
+    # Auta spoza snapshotu (np. niezapisane obiekty) liczone są na pełnych danych
+    positions = store.positions(car_ids) if None not in car_ids else None
+    if positions is None:
+        return _find_top_similar_cars_exact(cars_queryset, user_vector, top_n, timer)
+    timer.mark("fetch")
+    if not len(positions):
+        raise ValueError("Brak samochodów z kompletnymi danymi!")
+
+    user_row = []
+    for feature in FEATURES:
+        val = user_vector.get(feature)
+        if val is None:
+            raise ValueError(f"Brak wartości {feature} w wektorze użytkownika!")
+        user_row.append(float(val))
+    timer.mark("matrix")
+
+    positions, distances = store.top_k(positions, user_row, top_n, timer=timer)
+    return [(int(store.ids[position]), float(distance)) for position, distance in zip(positions, distances)]
+
+
+def _find_top_similar_cars_exact(cars_queryset, user_vector, top_n, timer):
+    """find_top_similar_cars na pełnej macierzy float64 (StandardScaler)."""
+    from sklearn.preprocessing import StandardScaler
+
     # Przygotuj dane
     features = ['horsepower', 'total_speed', 'cars_price', 'seats']
     
@@ -66,12 +115,11 @@ def find_top_similar_cars(cars_queryset, user_vector, top_n=5):
     car_data = []
     car_ids = []
     
-    for car in cars_queryset:
+    for car_id, *values in _feature_rows(cars_queryset, features):
         row = []
         valid = True
         
-        for feature in features:
-            val = getattr(car, feature)
+        for val in values:
             try:
                 val = float(val) if val is not None else None
                 if val is None:
@@ -84,7 +132,8 @@ def find_top_similar_cars(cars_queryset, user_vector, top_n=5):
         
         if valid:
             car_data.append(row)
-            car_ids.append(car.id)
+            car_ids.append(car_id)
+    timer.mark("fetch")
     
     if len(car_data) == 0:
         raise ValueError("Brak samochodów z kompletnymi danymi!")
@@ -100,16 +149,20 @@ def find_top_similar_cars(cars_queryset, user_vector, top_n=5):
     # Normalizacja danych
     X = np.array(car_data)
     user_array = np.array([user_row])
+    timer.mark("matrix")
     
     scaler = StandardScaler()
     X_scaled = scaler.fit_transform(X)
     user_scaled = scaler.transform(user_array)
+    timer.mark("scale")
     
     # Oblicz odległości euklidesowe
     distances = np.sqrt(np.sum((X_scaled - user_scaled) ** 2, axis=1))
+    timer.mark("distance")
     
     # Znajdź top N indeksów
     top_indices = np.argsort(distances)[:top_n]
+    timer.mark("topk")
     
     # Zwróć listę (car_id, distance)
     results = [
@@ -119,3 +172,117 @@ def find_top_similar_cars(cars_queryset, user_vector, top_n=5):
     
     return results
 
+
+
+def _feature_matrix(cars_queryset, features):
+    """Macierz cech i lista id dla aut z kompletem wartości."""
+    car_data = []
+    car_ids = []
+    for car_id, *values in _feature_rows(cars_queryset, features):
+        row = []
+        for val in values:
+            try:
+                row.append(float(val))
+            except (ValueError, TypeError):
+                break
+        else:
+            car_data.append(row)
+            car_ids.append(car_id)
+    return np.array(car_data, dtype=np.float64).reshape(-1, len(features)), car_ids
+
+
+def find_top_similar_cars_batch(cars_queryset, user_vectors, top_n=5, exclude_ids=None, block_size=256):
+    """
+    Wersja find_top_similar_cars dla wielu wektorów naraz.
+
+    Katalog jest pobierany raz, a odległości liczone blokami wektorów
+    (macierz block_size x liczba aut), więc pamięć nie rośnie z liczbą
+    zapytań. Standaryzacja dla każdego wektora pomija jego auto z
+    exclude_ids, więc wyniki są takie jak z find_top_similar_cars.
+
+    Args:
+        cars_queryset: QuerySet z samochodami do porównania
+        user_vectors: lista dictów z kluczami: horsepower, total_speed, cars_price, seats
+        top_n: liczba wyników na wektor
+        exclude_ids: lista id auta pomijanego dla danego wektora (np. auto bazowe) albo None
+        block_size: liczba wektorów liczonych jednocześnie
+
+    Returns:
+        Lista list krotek (car_id, distance), w kolejności user_vectors
+    """
+    features = ['horsepower', 'total_speed', 'cars_price', 'seats']
+
+    timer = StageTimer("knn_batch")
+    X, car_ids = _feature_matrix(cars_queryset, features)
+    timer.mark("fetch")
+    if len(car_ids) == 0:
+        raise ValueError("Brak samochodów z kompletnymi danymi!")
+
+    user_rows = []
+    for user_vector in user_vectors:
+        row = []
+        for feature in features:
+            val = user_vector.get(feature)
+            if val is None:
+                raise ValueError(f"Brak wartości {feature} w wektorze użytkownika!")
+            row.append(float(val))
+        user_rows.append(row)
+    if not user_rows:
+        return []
+
+    # Centrowanie nie zmienia różnic, a zmniejsza błędy zaokrągleń (ceny ~1e6)
+    center = X.mean(axis=0)
+    X = X - center
+    users = np.array(user_rows) - center
+    X_sq = X ** 2
+    total = X.sum(axis=0)
+    total_sq = X_sq.sum(axis=0)
+
+    index_of = {car_id: idx for idx, car_id in enumerate(car_ids)}
+    n = len(car_ids)
+    k = min(top_n, n)
+
+    results = []
+    for start in range(0, len(user_rows), block_size):
+        block = users[start:start + block_size]
+        block_excluded = (exclude_ids or [None] * len(user_rows))[start:start + block_size]
+
+        # Statystyki StandardScaler liczone bez auta wykluczonego dla danego
+        # wektora - tak samo jak w find_top_similar_cars na queryset bez auta bazowego
+        counts = np.full((len(block), 1), float(n))
+        sums = np.tile(total, (len(block), 1))
+        sums_sq = np.tile(total_sq, (len(block), 1))
+        for offset, excluded in enumerate(block_excluded):
+            idx = index_of.get(excluded)
+            if idx is not None and n > 1:
+                counts[offset] -= 1
+                sums[offset] -= X[idx]
+                sums_sq[offset] -= X_sq[idx]
+        means = sums / counts
+        variances = sums_sq / counts - means ** 2
+        variances[variances <= 1e-12 * np.maximum(total_sq / n, 1.0)] = 1.0  # stała cecha: skala 1
+        weights = 1.0 / variances
+
+        # sum_j w_j (x_j - u_j)^2 = sum_j w_j x_j^2 - 2 sum_j w_j u_j x_j + sum_j w_j u_j^2
+        squared = (
+            weights @ X_sq.T
+            - 2 * (weights * block) @ X.T
+            + np.sum(weights * block ** 2, axis=1)[:, None]
+        )
+        np.maximum(squared, 0, out=squared)
+
+        for offset, excluded in enumerate(block_excluded):
+            if excluded in index_of:
+                squared[offset, index_of[excluded]] = np.inf
+
+        candidates = np.argpartition(squared, k - 1, axis=1)[:, :k]
+        for offset, row_candidates in enumerate(candidates):
+            order = row_candidates[np.argsort(squared[offset, row_candidates])]
+            results.append([
+                (car_ids[idx], float(np.sqrt(squared[offset, idx])))
+                for idx in order
+                if np.isfinite(squared[offset, idx])
+            ])
+    timer.mark("distance")
+
+    return results
@@ -0,0 +1,242 @@
+import pickle
+import threading
+
+import numpy as np
+from django.db.models import Count, Sum
+
+from .catalogue import (
+    artifacts_dir, atomic_write_bytes, catalogue_changes_since, get_catalogue_version, get_ratings_version,
+    ratings_changes_since,
+)
+from .models import UserCarRating
+from .records import get_catalogue_snapshot
+
+SEGMENT_FIELDS = ("price_tier", "fuel_type", "company_name")
+# Progi cen jak w quizie (get_random_cars_for_quiz)
+PRICE_TIERS = ((100000, "budget"), (200000, "mid"), (None, "premium"))
+# Waga średniej globalnej w średniej bayesowskiej: auto z jedną piątką nie
+# wyprzedza auta z setką ocen 4.8
+PRIOR_WEIGHT = 5
+# Długość każdej listy - wystarcza na TOP N po odjęciu aut już ocenionych
+LEADERBOARD_SIZE = 200
+
+LEADERBOARDS_FILENAME = "leaderboards.pickle"
+
+_memo = {"key": None, "boards": None}
+_lock = threading.Lock()
+
+
+def price_tier(price):
+    if price is None or np.isnan(price):
+        return None
+    for limit, name in PRICE_TIERS:
+        if limit is None or price < limit:
+            return name
+
+
+def _rating_totals(car_ids=None):
+    """{car_id: (liczba ocen, suma ocen)} jednym zapytaniem GROUP BY."""
+    ratings = UserCarRating.objects.all()
+    if car_ids is not None:
+        ratings = ratings.filter(car_id__in=car_ids)
+    return {
+        row["car_id"]: (row["count"], row["total"])
+        for row in ratings.order_by().values("car_id").annotate(count=Count("id"), total=Sum("rating"))
+    }
+
+
+class Leaderboards:
+    """
+    Rankingi aut wg średniej bayesowskiej ocen: ogólny i osobno dla każdego
+    segmentu (próg cenowy, paliwo, marka).
+
+    Trzyma liczbę i sumę ocen każdego ocenionego auta, więc nowa ocena
+    wymaga tylko ponownego zsumowania ocen zmienionych aut; rankingi są
+    przeliczane wektorowo bez zapytań.
+    """
+
+    def __init__(self, totals, segments):
+        # totals: {car_id: (count, sum)}, segments: {car_id: (price_tier, fuel_type, company_name)}
+        self.totals = totals
+        self.segments = segments
+        self.rankings = {}
+        self._rank()
+
+    @classmethod
+    def from_database(cls):
+        totals = _rating_totals()
+        return cls(totals, _segments(totals))
+
+    def update(self, totals, car_ids):
+        """Podmienia sumy ocen podanych aut (brak w totals = auto bez ocen) i przelicza rankingi."""
+        for car_id in car_ids:
+            if car_id in totals:
+                self.totals[car_id] = totals[car_id]
+            else:
+                self.totals.pop(car_id, None)
+        missing = [car_id for car_id in totals if car_id not in self.segments]
+        self.segments.update(_segments(missing))
+        self._rank()
+
+    def update_segments(self, car_ids=None):
+        """
+        Segmenty podanych aut (None = wszystkich ocenionych) od nowa ze
+        snapshotu katalogu; auta usunięte z katalogu wypadają z rankingów.
+        """
+        if car_ids is None:
+            car_ids = list(self.totals)
+        segments = _segments(car_ids)
+        for car_id in car_ids:
+            if car_id in segments:
+                self.segments[car_id] = segments[car_id]
+            else:
+                self.segments.pop(car_id, None)
+                self.totals.pop(car_id, None)
+        self._rank()
+
+    def _rank(self):
+        car_ids = np.fromiter(self.totals, dtype=np.int64, count=len(self.totals))
+        stats = np.array(list(self.totals.values()), dtype=np.float64).reshape(-1, 2)
+        counts, sums = stats[:, 0], stats[:, 1]
+        self.global_mean = float(sums.sum() / counts.sum()) if len(car_ids) else 0.0
+        scores = (sums + PRIOR_WEIGHT * self.global_mean) / (counts + PRIOR_WEIGHT)
+
+        order = np.lexsort((car_ids, -scores))
+        car_ids, scores = car_ids[order], scores[order]
+        rankings = {None: (car_ids[:LEADERBOARD_SIZE], scores[:LEADERBOARD_SIZE])}
+
+        for offset, field in enumerate(SEGMENT_FIELDS):
+            labels = np.array([self.segments.get(car_id, (None,) * 3)[offset] or "" for car_id in car_ids.tolist()])
+            if not len(labels):
+                continue
+            # Sortowanie stabilne po segmencie zachowuje kolejność rankingu w segmencie
+            by_label = np.argsort(labels, kind="stable")
+            names, starts = np.unique(labels[by_label], return_index=True)
+            for name, start, end in zip(names, starts, np.append(starts[1:], len(labels))):
+                if name:
+                    rows = by_label[start:min(end, start + LEADERBOARD_SIZE)]
+                    rankings[(field, str(name))] = (car_ids[rows], scores[rows])
+        self.rankings = rankings
+
+    def top(self, top_n=5, exclude=(), segment=None):
+        """
+        Najlepiej ocenione auta z rankingu pomijając exclude.
+
+        Args:
+            top_n: liczba wyników
+            exclude: id aut do pominięcia (np. już ocenione przez użytkownika)
+            segment: None (ranking ogólny) albo para (pole, wartość),
+                np. ("fuel_type", "Petrol") lub ("price_tier", "budget")
+
+        Returns:
+            Lista krotek (car_id, średnia bayesowska)
+        """
+        car_ids, scores = self.rankings.get(segment, (np.zeros(0, dtype=np.int64), np.zeros(0)))
+        exclude = set(exclude)
+        result = []
+        for car_id, score in zip(car_ids.tolist(), scores.tolist()):
+            if car_id not in exclude:
+                result.append((car_id, score))
+                if len(result) == top_n:
+                    break
+        return result
+
+
+def _segments(car_ids):
+    snapshot = get_catalogue_snapshot()
+    return {
+        car_id: (price_tier(record.cars_price), record.fuel_type, record.company_name)
+        for car_id, record in snapshot.in_bulk(car_ids).items()
+    }
+
+
+def _load(path):
+    try:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None, None
+
+
+def _save(path, key, boards):
+    atomic_write_bytes(path, pickle.dumps((key, boards), protocol=pickle.HIGHEST_PROTOCOL))
+    _memo["key"] = key
+    _memo["boards"] = boards
+
+
+def _advance(key, stored_key, boards, catalogue=True):
+    """
+    Rankingi zapisane dla stored_key doprowadzone do key przez ponowne
+    zsumowanie ocen aut z dziennika zmian; None, jeśli trzeba je zbudować
+    od nowa.
+
+    Po zmianie katalogu (catalogue=True) rankingi tracą tylko auta usunięte,
+    a zmienione dostają nowe segmenty ze snapshotu - bez agregacji ocen
+    z bazy. Pełne przeliczenie zostaje zadaniu 'leaderboards'.
+    """
+    if boards is None or stored_key is None:
+        return None
+    car_ids = ratings_changes_since(stored_key[0], key[0])
+    if car_ids is None:
+        return None
+    if car_ids:
+        boards.update(_rating_totals(car_ids), car_ids)
+    if stored_key[1] != key[1]:
+        if not catalogue:
+            return None
+        boards.update_segments(catalogue_changes_since(stored_key[1], key[1]))
+    return boards
+
+
+def get_leaderboards():
+    """
+    Rankingi dla bieżących wersji ocen i katalogu.
+
+    Kolejność: pamięć procesu (po nowych ocenach i zmianach katalogu
+    aktualizowana tylko w pamięci) -> plik w katalogu artefaktów ->
+    przeliczenie z bazy. Plik zapisuje zadanie 'leaderboards', a żądanie
+    tylko przy pełnym przeliczeniu (brak pliku, przycięty dziennik ocen).
+    """
+    key = (get_ratings_version(), get_catalogue_version())
+    if _memo["key"] == key:
+        return _memo["boards"]
+
+    with _lock:
+        if _memo["key"] == key:
+            return _memo["boards"]
+        boards = _advance(key, _memo["key"], _memo["boards"])
+        if boards is None:
+            return refresh_leaderboards(key, persist=False)
+        _memo["key"] = key
+        _memo["boards"] = boards
+    return boards
+
+
+def refresh_leaderboards(key=None, persist=True):
+    """
+    Doprowadza rankingi z pliku do bieżących wersji (zadanie 'leaderboards').
+
+    Args:
+        key: (wersja ocen, wersja katalogu); domyślnie bieżące
+        persist: zapisz wynik do pliku także po aktualizacji przyrostowej
+            (pełne przeliczenie jest zapisywane zawsze); zadanie przelicza
+            rankingi z bazy po każdej zmianie katalogu
+    """
+    if key is None:
+        key = (get_ratings_version(), get_catalogue_version())
+    path = artifacts_dir() / LEADERBOARDS_FILENAME
+    stored_key, boards = _load(path)
+    if stored_key == key and boards is not None:
+        _memo["key"] = key
+        _memo["boards"] = boards
+        return boards
+
+    advanced = _advance(key, stored_key, boards, catalogue=not persist)
+    if advanced is None or persist:
+        boards = advanced if advanced is not None else Leaderboards.from_database()
+        _save(path, key, boards)
+    else:
+        boards = advanced
+        _memo["key"] = key
+        _memo["boards"] = boards
+    return boards
@@ -0,0 +1,318 @@
+import json
+import math
+import random
+import re
+import statistics
+import threading
+import time
+import uuid
+from collections import defaultdict
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode, urljoin
+from urllib.request import HTTPCookieProcessor, HTTPRedirectHandler, Request, build_opener
+
+# Domyślny udział scenariuszy (wagi względne)
+DEFAULT_MIX = {
+    "search": 40,
+    "models": 20,
+    "engines": 20,
+    "recommend": 15,
+    "quiz": 5,
+}
+
+SEARCH_QUERIES = ("", "bmw", "porsche gt", "electric", "suv 7", "v8", "toyota hybrid", "ferrari")
+
+RATING_FIELD_RE = re.compile(r'name="rating_(\d+)"')
+# Wiersz access logu (gunicorn/nginx): ... "GET /search/?q=bmw HTTP/1.1" ...
+ACCESS_LOG_RE = re.compile(r'"(GET|POST|HEAD|PUT|DELETE|PATCH) (\S+) HTTP/[\d.]+"')
+
+
+class _NoRedirect(HTTPRedirectHandler):
+    # Przekierowanie to wynik żądania (np. po zapisaniu quizu), a nie
+    # kolejne żądanie liczone do tego samego czasu
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Recorder:
+    """Czasy odpowiedzi i błędy per endpoint, współdzielone przez wątki."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, name, seconds, status):
+        with self._lock:
+            self.latencies[name].append(seconds)
+            self.statuses[name][status] += 1
+            if status == 0 or status >= 400:
+                self.errors[name] += 1
+
+    def summary(self, duration):
+        """
+        Statystyki per endpoint.
+
+        Returns:
+            dict {endpoint: {requests, errors, rps, p50, p90, p99, max, mean}};
+            czasy w sekundach, klucz "all" opisuje cały ruch
+        """
+        with self._lock:
+            latencies = {name: sorted(values) for name, values in self.latencies.items()}
+            errors = dict(self.errors)
+        latencies["all"] = sorted(value for values in latencies.values() for value in values)
+        errors["all"] = sum(errors.values())
+
+        result = {}
+        for name, values in latencies.items():
+            if not values:
+                continue
+            result[name] = {
+                "requests": len(values),
+                "errors": errors.get(name, 0),
+                "rps": len(values) / duration if duration else 0.0,
+                "p50": percentile(values, 50),
+                "p90": percentile(values, 90),
+                "p99": percentile(values, 99),
+                "max": values[-1],
+                "mean": statistics.fmean(values),
+            }
+        return result
+
+
+def percentile(sorted_values, pct):
+    """Percentyl metodą najbliższego rangą (wartości muszą być posortowane)."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100 * len(sorted_values)), 1)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class VirtualUser:
+    """
+    Jeden użytkownik z własnymi ciasteczkami (sesja, csrftoken).
+
+    Żądania POST dostają token CSRF z ciasteczka, tak jak formularze
+    w przeglądarce.
+    """
+
+    def __init__(self, base_url, recorder, timeout=30):
+        self.base_url = base_url.rstrip("/") + "/"
+        self.recorder = recorder
+        self.timeout = timeout
+        self.cookies = CookieJar()
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies), _NoRedirect)
+
+    def csrf_token(self):
+        for cookie in self.cookies:
+            if cookie.name == "csrftoken":
+                return cookie.value
+        return None
+
+    def request(self, name, path, params=None, data=None, method=None):
+        url = urljoin(self.base_url, path.lstrip("/"))
+        if params:
+            url = f"{url}?{urlencode(params, doseq=True)}"
+        body = None
+        headers = {"User-Agent": "car4u-loadtest"}
+        if data is not None:
+            token = self.csrf_token()
+            if token:
+                data = {**data, "csrfmiddlewaretoken": token}
+                headers["X-CSRFToken"] = token
+            headers["Referer"] = self.base_url
+            body = urlencode(data, doseq=True).encode()
+
+        start = time.perf_counter()
+        try:
+            with self.opener.open(Request(url, data=body, headers=headers, method=method), timeout=self.timeout) as response:
+                content = response.read()
+                status = response.status
+        except HTTPError as exc:
+            content = exc.read()
+            status = exc.code
+        except (URLError, OSError):
+            content = b""
+            status = 0
+        self.recorder.record(name, time.perf_counter() - start, status)
+        return status, content
+
+
+class Scenarios:
+    """
+    Scenariusze ruchu. Parametry (marki, modele) pochodzą z katalogu,
+    żeby zapytania trafiały w istniejące dane.
+    """
+
+    def __init__(self, catalogue, seed=None):
+        # catalogue: lista krotek (marka, model)
+        self.catalogue = [item for item in catalogue if all(item)]
+        if not self.catalogue:
+            raise ValueError("Katalog aut jest pusty - nie ma z czego budować zapytań")
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def pick(self):
+        with self.lock:
+            return self.rng.choice(self.catalogue)
+
+    def search(self, user):
+        company, _ = self.pick()
+        params = {"q": self.rng.choice(SEARCH_QUERIES)}
+        if self.rng.random() < 0.5:
+            params["company_name"] = company
+        if self.rng.random() < 0.3:
+            params["min_power"] = self.rng.choice((100, 200, 300))
+        user.request("search", "/search/", params)
+
+    def models(self, user):
+        company, _ = self.pick()
+        user.request("get_models", "/get-models/", {"company_name": company})
+
+    def engines(self, user):
+        company, model = self.pick()
+        user.request("get_engines", "/get-engines/", {"company_name": company, "car_name": model})
+
+    def recommend(self, user):
+        company, model = self.pick()
+        if user.csrf_token() is None:
+            user.request("recommend_form", "/recommend/")
+        user.request("recommend", "/recommend/", data={
+            "company_name": company,
+            "car_name": model,
+            "max_price": self.rng.choice(("", 100000, 300000)),
+        })
+
+    def quiz(self, user):
+        """Rejestracja, quiz (10 ocen) i wyniki CF - pełna ścieżka nowego użytkownika."""
+        if user.csrf_token() is None:
+            user.request("register_form", "/register/")
+        password = uuid.uuid4().hex
+        status, _ = user.request("register", "/register/", data={
+            "username": f"loadtest_{uuid.uuid4().hex[:12]}",
+            "password1": password,
+            "password2": password,
+        })
+        if status != 302:
+            return
+        status, content = user.request("quiz_start", "/quiz/", {"reset_quiz": 1})
+        car_ids = RATING_FIELD_RE.findall(content.decode("utf-8", "replace"))
+        if status != 200 or not car_ids:
+            return
+        ratings = {f"rating_{car_id}": self.rng.randint(1, 5) for car_id in dict.fromkeys(car_ids)}
+        user.request("quiz_rate", "/quiz/", data={**ratings, "submit_ratings": "1"})
+        user.request("quiz_results", "/quiz/results/")
+        user.request("logout", "/logout/")
+
+    def weighted(self, mix):
+        names = [name for name, weight in mix.items() if weight > 0]
+        weights = [mix[name] for name in names]
+        if not names:
+            raise ValueError("Wszystkie wagi scenariuszy są zerowe")
+
+        def run(user):
+            with self.lock:
+                name = self.rng.choices(names, weights)[0]
+            getattr(self, name)(user)
+        return run
+
+
+def parse_mix(value):
+    """
+    "search=40,quiz=0" -> wagi scenariuszy (brakujące zostają domyślne).
+
+    Przykład:
+        parse_mix("quiz=0") -> {"search": 40, ..., "quiz": 0}
+    """
+    mix = dict(DEFAULT_MIX)
+    for part in filter(None, (value or "").split(",")):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"Nieznany scenariusz: {name} (dostępne: {', '.join(DEFAULT_MIX)})")
+        mix[name] = float(weight)
+    return mix
+
+
+def read_replay_log(lines):
+    """
+    Żądania GET z logu do odtworzenia.
+
+    Obsługuje wiersze JSON z loggera cars.performance (pola method, path,
+    query) oraz access log gunicorn/nginx. Żądania POST nie mają w logach
+    treści, więc są pomijane.
+
+    Returns:
+        (lista ścieżek z query stringiem, liczba pominiętych wierszy)
+    """
+    paths = []
+    skipped = 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        method = path = None
+        start = line.find("{")
+        if start != -1:
+            try:
+                entry = json.loads(line[start:])
+            except ValueError:
+                entry = None
+            if isinstance(entry, dict) and "path" in entry:
+                method = entry.get("method", "GET")
+                path = entry["path"] + (f"?{entry['query']}" if entry.get("query") else "")
+        if path is None:
+            match = ACCESS_LOG_RE.search(line)
+            if match:
+                method, path = match.groups()
+        if path is None or method != "GET":
+            skipped += 1
+            continue
+        paths.append(path)
+    return paths, skipped
+
+
+def replay(paths):
+    """Scenariusz odtwarzający ścieżki z logu po kolei (wspólny licznik wątków)."""
+    lock = threading.Lock()
+    position = [0]
+
+    def run(user):
+        with lock:
+            path = paths[position[0] % len(paths)]
+            position[0] += 1
+        name = "replay " + path.split("?", 1)[0]
+        user.request(name, path)
+    return run
+
+
+def run_load(base_url, scenario, concurrency, duration, think_time=0.0, timeout=30):
+    """
+    Uruchamia `concurrency` wirtualnych użytkowników na `duration` sekund.
+
+    Każdy użytkownik w pętli wykonuje scenariusz i czeka losowy czas
+    (rozkład wykładniczy ze średnią think_time).
+
+    Returns:
+        (Recorder, faktyczny czas trwania w sekundach)
+    """
+    recorder = Recorder()
+    deadline = time.monotonic() + duration
+
+    def worker(seed):
+        rng = random.Random(seed)
+        user = VirtualUser(base_url, recorder, timeout=timeout)
+        while time.monotonic() < deadline:
+            scenario(user)
+            if think_time:
+                time.sleep(rng.expovariate(1 / think_time))
+
+    start = time.monotonic()
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder, time.monotonic() - start
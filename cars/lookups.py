@@ -0,0 +1,81 @@
+import re
+
+# Kanoniczne rodzaje paliwa w kolejności używanej przy łączeniu (np. "Petrol/Diesel")
+FUEL_TYPES = ("Petrol", "Diesel", "Electric", "Hydrogen", "CNG")
+HYBRID = "Hybrid"
+PLUG_IN_HYBRID = "Plug-in Hybrid"
+
+# Słowa z surowych danych -> kanoniczny rodzaj paliwa (None = pomiń słowo)
+FUEL_WORDS = {
+    "petrol": "Petrol",
+    "gas": "Petrol",
+    "gasoline": "Petrol",
+    "diesel": "Diesel",
+    "electric": "Electric",
+    "ev": "Electric",
+    "hydrogen": "Hydrogen",
+    "cng": "CNG",
+    "awd": None,
+}
+
+# Literówki spotykane w danych
+FUEL_TYPOS = {
+    "hyrbrid": "hybrid",
+    "hybird": "hybrid",
+    "pertol": "petrol",
+}
+
+WORD_RE = re.compile(r"[a-z]+")
+
+
+def normalize_name(value):
+    """Usuwa zbędne spacje (na brzegach i podwójne w środku)."""
+    if value is None:
+        return None
+    value = " ".join(str(value).split())
+    return value or None
+
+
+def display_brand_name(value):
+    """
+    Nazwa marki do wyświetlania: "ROLLS ROYCE" -> "Rolls Royce".
+
+    Krótkie skróty pisane wielkimi literami (BMW, GMC) zostają bez zmian.
+    """
+    value = normalize_name(value)
+    if value and value.isupper() and len(value) > 3:
+        return value.title()
+    return value
+
+
+def normalize_fuel_type(value):
+    """
+    Sprowadza zapis rodzaju paliwa do jednej z kanonicznych nazw.
+
+    Przykłady:
+        "plug in hyrbrid", "Hybrid / Plug-in" -> "Plug-in Hybrid"
+        "Petrol (Hybrid)", "Diesel Hybrid"    -> "Hybrid"
+        "Petrol, Diesel", "Diesel/Petrol"     -> "Petrol/Diesel"
+        "Petrol/AWD"                          -> "Petrol"
+    """
+    value = normalize_name(value)
+    if value is None:
+        return None
+
+    words = [FUEL_TYPOS.get(word, word) for word in WORD_RE.findall(value.lower())]
+    if "plug" in words:
+        return PLUG_IN_HYBRID
+    if "hybrid" in words:
+        return HYBRID
+
+    kinds = set()
+    for word in words:
+        if word not in FUEL_WORDS:
+            return value
+        if FUEL_WORDS[word]:
+            kinds.add(FUEL_WORDS[word])
+    if {"Petrol", "Electric"} <= kinds:
+        return HYBRID
+    if not kinds:
+        return value
+    return "/".join(kind for kind in FUEL_TYPES if kind in kinds)
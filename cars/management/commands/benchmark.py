@@ -0,0 +1,121 @@
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from cars.benchmarks import (
+    BENCHMARKS, SCALES, BenchmarkContext, build_report, compare_reports, load_report,
+    populate_catalogue, populate_ratings, run_benchmarks,
+)
+from cars.jobs import CATALOGUE_JOBS, JOBS, RATINGS_JOBS
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark recommendation, search and import on a synthetic catalogue '
+        'in a throwaway test database; optionally compare with a stored baseline'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=SCALES, default='small',
+                            help='Preset data size: ' + ', '.join(
+                                f'{name}={cars} cars/{users} users' for name, (cars, users) in SCALES.items()))
+        parser.add_argument('--cars', type=int, help='Number of cars (overrides --scale)')
+        parser.add_argument('--users', type=int, help='Number of rating users (overrides --scale)')
+        parser.add_argument('--ratings-per-user', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--rounds', type=int, default=5, help='Measured runs per benchmark')
+        parser.add_argument('--warmup', type=int, default=1, help='Unmeasured runs per benchmark')
+        parser.add_argument('--only', action='append', choices=BENCHMARKS, help='Run only this benchmark (repeatable)')
+        parser.add_argument('--output', type=Path, help='Write results as JSON to this file')
+        parser.add_argument('--baseline', type=Path, help='Compare with results stored by an earlier --output')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed median slowdown against the baseline (default 0.25 = 25%%)')
+
+    def handle(self, *args, **options):
+        cars, users = SCALES[options['scale']]
+        cars = options['cars'] if options['cars'] is not None else cars
+        users = options['users'] if options['users'] is not None else users
+        seed = options['seed']
+
+        baseline = None
+        if options['baseline']:
+            try:
+                baseline = load_report(options['baseline'])
+            except (OSError, ValueError) as exc:
+                raise CommandError(f'Nie można odczytać bazy {options["baseline"]}: {exc}')
+
+        # Dane syntetyczne trafiają do osobnej bazy testowej i osobnego
+        # katalogu artefaktów - produkcyjna baza nie jest dotykana
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with tempfile.TemporaryDirectory() as workdir, override_settings(
+                CARS_ARTIFACTS_DIR=workdir,
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+            ):
+                self.populate(cars, users, options['ratings_per_user'], seed)
+                context = BenchmarkContext(workdir, seed)
+                results = run_benchmarks(
+                    context,
+                    rounds=options['rounds'],
+                    warmup=options['warmup'],
+                    only=options['only'],
+                    progress=lambda name: self.stdout.write(f'  {name} ...'),
+                )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report = build_report(results, cars, users, options['ratings_per_user'], seed)
+        self.print_results(results)
+
+        if options['output']:
+            options['output'].parent.mkdir(parents=True, exist_ok=True)
+            options['output'].write_text(json.dumps(report, indent=2))
+            self.stdout.write(f'Zapisano wyniki do {options["output"]}')
+
+        if baseline is not None:
+            self.check_baseline(report, baseline, options['tolerance'])
+
+    def populate(self, cars, users, ratings_per_user, seed):
+        start = time.perf_counter()
+        self.stdout.write(f'Generowanie danych: {cars} aut, {users} użytkowników x {ratings_per_user} ocen ...')
+        populate_catalogue(cars, seed)
+        populate_ratings(users, ratings_per_user, seed)
+        # Artefakty jak po przebiegu run_worker
+        for name in CATALOGUE_JOBS + RATINGS_JOBS:
+            JOBS[name]()
+        self.stdout.write(f'Dane gotowe w {time.perf_counter() - start:.1f} s')
+
+    def print_results(self, results):
+        self.stdout.write(f'{"benchmark":<36} {"median ms":>10} {"p95 ms":>10} {"min ms":>10} {"items/s":>10}')
+        for name, stats in results.items():
+            throughput = f'{stats["items_per_second"]:.0f}' if 'items_per_second' in stats else '-'
+            self.stdout.write(
+                f'{name:<36} {stats["median"] * 1000:>10.2f} {stats["p95"] * 1000:>10.2f} '
+                f'{stats["min"] * 1000:>10.2f} {throughput:>10}'
+            )
+
+    def check_baseline(self, report, baseline, tolerance):
+        try:
+            rows = compare_reports(report, baseline, tolerance)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        regressions = []
+        for name, previous, current, ratio, regression in rows:
+            line = f'{name:<36} {previous * 1000:>10.2f} -> {current * 1000:>10.2f} ms ({ratio:.2f}x)'
+            if regression:
+                regressions.append(name)
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(self.style.SUCCESS(line))
+
+        if regressions:
+            raise CommandError(
+                f'Regresja wydajności (> {tolerance:.0%} wolniej niż baza): {", ".join(regressions)}'
+            )
@@ -0,0 +1,48 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from cars.benchmarks import measure_startup
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure cold worker startup (python -X importtime in a fresh interpreter) '
+        'and fail when it exceeds the import-time budget or loads lazy modules'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=3, help='Fresh interpreters to measure (median is used)')
+        parser.add_argument('--budget-ms', type=float,
+                            help='Startup budget in ms (default: settings.CARS_STARTUP_BUDGET_MS)')
+        parser.add_argument('--top', type=int, default=10, help='Slowest top-level packages to list')
+        parser.add_argument('--output', type=Path, help='Write the measurement as JSON to this file')
+
+    def handle(self, *args, **options):
+        budget = options['budget_ms']
+        if budget is None:
+            budget = getattr(settings, 'CARS_STARTUP_BUDGET_MS', 600)
+        lazy_modules = getattr(settings, 'CARS_STARTUP_LAZY_MODULES', ['pandas', 'sklearn', 'scipy'])
+
+        result = measure_startup(rounds=options['rounds'])
+        self.stdout.write(f'Start aplikacji: {result["seconds"] * 1000:.0f} ms '
+                          f'(budżet {budget:.0f} ms), pamięć {result["max_rss_mb"]:.1f} MB')
+        slowest = sorted(result['packages'].items(), key=lambda item: item[1], reverse=True)
+        for package, seconds in slowest[:options['top']]:
+            self.stdout.write(f'  {package:<30} {seconds * 1000:>8.1f} ms')
+
+        if options['output']:
+            options['output'].parent.mkdir(parents=True, exist_ok=True)
+            options['output'].write_text(json.dumps({**result, 'budget_ms': budget}, indent=2))
+
+        problems = []
+        if result['seconds'] * 1000 > budget:
+            problems.append(f'start trwa {result["seconds"] * 1000:.0f} ms, budżet to {budget:.0f} ms')
+        eager = sorted(set(lazy_modules) & set(result['modules']))
+        if eager:
+            problems.append(f'przy starcie importowane są moduły ładowane leniwie: {", ".join(eager)}')
+        if problems:
+            raise CommandError('; '.join(problems))
+        self.stdout.write(self.style.SUCCESS('Start mieści się w budżecie'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from cars.similar_cars import DEFAULT_TOP_K, build_similar_cars_table, save_similar_cars_table
+
+
+class Command(BaseCommand):
+    help = 'Precompute top-K similar cars for every car (unconstrained recommendations)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K,
+                            help='Liczba sąsiadów zapisywanych dla każdego auta')
+
+    def handle(self, *args, **options):
+        table = build_similar_cars_table(top_k=options['top_k'])
+        path = save_similar_cars_table(table)
+        self.stdout.write(self.style.SUCCESS(
+            f'Zapisano sąsiadów dla {len(table.car_ids)} aut '
+            f'(top {table.top_k}, wersja katalogu {table.version}) do {path}'
+        ))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from cars.records import load_shared_snapshot, save_catalogue_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Write the memory-mapped catalogue snapshot shared by all workers'
+
+    def handle(self, *args, **options):
+        path = save_catalogue_snapshot()
+        snapshot = load_shared_snapshot()
+        if snapshot is None:
+            self.stdout.write(self.style.WARNING(
+                f'Zapisano {path}, ale katalog zmienił się w trakcie budowy - uruchom komendę ponownie'
+            ))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Zapisano snapshot {len(snapshot)} aut ({snapshot.nbytes} B) do {path}'
+        ))
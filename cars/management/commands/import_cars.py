@@ -2,16 +2,27 @@ from django.core.management.base import BaseCommand
 import pandas as pd
 import numpy as np
 import re
-from cars.models import Car
+from cars.catalogue import batch_update
+from cars.lookups import normalize_fuel_type, normalize_name
+from cars.models import Brand, Car, CarModel, FuelType
+from cars.records import save_catalogue_snapshot
 from pathlib import Path
 from django.conf import settings
+from django.db import transaction
 
 class Command(BaseCommand):
     help = 'Import Cars Datasets 2025.csv into Car model'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--csv',
+            type=Path,
+            default=Path(settings.BASE_DIR) / 'data' / 'Cars Datasets 2025.csv',
+            help='CSV file in the Cars Datasets 2025 format (default: data/Cars Datasets 2025.csv)',
+        )
+
     def handle(self, *args, **options):
-        base = Path(settings.BASE_DIR)
-        csv_path = base / 'data' / 'Cars Datasets 2025.csv'
+        csv_path = Path(options['csv'])
         if not csv_path.exists():
             self.stdout.write(self.style.ERROR(f'Plik nie istnieje: {csv_path}'))
             return
@@ -75,21 +86,53 @@ class Command(BaseCommand):
 
 
 
+        def text(value):
+            return None if pd.isna(value) else normalize_name(value)
+
+        # Słowniki marek/modeli/paliw trzymane w pamięci na czas importu,
+        # żeby Car.save() nie odpytywał ich dla każdego wiersza
+        brands, car_models, fuels = {}, {}, {}
+
+        def resolve(cache, key, factory):
+            if key is None:
+                return None
+            if key not in cache:
+                cache[key] = factory()
+            return cache[key]
+
         # Zapis do bazy
         created = 0
-        for _, row in df.iterrows():
-            car = Car(
-                company_name = row.get('Company Names'),
-                car_name = row.get('Cars Names'),
-                engine = row.get('Engines'),
-                horsepower = float(row.get('HorsePower_num')) if not pd.isna(row.get('HorsePower_num')) else None,
-                total_speed = int(row.get('speed_num')) if not pd.isna(row.get('speed_num')) else None,
-                cars_price = float(row.get('Cars Prices')) if not pd.isna(row.get('Cars Prices')) else None,
-                fuel_type = row.get('Fuel Types'),
-                seats = clean_seats(row.get('Seats')),
-
-            )
-            car.save()
-            created += 1
+        # Jedno podbicie wersji katalogu dla całego importu
+        with batch_update():
+            for _, row in df.iterrows():
+                company_name = text(row.get('Company Names'))
+                car_name = text(row.get('Cars Names'))
+                fuel_type = normalize_fuel_type(text(row.get('Fuel Types')))
+
+                brand = resolve(brands, company_name and company_name.lower(), lambda: Brand.resolve(company_name))
+                car_model = resolve(car_models, brand and car_name and (brand.id, car_name),
+                                    lambda: CarModel.resolve(brand, car_name))
+                fuel = resolve(fuels, fuel_type, lambda: FuelType.resolve(fuel_type))
+
+                car = Car(
+                    company_name = brand.name if brand else None,
+                    car_name = car_name,
+                    engine = text(row.get('Engines')),
+                    horsepower = float(row.get('HorsePower_num')) if not pd.isna(row.get('HorsePower_num')) else None,
+                    total_speed = int(row.get('speed_num')) if not pd.isna(row.get('speed_num')) else None,
+                    cars_price = float(row.get('Cars Prices')) if not pd.isna(row.get('Cars Prices')) else None,
+                    fuel_type = fuel_type,
+                    seats = clean_seats(row.get('Seats')),
+                    brand = brand,
+                    car_model = car_model,
+                    fuel = fuel,
+
+                )
+                car.save()
+                created += 1
+
+        # Wspólny snapshot dla workerów (np.memmap) od razu po imporcie - po
+        # zatwierdzeniu transakcji, żeby wycofany import nie trafił do snapshotu
+        transaction.on_commit(save_catalogue_snapshot)
 
         self.stdout.write(self.style.SUCCESS(f'Zaimportowano {created} rekordów.'))
@@ -0,0 +1,157 @@
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+from urllib.error import URLError
+from urllib.request import urlopen
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from cars.loadtest import DEFAULT_MIX, Scenarios, parse_mix, read_replay_log, replay, run_load
+from cars.models import Car
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive a running server (or one started with --serve) with a realistic traffic mix '
+        'or a replayed request log; report throughput and latency percentiles per endpoint'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000',
+                            help='Server to test (default: http://127.0.0.1:8000)')
+        parser.add_argument('--serve', choices=['runserver', 'gunicorn'],
+                            help='Start a local server on --base-url for the duration of the test')
+        parser.add_argument('--workers', type=int, default=2, help='Gunicorn workers with --serve gunicorn')
+        parser.add_argument('--concurrency', default='1,5,10,20',
+                            help='Comma-separated virtual user counts; each is a separate step')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds per concurrency step')
+        parser.add_argument('--warmup', type=float, default=5,
+                            help='Unrecorded seconds of traffic before the first step (cold caches, lazy imports)')
+        parser.add_argument('--think-time', type=float, default=0.0,
+                            help='Mean pause between scenarios per virtual user, in seconds')
+        parser.add_argument('--mix', help='Scenario weights, e.g. "search=50,quiz=0" (default: ' + ', '.join(
+            f'{name}={weight}' for name, weight in DEFAULT_MIX.items()) + ')')
+        parser.add_argument('--replay', type=Path,
+                            help='Replay GET requests from a cars.performance JSON log or a gunicorn/nginx access log')
+        parser.add_argument('--p99-limit', type=float, default=1000,
+                            help='p99 latency (ms) above which a step counts as degraded (default 1000)')
+        parser.add_argument('--timeout', type=float, default=30, help='Per-request timeout in seconds')
+        parser.add_argument('--seed', type=int)
+        parser.add_argument('--output', type=Path, help='Write per-step results as JSON to this file')
+
+    def handle(self, *args, **options):
+        try:
+            steps = [int(value) for value in options['concurrency'].split(',') if value.strip()]
+        except ValueError:
+            raise CommandError('--concurrency musi być listą liczb, np. 1,5,10')
+        if not steps or min(steps) < 1:
+            raise CommandError('--concurrency musi zawierać liczby większe od zera')
+
+        scenario = self.build_scenario(options)
+        base_url = options['base_url']
+
+        server = self.start_server(options) if options['serve'] else None
+        try:
+            self.wait_for(base_url)
+            if options['warmup']:
+                run_load(base_url, scenario, 1, options['warmup'], timeout=options['timeout'])
+            report = []
+            for concurrency in steps:
+                self.stdout.write(f'\n{concurrency} użytkowników przez {options["duration"]:.0f} s ...')
+                recorder, elapsed = run_load(
+                    base_url, scenario, concurrency, options['duration'],
+                    think_time=options['think_time'], timeout=options['timeout'],
+                )
+                summary = recorder.summary(elapsed)
+                report.append({'concurrency': concurrency, 'duration': elapsed, 'endpoints': summary})
+                self.print_summary(summary)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=10)
+
+        self.print_capacity(report, options['p99_limit'] / 1000)
+        if options['output']:
+            options['output'].parent.mkdir(parents=True, exist_ok=True)
+            options['output'].write_text(json.dumps({'base_url': base_url, 'steps': report}, indent=2))
+            self.stdout.write(f'Zapisano wyniki do {options["output"]}')
+
+    def build_scenario(self, options):
+        if options['replay']:
+            try:
+                with open(options['replay'], encoding='utf-8', errors='replace') as f:
+                    paths, skipped = read_replay_log(f)
+            except OSError as exc:
+                raise CommandError(f'Nie można odczytać logu {options["replay"]}: {exc}')
+            if not paths:
+                raise CommandError(f'Brak żądań GET do odtworzenia w {options["replay"]}')
+            self.stdout.write(f'Odtwarzanie {len(paths)} żądań (pominięto {skipped} wierszy bez GET)')
+            return replay(paths)
+
+        try:
+            mix = parse_mix(options['mix'])
+            # Parametry zapytań z lokalnej bazy - serwer powinien mieć ten sam katalog
+            catalogue = list(Car.objects.values_list('company_name', 'car_name').distinct())
+            scenarios = Scenarios(catalogue, seed=options['seed'])
+            return scenarios.weighted(mix)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+    def start_server(self, options):
+        address = options['base_url'].split('://', 1)[-1].rstrip('/')
+        if options['serve'] == 'gunicorn':
+            command = [
+                sys.executable, '-m', 'gunicorn', 'car4u.asgi:application',
+                '-k', 'uvicorn_worker.UvicornWorker',
+                '-b', address, '-w', str(options['workers']),
+            ]
+        else:
+            command = [sys.executable, 'manage.py', 'runserver', address, '--noreload']
+        self.stdout.write('Uruchamianie serwera: ' + ' '.join(command))
+        return subprocess.Popen(command, cwd=settings.BASE_DIR, stdout=subprocess.DEVNULL)
+
+    def wait_for(self, base_url, timeout=30):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                with urlopen(base_url, timeout=5):
+                    return
+            except URLError as exc:
+                # Odpowiedź z kodem błędu też oznacza, że serwer działa
+                if getattr(exc, 'code', None):
+                    return
+                if time.monotonic() > deadline:
+                    raise CommandError(f'Serwer {base_url} nie odpowiada: {exc.reason}')
+                time.sleep(0.5)
+
+    def print_summary(self, summary):
+        self.stdout.write(
+            f'{"endpoint":<32} {"req":>7} {"err":>5} {"req/s":>8} {"p50 ms":>9} {"p90 ms":>9} {"p99 ms":>9} {"max ms":>9}'
+        )
+        for name, stats in sorted(summary.items(), key=lambda item: item[0] == 'all'):
+            self.stdout.write(
+                f'{name:<32} {stats["requests"]:>7} {stats["errors"]:>5} {stats["rps"]:>8.1f} '
+                f'{stats["p50"] * 1000:>9.1f} {stats["p90"] * 1000:>9.1f} '
+                f'{stats["p99"] * 1000:>9.1f} {stats["max"] * 1000:>9.1f}'
+            )
+
+    def print_capacity(self, report, p99_limit):
+        sustained = None
+        for step in report:
+            total = step['endpoints'].get('all')
+            if total is None or total['p99'] > p99_limit or total['errors']:
+                break
+            sustained = step
+        if sustained is None:
+            self.stdout.write(self.style.WARNING(
+                f'\nJuż pierwszy krok przekracza p99 {p99_limit * 1000:.0f} ms albo zwraca błędy'
+            ))
+        else:
+            total = sustained['endpoints']['all']
+            self.stdout.write(self.style.SUCCESS(
+                f'\nNajwiększa współbieżność z p99 <= {p99_limit * 1000:.0f} ms i bez błędów: '
+                f'{sustained["concurrency"]} użytkowników ({total["rps"]:.1f} req/s)'
+            ))
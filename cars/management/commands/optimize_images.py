@@ -0,0 +1,44 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from cars.images import DEFAULT_WIDTHS, build_derivatives, find_sources
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate resized WebP and progressive JPEG variants of the static images '
+        '(requires Pillow); run before collectstatic when an image changes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', type=Path, default=Path(settings.BASE_DIR) / 'cars' / 'static' / 'cars',
+                            help='Directory with the original images')
+        parser.add_argument('--widths', default=','.join(map(str, DEFAULT_WIDTHS)),
+                            help='Comma-separated target widths in pixels')
+        parser.add_argument('--quality', type=int, default=80)
+        parser.add_argument('--force', action='store_true', help='Regenerate variants that are up to date')
+
+    def handle(self, *args, **options):
+        try:
+            import PIL  # noqa: F401
+        except ImportError:
+            raise CommandError('Generowanie obrazów wymaga pakietu Pillow (pip install Pillow)')
+        try:
+            widths = [int(value) for value in options['widths'].split(',') if value.strip()]
+        except ValueError:
+            raise CommandError('--widths musi być listą liczb, np. 1920,960')
+
+        sources = find_sources(options['dir'])
+        if not sources:
+            raise CommandError(f'Brak obrazów w {options["dir"]}')
+
+        for source in sources:
+            original = source.stat().st_size
+            written = build_derivatives(source, widths, quality=options['quality'], force=options['force'])
+            if not written:
+                self.stdout.write(f'{source.name}: aktualne')
+                continue
+            for path, size in written:
+                self.stdout.write(f'{source.name} -> {path.name}: {size / 1024:.0f} KB ({size / original:.0%} oryginału)')
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from cars.jobs import prune_finished, requeue_interrupted, run_pending
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs (artifact rebuilds) from the database queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Wykonaj gotowe zadania i zakończ')
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Co ile sekund sprawdzać kolejkę')
+
+    def handle(self, *args, **options):
+        requeued = requeue_interrupted()
+        if requeued:
+            self.stdout.write(f'Przywrócono {requeued} przerwanych zadań')
+
+        if options['once']:
+            done = run_pending()
+            self.stdout.write(self.style.SUCCESS(f'Wykonano {done} zadań'))
+            return
+
+        self.stdout.write(self.style.SUCCESS('Worker uruchomiony (Ctrl+C kończy)'))
+        last_prune = 0.0
+        try:
+            while True:
+                close_old_connections()
+                done = run_pending()
+                if done:
+                    self.stdout.write(f'Wykonano {done} zadań')
+                if time.monotonic() - last_prune > 3600:
+                    prune_finished()
+                    last_prune = time.monotonic()
+                if not done:
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Zatrzymano worker')
@@ -0,0 +1,296 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger("cars.performance")
+
+# Granice przedziałów histogramów czasu (sekundy)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = contextvars.ContextVar("cars_request_metrics", default=None)
+
+
+class RequestMetrics:
+    """Pomiary jednego żądania: zapytania SQL, cache i etapy obliczeń."""
+
+    __slots__ = ("started", "db_count", "db_time", "cache", "timings")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_count = 0
+        self.db_time = 0.0
+        self.cache = defaultdict(lambda: [0, 0])  # nazwa -> [trafienia, chybienia]
+        self.timings = defaultdict(float)
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self, total):
+        """Wartość nagłówka Server-Timing (czasy w milisekundach)."""
+        parts = [
+            f"total;dur={total * 1000:.1f}",
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.db_count} queries"',
+        ]
+        for name, seconds in self.timings.items():
+            parts.append(f"{name};dur={seconds * 1000:.1f}")
+        for name, (hits, misses) in self.cache.items():
+            parts.append(f'cache-{name};desc="hit={hits} miss={misses}"')
+        return ", ".join(parts)
+
+
+def current():
+    """Pomiary bieżącego żądania albo None (poza żądaniem, np. w komendach)."""
+    return _current.get()
+
+
+def record_timing(name, seconds):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.timings[name] += seconds
+    registry.observe_stage(name, seconds)
+
+
+@contextmanager
+def timed(name):
+    """
+    Mierzy czas bloku jako etap żądania (Server-Timing) i w /metrics.
+
+    Przykład:
+        with timed("knn"):
+            top_results = find_top_similar_cars(...)
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(name, time.perf_counter() - start)
+
+
+def record_cache(name, hit):
+    """Zlicza trafienie/chybienie pamięci podręcznej (artefakty, tabela sąsiadów)."""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.cache[name][0 if hit else 1] += 1
+    registry.count_cache(name, hit)
+
+
+def _db_wrapper(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_count += 1
+        metrics.db_time += time.perf_counter() - start
+
+
+def install_db_wrapper(sender=None, connection=None, **kwargs):
+    # connection.execute_wrapper() działa tylko dla połączenia bieżącego
+    # wątku, a widoki async wykonują zapytania w innych wątkach. Dlatego
+    # wrapper jest dopinany do każdego nowego połączenia, a pomiary trafiają
+    # do żądania przez contextvar (sync_to_async przenosi kontekst).
+    if _db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_db_wrapper)
+
+
+def install_db_wrappers():
+    """Dopina wrapper do połączeń bieżącego wątku otwartych przed startem middleware."""
+    for connection in connections.all(initialized_only=True):
+        install_db_wrapper(connection=connection)
+
+
+connection_created.connect(install_db_wrapper, dispatch_uid="cars.metrics.install_db_wrapper")
+
+
+class Histogram:
+    __slots__ = ("buckets", "count", "total")
+
+    def __init__(self):
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        index = bisect_left(DURATION_BUCKETS, value)
+        for i in range(index, len(DURATION_BUCKETS)):
+            self.buckets[i] += 1
+        self.count += 1
+        self.total += value
+
+
+class MetricsRegistry:
+    """
+    Liczniki i histogramy procesu w formacie tekstowym Prometheusa.
+
+    Każdy worker ma własny rejestr - /metrics pokazuje proces, który
+    obsłużył żądanie (etykieta pid pozwala je rozróżnić).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = defaultdict(int)        # (view, method, status) -> liczba
+            self.durations = defaultdict(Histogram)  # view -> histogram
+            self.db_queries = defaultdict(int)      # view -> liczba zapytań
+            self.db_seconds = defaultdict(float)    # view -> czas zapytań
+            self.cache = defaultdict(lambda: [0, 0])
+            self.stages = defaultdict(Histogram)    # etap -> histogram
+            self.admissions = defaultdict(int)      # (view, wynik) -> liczba
+            self.admission_state = {}               # view -> (w toku, w kolejce, limit)
+
+    def observe_request(self, view, method, status, metrics, total):
+        with self._lock:
+            self.requests[(view, method, status)] += 1
+            self.durations[view].observe(total)
+            self.db_queries[view] += metrics.db_count
+            self.db_seconds[view] += metrics.db_time
+
+    def observe_stage(self, name, seconds):
+        with self._lock:
+            self.stages[name].observe(seconds)
+
+    def count_cache(self, name, hit):
+        with self._lock:
+            self.cache[name][0 if hit else 1] += 1
+
+    def count_admission(self, view, result):
+        with self._lock:
+            self.admissions[(view, result)] += 1
+
+    def set_admission_state(self, view, active, waiting, limit):
+        with self._lock:
+            self.admission_state[view] = (active, waiting, limit)
+
+    def render(self):
+        lines = []
+
+        def histogram(metric, label, values):
+            lines.append(f"# TYPE {metric} histogram")
+            for key, hist in sorted(values.items()):
+                for bound, count in zip(DURATION_BUCKETS, hist.buckets):
+                    lines.append(f'{metric}_bucket{{{label}="{key}",le="{bound}"}} {count}')
+                lines.append(f'{metric}_bucket{{{label}="{key}",le="+Inf"}} {hist.count}')
+                lines.append(f'{metric}_sum{{{label}="{key}"}} {hist.total:.6f}')
+                lines.append(f'{metric}_count{{{label}="{key}"}} {hist.count}')
+
+        with self._lock:
+            lines.append("# TYPE car4u_process_info gauge")
+            lines.append(f'car4u_process_info{{pid="{os.getpid()}"}} 1')
+            lines.append("# TYPE car4u_requests_total counter")
+            for (view, method, status), count in sorted(self.requests.items()):
+                lines.append(f'car4u_requests_total{{view="{view}",method="{method}",status="{status}"}} {count}')
+            histogram("car4u_request_duration_seconds", "view", self.durations)
+
+            lines.append("# TYPE car4u_db_queries_total counter")
+            for view, count in sorted(self.db_queries.items()):
+                lines.append(f'car4u_db_queries_total{{view="{view}"}} {count}')
+            lines.append("# TYPE car4u_db_query_seconds_total counter")
+            for view, seconds in sorted(self.db_seconds.items()):
+                lines.append(f'car4u_db_query_seconds_total{{view="{view}"}} {seconds:.6f}')
+
+            lines.append("# TYPE car4u_cache_requests_total counter")
+            for name, (hits, misses) in sorted(self.cache.items()):
+                lines.append(f'car4u_cache_requests_total{{cache="{name}",result="hit"}} {hits}')
+                lines.append(f'car4u_cache_requests_total{{cache="{name}",result="miss"}} {misses}')
+
+            histogram("car4u_stage_duration_seconds", "stage", self.stages)
+
+            lines.append("# TYPE car4u_admission_total counter")
+            for (view, result), count in sorted(self.admissions.items()):
+                lines.append(f'car4u_admission_total{{view="{view}",result="{result}"}} {count}')
+            for metric, offset in (("in_flight", 0), ("waiting", 1), ("limit", 2)):
+                lines.append(f"# TYPE car4u_admission_{metric} gauge")
+                for view, state in sorted(self.admission_state.items()):
+                    lines.append(f'car4u_admission_{metric}{{view="{view}"}} {state[offset]}')
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+class PerformanceMiddleware:
+    """
+    Mierzy każde żądanie: czas całkowity, liczbę i czas zapytań SQL,
+    trafienia cache i etapy rekomendacji.
+
+    Wynik trafia do nagłówka Server-Timing, do logu cars.performance
+    (jeden wiersz JSON na żądanie) i do rejestru eksportowanego przez /metrics.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        install_db_wrappers()
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        total = metrics.elapsed
+        match = getattr(request, "resolver_match", None)
+        view = (match.url_name or match.view_name) if match else "unresolved"
+
+        response["Server-Timing"] = metrics.server_timing(total)
+        registry.observe_request(view, request.method, response.status_code, metrics, total)
+
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({
+                "view": view,
+                "method": request.method,
+                "path": request.path,
+                "query": request.META.get("QUERY_STRING", ""),
+                "status": response.status_code,
+                "duration_ms": round(total * 1000, 2),
+                "db_queries": metrics.db_count,
+                "db_ms": round(metrics.db_time * 1000, 2),
+                "stages_ms": {name: round(seconds * 1000, 2) for name, seconds in metrics.timings.items()},
+                "cache": {name: {"hit": hits, "miss": misses} for name, (hits, misses) in metrics.cache.items()},
+            }))
+        return response
+
+
+def metrics_view(request):
+    """Metryki procesu w formacie Prometheusa; dostępne tylko z adresów lokalnych."""
+    allowed = getattr(settings, "CARS_METRICS_ALLOWED_IPS", ("127.0.0.1", "::1"))
+    if request.META.get("REMOTE_ADDR") not in allowed:
+        return HttpResponseForbidden("Metryki są dostępne tylko lokalnie")
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
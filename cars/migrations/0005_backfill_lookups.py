@@ -0,0 +1,140 @@
+import re
+from collections import Counter, defaultdict
+
+from django.db import migrations
+
+# Kopia cars.lookups z chwili tej migracji - późniejsze zmiany pomocników
+# nie mogą zmieniać tego, co robi historyczna migracja
+
+FUEL_TYPES = ("Petrol", "Diesel", "Electric", "Hydrogen", "CNG")
+HYBRID = "Hybrid"
+PLUG_IN_HYBRID = "Plug-in Hybrid"
+
+FUEL_WORDS = {
+    "petrol": "Petrol",
+    "gas": "Petrol",
+    "gasoline": "Petrol",
+    "diesel": "Diesel",
+    "electric": "Electric",
+    "ev": "Electric",
+    "hydrogen": "Hydrogen",
+    "cng": "CNG",
+    "awd": None,
+}
+
+FUEL_TYPOS = {
+    "hyrbrid": "hybrid",
+    "hybird": "hybrid",
+    "pertol": "petrol",
+}
+
+WORD_RE = re.compile(r"[a-z]+")
+
+
+def normalize_name(value):
+    if value is None:
+        return None
+    value = " ".join(str(value).split())
+    return value or None
+
+
+def display_brand_name(value):
+    value = normalize_name(value)
+    if value and value.isupper() and len(value) > 3:
+        return value.title()
+    return value
+
+
+def normalize_fuel_type(value):
+    value = normalize_name(value)
+    if value is None:
+        return None
+
+    words = [FUEL_TYPOS.get(word, word) for word in WORD_RE.findall(value.lower())]
+    if "plug" in words:
+        return PLUG_IN_HYBRID
+    if "hybrid" in words:
+        return HYBRID
+
+    kinds = set()
+    for word in words:
+        if word not in FUEL_WORDS:
+            return value
+        if FUEL_WORDS[word]:
+            kinds.add(FUEL_WORDS[word])
+    if {"Petrol", "Electric"} <= kinds:
+        return HYBRID
+    if not kinds:
+        return value
+    return "/".join(kind for kind in FUEL_TYPES if kind in kinds)
+
+
+def backfill_lookups(apps, schema_editor):
+    """
+    Wypełnia słowniki marek, modeli i paliw na podstawie istniejących aut
+    i normalizuje pola tekstowe.
+
+    Dla marek zapisanych różnie ("KIA", "Kia", "KIA  ") wybierana jest
+    najczęstsza pisownia.
+    """
+    Car = apps.get_model('cars', 'Car')
+    Brand = apps.get_model('cars', 'Brand')
+    CarModel = apps.get_model('cars', 'CarModel')
+    FuelType = apps.get_model('cars', 'FuelType')
+
+    cars = list(Car.objects.all())
+
+    spellings = defaultdict(Counter)
+    for car in cars:
+        name = normalize_name(car.company_name)
+        if name:
+            spellings[name.lower()][name] += 1
+
+    brands = {
+        key: Brand.objects.get_or_create(name=display_brand_name(counter.most_common(1)[0][0]))[0]
+        for key, counter in spellings.items()
+    }
+    car_models = {}
+    fuels = {}
+
+    for car in cars:
+        company_name = normalize_name(car.company_name)
+        car.car_name = normalize_name(car.car_name)
+        car.fuel_type = normalize_fuel_type(car.fuel_type)
+
+        car.brand = brands[company_name.lower()] if company_name else None
+        car.company_name = car.brand.name if car.brand else None
+
+        if car.brand and car.car_name:
+            key = (car.brand.id, car.car_name)
+            if key not in car_models:
+                car_models[key] = CarModel.objects.get_or_create(brand=car.brand, name=car.car_name)[0]
+            car.car_model = car_models[key]
+        else:
+            car.car_model = None
+
+        if car.fuel_type:
+            if car.fuel_type not in fuels:
+                fuels[car.fuel_type] = FuelType.objects.get_or_create(name=car.fuel_type)[0]
+            car.fuel = fuels[car.fuel_type]
+        else:
+            car.fuel = None
+
+    Car.objects.bulk_update(
+        cars,
+        ['company_name', 'car_name', 'fuel_type', 'brand', 'car_model', 'fuel'],
+        batch_size=500,
+    )
+    # Artefakty zapisane ze starą pisownią unieważnia rozgrzewka po wdrożeniu
+    # (catalogue.sync_schema_version), a nie migracja
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0004_brand_carmodel_fueltype'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_lookups, migrations.RunPython.noop),
+    ]
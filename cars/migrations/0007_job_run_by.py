@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0006_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='run_by',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
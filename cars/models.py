@@ -1,6 +1,66 @@
 from django.db import models
 from django.contrib.auth.models import User
 
+from .lookups import display_brand_name, normalize_fuel_type, normalize_name
+
+
+class Brand(models.Model):
+    """Słownik marek (company_name) - auta wskazują markę kluczem liczbowym"""
+    name = models.CharField(max_length=200, unique=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def resolve(cls, name):
+        """Marka o danej nazwie (bez względu na wielkość liter), tworzona w razie potrzeby."""
+        name = normalize_name(name)
+        if name is None:
+            return None
+        return cls.objects.get_or_create(name__iexact=name, defaults={'name': display_brand_name(name)})[0]
+
+
+class CarModel(models.Model):
+    """Słownik modeli (car_name) w obrębie marki"""
+    brand = models.ForeignKey(Brand, on_delete=models.PROTECT, related_name='models')
+    name = models.CharField(max_length=300)
+
+    class Meta:
+        ordering = ['name']
+        unique_together = ('brand', 'name')
+
+    def __str__(self):
+        return f"{self.brand} {self.name}"
+
+    @classmethod
+    def resolve(cls, brand, name):
+        name = normalize_name(name)
+        if brand is None or name is None:
+            return None
+        return cls.objects.get_or_create(brand=brand, name=name)[0]
+
+
+class FuelType(models.Model):
+    """Słownik rodzajów paliwa (po normalizacji, np. "plug in hyrbrid" -> "Plug-in Hybrid")"""
+    name = models.CharField(max_length=100, unique=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def resolve(cls, name):
+        name = normalize_fuel_type(name)
+        if name is None:
+            return None
+        return cls.objects.get_or_create(name=name)[0]
+
+
 class Car(models.Model):
     company_name = models.CharField(max_length=200, null=True, blank=True)
     car_name = models.CharField(max_length=300, null=True, blank=True)
@@ -11,9 +71,55 @@ class Car(models.Model):
     fuel_type = models.CharField(max_length=100, null=True, blank=True)
     seats = models.IntegerField(max_length=50, null=True, blank=True)
 
+    # Klucze do słowników; pola tekstowe powyżej zostają jako kopia do wyświetlania
+    brand = models.ForeignKey(Brand, on_delete=models.PROTECT, null=True, blank=True, related_name='cars')
+    car_model = models.ForeignKey(CarModel, on_delete=models.PROTECT, null=True, blank=True, related_name='cars')
+    fuel = models.ForeignKey(FuelType, on_delete=models.PROTECT, null=True, blank=True, related_name='cars')
+
+    LOOKUP_FIELDS = ('company_name', 'car_name', 'fuel_type', 'brand', 'car_model', 'fuel')
+
     def __str__(self):
         return f"{self.company_name} {self.car_name}"
 
+    def save(self, *args, **kwargs):
+        self.sync_lookups()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | set(self.LOOKUP_FIELDS)
+        super().save(*args, **kwargs)
+
+    def sync_lookups(self):
+        """
+        Normalizuje nazwy i ustawia klucze do słowników.
+
+        Słownik jest odpytywany tylko wtedy, gdy przypisany obiekt nie pasuje
+        do nazwy (import_cars przypisuje je z własnej pamięci podręcznej).
+        """
+        self.company_name = normalize_name(self.company_name)
+        self.car_name = normalize_name(self.car_name)
+        self.fuel_type = normalize_fuel_type(self.fuel_type)
+
+        brand = self._cached_lookup('brand')
+        if brand is None or self.company_name is None or brand.name.lower() != self.company_name.lower():
+            brand = Brand.resolve(self.company_name)
+        self.brand = brand
+        if brand is not None:
+            self.company_name = brand.name
+
+        car_model = self._cached_lookup('car_model')
+        if car_model is None or car_model.brand_id != self.brand_id or car_model.name != self.car_name:
+            car_model = CarModel.resolve(brand, self.car_name)
+        self.car_model = car_model
+
+        fuel = self._cached_lookup('fuel')
+        if fuel is None or fuel.name != self.fuel_type:
+            fuel = FuelType.resolve(self.fuel_type)
+        self.fuel = fuel
+
+    def _cached_lookup(self, field):
+        descriptor = getattr(type(self), field)
+        return getattr(self, field) if descriptor.is_cached(self) else None
+
 class UserCarRating(models.Model):
     """Oceny samochodów wystawione przez użytkowników"""
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -27,3 +133,39 @@ class UserCarRating(models.Model):
     
     def __str__(self):
         return f"{self.user.username} → {self.car} = {self.rating}/5"
+
+
+class Job(models.Model):
+    """
+    Zadanie w tle (przebudowa artefaktów) wykonywane przez manage.py run_worker.
+
+    Kolejka jest w bazie, więc nie wymaga zewnętrznego brokera.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Oczekuje'),
+        (RUNNING, 'W trakcie'),
+        (DONE, 'Zakończone'),
+        (FAILED, 'Błąd'),
+    ]
+
+    name = models.CharField(max_length=100)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    run_after = models.DateTimeField()
+    # Najpóźniejszy termin, do którego debounce może przesunąć run_after
+    run_by = models.DateTimeField(null=True, blank=True)
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['run_after']
+        indexes = [models.Index(fields=['status', 'run_after'])]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
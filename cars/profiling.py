@@ -0,0 +1,232 @@
+import cProfile
+import io
+import logging
+import pstats
+import random
+import threading
+import time
+from datetime import datetime
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .catalogue import artifacts_dir
+from .metrics import record_timing
+
+logger = logging.getLogger("cars.profiling")
+
+PROFILE_HEADER = "HTTP_X_PROFILE"
+PROFILES_DIRNAME = "profiles"
+PROFILE_SUFFIXES = (".prof", ".html")
+
+_sinks_lock = threading.Lock()
+_sinks = None
+
+
+def metrics_sink(stage, seconds):
+    """Domyślny odbiorca: Server-Timing i histogramy w /metrics."""
+    record_timing(stage, seconds)
+
+
+def log_sink(stage, seconds):
+    logger.info("%s %.3f ms", stage, seconds * 1000)
+
+
+def _configured_sinks():
+    paths = getattr(settings, "CARS_STAGE_SINKS", ["cars.profiling.metrics_sink"])
+    return [import_string(path) for path in paths]
+
+
+def get_sinks():
+    global _sinks
+    if _sinks is None:
+        with _sinks_lock:
+            if _sinks is None:
+                _sinks = _configured_sinks()
+    return _sinks
+
+
+def add_sink(sink):
+    """Dodaje odbiorcę czasów etapów: funkcję (nazwa_etapu, sekundy)."""
+    with _sinks_lock:
+        global _sinks
+        _sinks = [*(_sinks if _sinks is not None else _configured_sinks()), sink]
+
+
+def remove_sink(sink):
+    with _sinks_lock:
+        global _sinks
+        _sinks = [s for s in (_sinks if _sinks is not None else _configured_sinks()) if s is not sink]
+
+
+class StageTimer:
+    """
+    Czasy kolejnych etapów algorytmu bez zmiany struktury kodu.
+
+    Każde mark() zamyka etap trwający od poprzedniego mark() (albo od
+    utworzenia) i wysyła jego czas do wszystkich odbiorców.
+
+    Przykład:
+        timer = StageTimer("knn")
+        rows = list(queryset)
+        timer.mark("fetch")      # -> "knn.fetch"
+        X = scaler.fit_transform(rows)
+        timer.mark("scale")      # -> "knn.scale"
+    """
+
+    __slots__ = ("prefix", "last")
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.last = time.perf_counter()
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        seconds = now - self.last
+        self.last = now
+        name = f"{self.prefix}.{stage}"
+        for sink in get_sinks():
+            sink(name, seconds)
+        return seconds
+
+
+def _profiling_requested(request):
+    """
+    Profil jest zbierany, gdy żądanie ma nagłówek X-Profile (tylko z adresów
+    CARS_METRICS_ALLOWED_IPS) albo zostało wylosowane (CARS_PROFILE_SAMPLE_RATE).
+    """
+    mode = request.META.get(PROFILE_HEADER)
+    if mode:
+        allowed = getattr(settings, "CARS_METRICS_ALLOWED_IPS", ("127.0.0.1", "::1"))
+        if request.META.get("REMOTE_ADDR") in allowed:
+            return mode.lower()
+        return None
+    rate = getattr(settings, "CARS_PROFILE_SAMPLE_RATE", 0.0)
+    if rate and random.random() < rate:
+        return "cprofile"
+    return None
+
+
+def prune_profiles(directory, keep):
+    """
+    Usuwa najstarsze profile, zostawiając `keep` najnowszych.
+
+    Nazwy plików zaczynają się od znacznika czasu, więc kolejność nazw
+    jest kolejnością zapisu.
+
+    Returns:
+        liczba usuniętych plików
+    """
+    paths = sorted(path for path in directory.iterdir() if path.suffix in PROFILE_SUFFIXES)
+    stale = paths[:max(len(paths) - keep, 0)]
+    for path in stale:
+        path.unlink(missing_ok=True)  # równoległy worker mógł go już usunąć
+    return len(stale)
+
+
+class _Profiler:
+    """cProfile albo pyinstrument (jeśli zainstalowany i wybrany nagłówkiem)."""
+
+    def __init__(self, mode, async_mode=False):
+        self.kind = "cprofile"
+        if mode == "pyinstrument":
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                logger.warning("pyinstrument nie jest zainstalowany, używam cProfile")
+            else:
+                self.kind = "pyinstrument"
+                self.profiler = Profiler(async_mode="enabled" if async_mode else "disabled")
+        if self.kind == "cprofile":
+            self.profiler = cProfile.Profile()
+
+    def start(self):
+        if self.kind == "cprofile":
+            self.profiler.enable()
+        else:
+            self.profiler.start()
+
+    def stop(self):
+        if self.kind == "cprofile":
+            self.profiler.disable()
+        else:
+            self.profiler.stop()
+
+    def dump(self, request):
+        directory = artifacts_dir() / PROFILES_DIRNAME
+        directory.mkdir(exist_ok=True)
+        match = getattr(request, "resolver_match", None)
+        view = (match.url_name if match else None) or "unresolved"
+        stem = f"{datetime.now():%Y%m%d-%H%M%S-%f}-{view}"
+
+        if self.kind == "pyinstrument":
+            path = directory / f"{stem}.html"
+            path.write_text(self.profiler.output_html())
+            prune_profiles(directory, getattr(settings, "CARS_PROFILE_KEEP", 200))
+            return path, None
+
+        path = directory / f"{stem}.prof"
+        self.profiler.dump_stats(path)
+        prune_profiles(directory, getattr(settings, "CARS_PROFILE_KEEP", 200))
+        summary = io.StringIO()
+        pstats.Stats(self.profiler, stream=summary).sort_stats("cumulative").print_stats(15)
+        return path, summary.getvalue()
+
+
+class ProfilingMiddleware:
+    """
+    Profil pojedynczego żądania na życzenie, bez osobnego wdrożenia.
+
+    Nagłówek "X-Profile: cprofile" (albo "pyinstrument") zapisuje profil
+    do CARS_ARTIFACTS_DIR/profiles/, a nazwę pliku zwraca w nagłówku
+    X-Profile-File. Katalog trzyma najwyżej CARS_PROFILE_KEEP najnowszych
+    profili. Plik .prof otwiera się przez snakeviz albo
+    python -m pstats.
+
+    cProfile widzi tylko wątek obsługujący żądanie - obliczenia widoków
+    async wykonywane w puli wątków opisują czasy etapów (StageTimer).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        mode = _profiling_requested(request)
+        if mode is None:
+            return self.get_response(request)
+
+        profiler = _Profiler(mode)
+        profiler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.stop()
+        return self.finish(request, response, profiler)
+
+    async def __acall__(self, request):
+        mode = _profiling_requested(request)
+        if mode is None:
+            return await self.get_response(request)
+
+        profiler = _Profiler(mode, async_mode=True)
+        profiler.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profiler.stop()
+        return self.finish(request, response, profiler)
+
+    def finish(self, request, response, profiler):
+        path, summary = profiler.dump(request)
+        response["X-Profile-File"] = path.name
+        if summary:
+            logger.info("Profil %s %s -> %s\n%s", request.method, request.path, path, summary)
+        return response
@@ -0,0 +1,256 @@
+from asgiref.sync import sync_to_async
+
+from .admission import Overloaded, admission
+from .catalogue import get_catalogue_version
+from .executor import run_compute
+from .knn import find_top_similar_cars, find_top_similar_cars_batch
+from .metrics import record_cache, timed
+from .models import Brand, Car, CarModel
+from .records import get_catalogue_snapshot
+from .similar_cars import get_similar_cars_table
+from .singleflight import shared_result
+from .utils import fuel_type_filter, lookup_filter
+
+FEATURES = ["horsepower", "total_speed", "cars_price", "seats"]
+
+
+def apply_company_constraints(cars_queryset, constraints):
+    """Nakłada ograniczenia firmowe (CompanyConstraintsForm.cleaned_data) na queryset."""
+    if constraints.get('max_price') is not None:
+        cars_queryset = cars_queryset.filter(cars_price__lte=constraints['max_price'])
+    if constraints.get('min_price') is not None:
+        cars_queryset = cars_queryset.filter(cars_price__gte=constraints['min_price'])
+    if constraints.get('max_horsepower') is not None:
+        cars_queryset = cars_queryset.filter(horsepower__lte=constraints['max_horsepower'])
+    if constraints.get('min_horsepower') is not None:
+        cars_queryset = cars_queryset.filter(horsepower__gte=constraints['min_horsepower'])
+    if constraints.get('fuel_type'):
+        cars_queryset = cars_queryset.filter(fuel_type_filter(constraints['fuel_type']))
+    if constraints.get('max_seats') is not None:
+        cars_queryset = cars_queryset.filter(seats__lte=constraints['max_seats'])
+    if constraints.get('min_seats') is not None:
+        cars_queryset = cars_queryset.filter(seats__gte=constraints['min_seats'])
+    return cars_queryset
+
+
+def has_constraints(constraints):
+    """Czy ustawiono jakiekolwiek ograniczenie firmowe."""
+    return any(value not in (None, '') for value in constraints.values())
+
+
+def car_vector(car):
+    """Wektor cech auta bazowego (None dla brakujących wartości)."""
+    vector = {}
+    for field in FEATURES:
+        val = getattr(car, field)
+        try:
+            vector[field] = float(val) if val is not None else None
+        except (ValueError, TypeError):
+            vector[field] = None
+    return vector
+
+
+def find_base_car(company, model):
+    """Auto bazowe (najniższe id dla marki i modelu); ValueError, jeśli go nie ma."""
+    base_car = Car.objects.filter(
+        lookup_filter('brand', Brand, name=company),
+        lookup_filter('car_model', CarModel, name=model),
+    ).order_by('id').first()
+
+    if not base_car:
+        raise ValueError("❌ Nie znaleziono wybranego auta!")
+    return base_car
+
+
+def recommend_similar(company, model, constraints, top_n=5):
+    """
+    Zwraca TOP N aut podobnych do auta bazowego (marka + model),
+    spełniających ograniczenia firmowe.
+
+    Returns:
+        Lista dictów {'car': CarRecord, 'distance': float}
+    """
+    # 1. Znajdź auto bazowe
+    base_car = find_base_car(company, model)
+    return _hydrate(similar_car_ids(base_car, constraints, top_n=top_n))
+
+
+def similar_car_ids(base_car, constraints, top_n=5):
+    """
+    Sąsiedzi auta bazowego spełniający ograniczenia firmowe.
+
+    Returns:
+        Lista krotek (car_id, distance) posortowana rosnąco po odległości
+    """
+    # 2. Przygotuj wektor użytkownika (z auta bazowego)
+    user_vector = car_vector(base_car)
+
+    # 3. Bez ograniczeń: gotowa tabela sąsiadów (build_similar_cars)
+    if not has_constraints(constraints):
+        table = get_similar_cars_table()
+        top_results = table.lookup(base_car.id, top_n=top_n) if table is not None else None
+        record_cache("similar_cars", bool(top_results))
+        if top_results:
+            return top_results
+
+    # 4. Zastosuj ograniczenia firmowe
+    cars_queryset = apply_company_constraints(Car.objects.exclude(id=base_car.id), constraints)
+
+    # Sprawdź czy są dostępne auta po filtracji
+    if cars_queryset.count() == 0:
+        raise ValueError(
+            "⚠️ Brak aut spełniających ograniczenia firmowe! "
+            "Spróbuj złagodzić kryteria."
+        )
+
+    # 5. Znajdź TOP N podobnych aut
+    with timed("knn"):
+        return find_top_similar_cars(cars_queryset, user_vector, top_n=top_n)
+
+
+def canonical_constraints(constraints):
+    """
+    Ograniczenia firmowe w stałej postaci (posortowane, bez pustych wartości).
+
+    Przykład:
+        canonical_constraints({'max_price': 200000, 'fuel_type': ''}) -> (('max_price', '200000'),)
+    """
+    return tuple(sorted(
+        (field, str(value)) for field, value in constraints.items() if value not in (None, '')
+    ))
+
+
+def _shared_key(company, model, constraints, top_n):
+    base_car = find_base_car(company, model)
+    return base_car, ("similar", base_car.id, canonical_constraints(constraints), top_n, get_catalogue_version())
+
+
+async def recommend_similar_shared(company, model, constraints, top_n=5, admission_name=None):
+    """
+    recommend_similar dla widoków async: identyczne równoczesne żądania
+    (to samo auto bazowe, ograniczenia i wersja katalogu) dzielą jedno
+    obliczenie KNN w puli wątków, a wynik jest krótko trzymany w cache
+    (singleflight.shared_result).
+
+    Miejsce w limicie admission_name (admission.py) zajmuje tylko żądanie,
+    które faktycznie liczy - trafienia w cache i żądania czekające na
+    cudze obliczenie nie są liczone do limitu.
+
+    Raises:
+        Overloaded: limit zajęty; dostają go też żądania czekające na to obliczenie
+    """
+    base_car, key = await sync_to_async(_shared_key)(company, model, constraints, top_n)
+
+    async def compute():
+        async with admission(admission_name) as admitted:
+            if not admitted:
+                raise Overloaded(admission_name)
+            return await run_compute(similar_car_ids, base_car, constraints, top_n=top_n)
+
+    top_results = await shared_result(key, compute)
+    return await sync_to_async(_hydrate)(top_results)
+
+
+def recommend_similar_precomputed(company, model, constraints, top_n=5):
+    """
+    Wynik recommend_similar tylko z gotowej tabeli sąsiadów, bez KNN - tryb
+    awaryjny, gdy serwer jest przeciążony.
+
+    Returns:
+        Lista dictów jak w recommend_similar albo None, jeśli wynik wymaga
+        liczenia (ograniczenia firmowe, auto spoza tabeli)
+    """
+    if has_constraints(constraints):
+        return None
+    table = get_similar_cars_table()
+    if table is None:
+        return None
+    top_results = table.lookup(find_base_car(company, model).id, top_n=top_n)
+    record_cache("similar_cars", bool(top_results))
+    return _hydrate(top_results) if top_results else None
+
+
+def _hydrate(top_results):
+    """Zamienia listę (car_id, distance) na karty wyników ze snapshotu katalogu, zachowując kolejność."""
+    cars_by_id = get_catalogue_snapshot().in_bulk([car_id for car_id, _ in top_results])
+    return [
+        {'car': cars_by_id[car_id], 'distance': distance}
+        for car_id, distance in top_results
+        if car_id in cars_by_id
+    ]
+
+
+def recommend_similar_batch(base_cars, constraints, top_n=5):
+    """
+    Rekomendacje dla wielu aut bazowych naraz.
+
+    Auta bazowe są pobierane jednym zapytaniem, katalog jest standaryzowany
+    raz, a sąsiedzi wszystkich aut liczeni jednym wektorowym przebiegiem.
+
+    Args:
+        base_cars: lista par (company_name, car_name)
+        constraints: ograniczenia firmowe wspólne dla wszystkich aut
+        top_n: liczba rekomendacji na auto
+
+    Returns:
+        Lista dictów {'company_name', 'car_name', 'base_car', 'results', 'error'}
+        w kolejności base_cars; 'results' ma ten sam format co recommend_similar
+    """
+    companies = {company for company, _ in base_cars}
+    models = {model for _, model in base_cars}
+
+    # Pierwsze auto (najniższe id) dla każdej pary, jak .first() w recommend_similar
+    base_by_pair = {}
+    for car in Car.objects.filter(
+        lookup_filter('brand', Brand, name__in=companies),
+        lookup_filter('car_model', CarModel, name__in=models),
+    ).order_by('id'):
+        base_by_pair.setdefault((car.company_name, car.car_name), car)
+
+    entries = []
+    vectors = []
+    exclude_ids = []
+    for company, model in base_cars:
+        entry = {'company_name': company, 'car_name': model, 'base_car': None, 'results': [], 'error': None}
+        entries.append(entry)
+
+        base_car = base_by_pair.get((company, model))
+        if base_car is None:
+            entry['error'] = "❌ Nie znaleziono wybranego auta!"
+            continue
+
+        vector = car_vector(base_car)
+        missing = [field for field, value in vector.items() if value is None]
+        if missing:
+            entry['error'] = f"Brak wartości {missing[0]} w wektorze użytkownika!"
+            continue
+
+        entry['base_car'] = base_car
+        vectors.append(vector)
+        exclude_ids.append(base_car.id)
+
+    if not vectors:
+        return entries
+
+    cars_queryset = apply_company_constraints(Car.objects.all(), constraints)
+    try:
+        with timed("knn_batch"):
+            neighbours = find_top_similar_cars_batch(cars_queryset, vectors, top_n=top_n, exclude_ids=exclude_ids)
+    except ValueError:
+        neighbours = [[] for _ in vectors]
+
+    cars_by_id = get_catalogue_snapshot().in_bulk({car_id for row in neighbours for car_id, _ in row})
+
+    ready = (entry for entry in entries if entry['base_car'] is not None)
+    for entry, row in zip(ready, neighbours):
+        entry['results'] = [
+            {'car': cars_by_id[car_id], 'distance': distance}
+            for car_id, distance in row
+            if car_id in cars_by_id
+        ]
+        if not entry['results']:
+            entry['error'] = (
+                "⚠️ Brak aut spełniających ograniczenia firmowe! "
+                "Spróbuj złagodzić kryteria."
+            )
+    return entries
@@ -0,0 +1,289 @@
+import json
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from .catalogue import VersionedArtifact, artifacts_dir, atomic_write_bytes, get_catalogue_version
+from .metrics import record_cache
+from .models import Car
+
+NUMERIC_FIELDS = ("horsepower", "total_speed", "cars_price", "seats")
+STRING_FIELDS = ("company_name", "car_name", "engine", "fuel_type")
+INTEGER_FIELDS = ("total_speed", "seats")
+
+SNAPSHOT_FIELDS = ("id",) + STRING_FIELDS + NUMERIC_FIELDS
+
+SNAPSHOT_MANIFEST = "catalogue.snapshot.json"
+SNAPSHOT_DATA = "catalogue-{version}.bin"
+
+
+class CarRecord(NamedTuple):
+    """
+    Lekka, tylko do odczytu reprezentacja auta dla ścieżek odczytu
+    (karty wyników, KNN). Ma te same nazwy pól co model Car, więc
+    szablony działają bez zmian.
+    """
+
+    id: int
+    company_name: Optional[str]
+    car_name: Optional[str]
+    engine: Optional[str]
+    horsepower: Optional[float]
+    total_speed: Optional[int]
+    cars_price: Optional[float]
+    fuel_type: Optional[str]
+    seats: Optional[int]
+
+    @property
+    def pk(self):
+        return self.id
+
+    def __str__(self):
+        return f"{self.company_name} {self.car_name}"
+
+
+class CatalogueSnapshot:
+    """
+    Katalog aut w układzie struct-of-arrays.
+
+    Id i cechy liczbowe to tablice numpy (NaN = brak wartości), a kolumny
+    tekstowe są zakodowane słownikowo: tablica kodów int32 + lista
+    unikalnych wartości (kod 0 = None). Budowany jednym zapytaniem
+    values_list, bez tworzenia instancji modelu.
+    """
+
+    def __init__(self, ids, numeric, codes, dictionaries):
+        self.ids = ids
+        self.numeric = numeric
+        self.codes = codes
+        self.dictionaries = dictionaries
+
+    @classmethod
+    def from_rows(cls, rows):
+        rows = list(rows)
+        columns = list(zip(*rows)) if rows else [()] * len(SNAPSHOT_FIELDS)
+
+        ids = np.array(columns[0], dtype=np.int64)
+        order = np.argsort(ids, kind="stable")
+        ids = ids[order]
+
+        codes = {}
+        dictionaries = {}
+        for offset, field in enumerate(STRING_FIELDS, start=1):
+            lookup = {None: 0}
+            dictionary = [None]
+            field_codes = np.empty(len(rows), dtype=np.int32)
+            for i, value in enumerate(columns[offset]):
+                code = lookup.get(value)
+                if code is None:
+                    code = lookup[value] = len(dictionary)
+                    dictionary.append(value)
+                field_codes[i] = code
+            codes[field] = field_codes[order]
+            dictionaries[field] = dictionary
+
+        numeric = {}
+        for offset, field in enumerate(NUMERIC_FIELDS, start=1 + len(STRING_FIELDS)):
+            values = np.array(
+                [np.nan if value is None else value for value in columns[offset]],
+                dtype=np.float64,
+            )
+            numeric[field] = values[order]
+
+        return cls(ids, numeric, codes, dictionaries)
+
+    @classmethod
+    def from_database(cls):
+        return cls.from_rows(Car.objects.values_list(*SNAPSHOT_FIELDS).iterator())
+
+    def columns(self):
+        """Wszystkie tablice snapshotu jako (nazwa, tablica)."""
+        yield "id", self.ids
+        for field in NUMERIC_FIELDS:
+            yield field, self.numeric[field]
+        for field in STRING_FIELDS:
+            yield f"{field}_code", self.codes[field]
+
+    def to_bytes(self):
+        """
+        Serializuje tablice kolumna po kolumnie (wyrównane do 8 bajtów).
+
+        Returns:
+            (dane binarne, opis kolumn {nazwa: {dtype, offset}})
+        """
+        chunks = []
+        layout = {}
+        offset = 0
+        for name, values in self.columns():
+            data = np.ascontiguousarray(values).tobytes()
+            padding = -len(data) % 8
+            layout[name] = {"dtype": values.dtype.str, "offset": offset}
+            chunks.append(data + b"\0" * padding)
+            offset += len(data) + padding
+        return b"".join(chunks), layout
+
+    @classmethod
+    def from_file(cls, path, count, layout, dictionaries):
+        """Otwiera snapshot przez np.memmap tylko do odczytu (bez kopiowania do pamięci procesu)."""
+        def column(name):
+            spec = layout[name]
+            if count == 0:
+                return np.empty(0, dtype=spec["dtype"])
+            return np.memmap(path, dtype=spec["dtype"], mode="r", offset=spec["offset"], shape=(count,))
+
+        return cls(
+            column("id"),
+            {field: column(field) for field in NUMERIC_FIELDS},
+            {field: column(f"{field}_code") for field in STRING_FIELDS},
+            dictionaries,
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self):
+        """Rozmiar tablic (bez słowników wartości tekstowych)."""
+        return (
+            self.ids.nbytes
+            + sum(values.nbytes for values in self.numeric.values())
+            + sum(values.nbytes for values in self.codes.values())
+        )
+
+    def positions(self, car_ids):
+        """Pozycje aut w tablicach (-1 dla nieznanych id)."""
+        car_ids = np.asarray(car_ids, dtype=np.int64)
+        positions = np.searchsorted(self.ids, car_ids)
+        positions = np.minimum(positions, max(len(self.ids) - 1, 0))
+        found = len(self.ids) > 0 and (self.ids[positions] == car_ids)
+        return np.where(found, positions, -1)
+
+    def record_at(self, position):
+        values = {"id": int(self.ids[position])}
+        for field in STRING_FIELDS:
+            values[field] = self.dictionaries[field][self.codes[field][position]]
+        for field in NUMERIC_FIELDS:
+            value = self.numeric[field][position]
+            if np.isnan(value):
+                values[field] = None
+            elif field in INTEGER_FIELDS:
+                values[field] = int(value)
+            else:
+                values[field] = float(value)
+        return CarRecord(**values)
+
+    def in_bulk(self, car_ids):
+        """Odpowiednik Car.objects.in_bulk zwracający CarRecord."""
+        car_ids = list(car_ids)
+        return {
+            car_id: self.record_at(position)
+            for car_id, position in zip(car_ids, self.positions(car_ids))
+            if position >= 0
+        }
+
+    def feature_matrix(self, features, mask=None):
+        """
+        Macierz cech dla aut z kompletem wartości.
+
+        Returns:
+            (X, ids) - X ma kształt (liczba aut, len(features))
+        """
+        X = np.column_stack([self.numeric[field] for field in features])
+        complete = ~np.isnan(X).any(axis=1)
+        if mask is not None:
+            complete &= mask
+        return X[complete], self.ids[complete]
+
+
+def save_catalogue_snapshot():
+    """
+    Zapisuje snapshot bieżącej wersji katalogu do katalogu artefaktów.
+
+    Dane trafiają do pliku catalogue-<wersja>.bin, a dopiero potem
+    podmieniany jest (przez rename) manifest wskazujący bieżący plik,
+    więc workery widzą zawsze kompletny snapshot. Stare pliki danych są
+    usuwane - workery, które mają je zmapowane, czytają dalej
+    z odłączonego i-węzła do czasu przełączenia na nową wersję.
+
+    Returns:
+        Ścieżka do pliku danych
+    """
+    # Wersja przed odczytem bazy: zmiana w trakcie budowy podbije ją
+    # i snapshot zostanie uznany za nieaktualny
+    version = get_catalogue_version()
+    snapshot = CatalogueSnapshot.from_database()
+    data, layout = snapshot.to_bytes()
+
+    directory = artifacts_dir()
+    data_path = directory / SNAPSHOT_DATA.format(version=version)
+    atomic_write_bytes(data_path, data)
+
+    manifest = {
+        "version": version,
+        "data": data_path.name,
+        "count": len(snapshot),
+        "layout": layout,
+        "dictionaries": snapshot.dictionaries,
+    }
+    atomic_write_bytes(directory / SNAPSHOT_MANIFEST, json.dumps(manifest).encode())
+
+    for stale in directory.glob(SNAPSHOT_DATA.format(version="*")):
+        if stale != data_path:
+            stale.unlink(missing_ok=True)
+    return data_path
+
+
+_shared = {"key": None, "version": None, "snapshot": None}
+
+
+def load_shared_snapshot():
+    """
+    Snapshot zmapowany z pliku, jeśli manifest pasuje do bieżącej wersji
+    katalogu, w przeciwnym razie None.
+
+    Manifest jest czytany ponownie tylko po zmianie jego mtime, więc
+    workery przełączają się na nową wersję bez restartu.
+    """
+    path = artifacts_dir() / SNAPSHOT_MANIFEST
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+
+    key = (stat.st_mtime_ns, stat.st_size)
+    if _shared["key"] != key:
+        try:
+            manifest = json.loads(path.read_text())
+            _shared["snapshot"] = CatalogueSnapshot.from_file(
+                path.parent / manifest["data"],
+                manifest["count"],
+                manifest["layout"],
+                manifest["dictionaries"],
+            )
+            _shared["version"] = manifest["version"]
+        except (OSError, ValueError, KeyError):
+            _shared["snapshot"] = None
+            _shared["version"] = None
+        _shared["key"] = key
+
+    if _shared["version"] != get_catalogue_version():
+        return None
+    return _shared["snapshot"]
+
+
+_snapshot = VersionedArtifact(CatalogueSnapshot.from_database, name="catalogue_snapshot")
+
+
+def get_catalogue_snapshot():
+    """
+    Snapshot dla bieżącej wersji katalogu.
+
+    Najpierw wspólny plik (build_snapshot / import_cars), a gdy go nie ma
+    albo jest nieaktualny - kopia zbudowana w pamięci procesu.
+    """
+    snapshot = load_shared_snapshot()
+    if snapshot is not None:
+        record_cache("catalogue_snapshot_shared", True)
+        return snapshot
+    record_cache("catalogue_snapshot_shared", False)
+    return _snapshot.get()
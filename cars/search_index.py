@@ -0,0 +1,220 @@
+import heapq
+import re
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from .catalogue import VersionedArtifact
+from .models import Car
+
+TOKEN_RE = re.compile(r"[0-9a-ząćęłńóśźż]+")
+
+# Wagi dopasowań pojedynczego słowa zapytania
+EXACT_SCORE = 1.0
+PREFIX_SCORE = 0.8
+FUZZY_SCORE = 0.6
+
+MIN_FUZZY_SIMILARITY = 0.4
+MIN_FUZZY_LENGTH = 3
+
+
+def tokenize(text):
+    """Dzieli tekst na małe litery i cyfry (bez interpunkcji)."""
+    if not text:
+        return []
+    return TOKEN_RE.findall(str(text).lower())
+
+
+def trigrams(token):
+    """Zwraca zbiór trigramów słowa z dopełnieniem na brzegach."""
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CarSearchIndex:
+    """
+    Indeks pełnotekstowy nad marką, modelem i silnikiem aut.
+
+    Trzyma posortowany słownik słów (autouzupełnianie przez bisect),
+    listy wystąpień słowo -> id aut oraz indeks trigramów słowo -> słowa,
+    który pozwala tolerować literówki.
+    """
+
+    def __init__(self, rows):
+        postings = defaultdict(set)
+        for car_id, company_name, car_name, engine in rows:
+            for token in tokenize(f"{company_name or ''} {car_name or ''} {engine or ''}"):
+                postings[token].add(car_id)
+
+        self.postings = dict(postings)
+        self.vocabulary = sorted(self.postings)
+
+        self.trigram_index = defaultdict(set)
+        for token in self.vocabulary:
+            for gram in trigrams(token):
+                self.trigram_index[gram].add(token)
+
+    @classmethod
+    def from_database(cls):
+        rows = Car.objects.values_list("id", "company_name", "car_name", "engine")
+        return cls(rows.iterator())
+
+    def prefix_tokens(self, prefix, limit=None):
+        """Słowa zaczynające się od prefiksu, w kolejności alfabetycznej."""
+        start = bisect_left(self.vocabulary, prefix)
+        matches = []
+        for token in self.vocabulary[start:]:
+            if not token.startswith(prefix):
+                break
+            matches.append(token)
+            if limit is not None and len(matches) >= limit:
+                break
+        return matches
+
+    def fuzzy_tokens(self, token):
+        """Słowa podobne do token według podobieństwa Jaccarda trigramów."""
+        if len(token) < MIN_FUZZY_LENGTH:
+            return []
+
+        query_grams = trigrams(token)
+        shared = defaultdict(int)
+        for gram in query_grams:
+            for candidate in self.trigram_index.get(gram, ()):
+                shared[candidate] += 1
+
+        matches = []
+        for candidate, common in shared.items():
+            union = len(query_grams) + len(trigrams(candidate)) - common
+            similarity = common / union
+            if similarity >= MIN_FUZZY_SIMILARITY:
+                matches.append((candidate, similarity))
+        return matches
+
+    def _token_scores(self, token):
+        """Zwraca {słowo_z_indeksu: wynik} dla jednego słowa zapytania."""
+        scores = {}
+        for candidate, similarity in self.fuzzy_tokens(token):
+            scores[candidate] = FUZZY_SCORE * similarity
+        for candidate in self.prefix_tokens(token):
+            scores[candidate] = max(
+                scores.get(candidate, 0.0),
+                PREFIX_SCORE * len(token) / len(candidate),
+            )
+        if token in self.postings:
+            scores[token] = EXACT_SCORE
+        return scores
+
+    def search(self, query, limit=50):
+        """
+        Wyszukuje auta pasujące do zapytania.
+
+        Każde słowo zapytania może pasować dokładnie, jako prefiks
+        albo z literówką. Auta pasujące do większej liczby słów są wyżej.
+
+        Args:
+            query: tekst zapytania
+            limit: maksymalna liczba wyników (None = wszystkie pasujące auta)
+
+        Returns:
+            Lista id aut posortowana od najlepszego dopasowania
+        """
+        query_tokens = tokenize(query)
+        if not query_tokens:
+            return []
+
+        matched = defaultdict(int)
+        scores = defaultdict(float)
+
+        for token in query_tokens:
+            best_per_car = {}
+            for candidate, score in self._token_scores(token).items():
+                for car_id in self.postings[candidate]:
+                    if score > best_per_car.get(car_id, 0.0):
+                        best_per_car[car_id] = score
+            for car_id, score in best_per_car.items():
+                matched[car_id] += 1
+                scores[car_id] += score
+
+        ranked = sorted(scores, key=lambda car_id: (-matched[car_id], -scores[car_id], car_id))
+        return ranked if limit is None else ranked[:limit]
+
+    def autocomplete(self, prefix, limit=10):
+        """Podpowiada słowa z katalogu dla ostatniego wpisywanego słowa."""
+        tokens = tokenize(prefix)
+        if not tokens:
+            return []
+        return self.prefix_tokens(tokens[-1], limit=limit)
+
+
+SUGGEST_FIELDS = ("company_name", "car_name", "engine")
+
+
+class SuggestIndex:
+    """
+    Podpowiedzi nazw (marka, model, silnik) dla pola typeahead.
+
+    Nazwy są trzymane w posortowanej tablicy kluczy pisanych małymi
+    literami, więc wszystkie nazwy z danym prefiksem to jeden ciągły
+    przedział znaleziony przez bisect.
+    """
+
+    def __init__(self, rows):
+        counts = Counter()
+        for row in rows:
+            for field, value in zip(SUGGEST_FIELDS, row):
+                if value:
+                    counts[(field, value)] += 1
+
+        entries = sorted(
+            (value.lower(), field, value, count)
+            for (field, value), count in counts.items()
+        )
+        self.keys = [entry[0] for entry in entries]
+        self.entries = entries
+        self.names = {(field, value) for field, value in counts}
+
+    @classmethod
+    def from_database(cls):
+        return cls(Car.objects.values_list(*SUGGEST_FIELDS).iterator())
+
+    def contains(self, field, value):
+        return (field, value) in self.names
+
+    def suggest(self, prefix, field=None, limit=10):
+        """
+        Zwraca do limit nazw zaczynających się od prefix, najczęstsze najpierw.
+
+        Returns:
+            Lista dictów {value, field, count}
+        """
+        prefix = (prefix or "").strip().lower()
+        if not prefix:
+            return []
+
+        start = bisect_left(self.keys, prefix)
+        end = bisect_left(self.keys, prefix + "\uffff", lo=start)
+        candidates = (
+            entry for entry in self.entries[start:end]
+            if field is None or entry[1] == field
+        )
+        top = heapq.nsmallest(limit, candidates, key=lambda entry: (-entry[3], entry[0]))
+        return [
+            {"value": value, "field": entry_field, "count": count}
+            for _, entry_field, value, count in top
+        ]
+
+
+_search_index = VersionedArtifact(CarSearchIndex.from_database, name="search_index")
+_suggest_index = VersionedArtifact(SuggestIndex.from_database, name="suggest_index")
+
+
+def get_search_index():
+    """Zwraca indeks dla bieżącej wersji katalogu (przebudowywany po zmianach)."""
+    return _search_index.get()
+
+
+def search_car_ids(query, limit=50):
+    return get_search_index().search(query, limit=limit)
+
+
+def get_suggest_index():
+    return _suggest_index.get()
@@ -0,0 +1,35 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .catalogue import (
+    bump_catalogue_version_on_commit, bump_ratings_version_on_commit, catalogue_changed, ratings_changed,
+)
+from .jobs import CATALOGUE_JOBS, RATINGS_JOBS, enqueue_many
+from .models import Car, UserCarRating
+
+
+@receiver(post_save, sender=Car)
+@receiver(post_delete, sender=Car)
+def car_changed(sender, instance, **kwargs):
+    """
+    Każda zmiana auta unieważnia indeksy zbudowane na katalogu - po
+    zatwierdzeniu transakcji, żeby wycofane zapisy nie trafiły do artefaktów.
+    """
+    bump_catalogue_version_on_commit(car_ids=[instance.pk])
+
+
+@receiver(post_save, sender=UserCarRating)
+@receiver(post_delete, sender=UserCarRating)
+def rating_changed(sender, instance, **kwargs):
+    bump_ratings_version_on_commit(car_ids=[instance.car_id])
+
+
+@receiver(catalogue_changed)
+def schedule_catalogue_rebuild(sender, **kwargs):
+    """Przebudowa artefaktów katalogu w tle (run_worker), z opóźnieniem."""
+    enqueue_many(CATALOGUE_JOBS)
+
+
+@receiver(ratings_changed)
+def schedule_ratings_rebuild(sender, **kwargs):
+    enqueue_many(RATINGS_JOBS)
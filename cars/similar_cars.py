@@ -0,0 +1,125 @@
+import io
+
+import numpy as np
+
+from .catalogue import artifacts_dir, atomic_write_bytes, get_catalogue_version
+from .knn import find_top_similar_cars_batch
+from .models import Car
+from .records import get_catalogue_snapshot
+
+SIMILAR_CARS_FILENAME = "similar_cars.npz"
+DEFAULT_TOP_K = 20
+
+FEATURES = ['horsepower', 'total_speed', 'cars_price', 'seats']
+
+_memo = {"key": None, "table": None}
+
+
+class SimilarCarsTable:
+    """
+    TOP K najbardziej podobnych aut dla każdego auta z katalogu
+    (bez ograniczeń firmowych), w tej samej metryce co find_top_similar_cars.
+
+    Trzymane jako trzy tablice: posortowane id aut, macierz id sąsiadów
+    (-1 = brak) i macierz odległości (float32).
+    """
+
+    def __init__(self, version, car_ids, neighbour_ids, distances):
+        self.version = version
+        self.car_ids = car_ids
+        self.neighbour_ids = neighbour_ids
+        self.distances = distances
+
+    @property
+    def top_k(self):
+        return self.neighbour_ids.shape[1]
+
+    def lookup(self, car_id, top_n=5):
+        """
+        Returns:
+            Lista krotek (car_id, distance) albo None, jeśli auta nie ma w tabeli
+            lub tabela ma mniej niż top_n sąsiadów na auto
+        """
+        if top_n > self.top_k:
+            return None
+        row = np.searchsorted(self.car_ids, car_id)
+        if row >= len(self.car_ids) or self.car_ids[row] != car_id:
+            return None
+        return [
+            (int(neighbour), float(distance))
+            for neighbour, distance in zip(self.neighbour_ids[row, :top_n], self.distances[row, :top_n])
+            if neighbour >= 0
+        ]
+
+    def to_bytes(self):
+        buffer = io.BytesIO()
+        np.savez(
+            buffer,
+            version=np.array(self.version),
+            car_ids=self.car_ids,
+            neighbour_ids=self.neighbour_ids,
+            distances=self.distances,
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_file(cls, path):
+        with np.load(path) as data:
+            return cls(
+                int(data["version"]),
+                data["car_ids"],
+                data["neighbour_ids"],
+                data["distances"],
+            )
+
+
+def build_similar_cars_table(top_k=DEFAULT_TOP_K, block_size=256):
+    """Liczy tabelę sąsiadów dla całego katalogu (jedno przejście wsadowe)."""
+    version = get_catalogue_version()
+    X, car_ids = get_catalogue_snapshot().feature_matrix(FEATURES)
+
+    neighbour_ids = np.full((len(car_ids), top_k), -1, dtype=np.int64)
+    distances = np.full((len(car_ids), top_k), np.inf, dtype=np.float32)
+
+    if len(car_ids):
+        vectors = [dict(zip(FEATURES, row)) for row in X]
+        rows = find_top_similar_cars_batch(
+            Car.objects.all(), vectors, top_n=top_k, exclude_ids=list(car_ids), block_size=block_size
+        )
+        for i, row in enumerate(rows):
+            for j, (neighbour, distance) in enumerate(row):
+                neighbour_ids[i, j] = neighbour
+                distances[i, j] = distance
+
+    return SimilarCarsTable(version, car_ids, neighbour_ids, distances)
+
+
+def save_similar_cars_table(table):
+    path = artifacts_dir() / SIMILAR_CARS_FILENAME
+    atomic_write_bytes(path, table.to_bytes())
+    return path
+
+
+def get_similar_cars_table():
+    """
+    Zwraca tabelę, jeśli istnieje i pasuje do bieżącej wersji katalogu,
+    w przeciwnym razie None (wtedy trzeba liczyć KNN na żywo).
+    """
+    path = artifacts_dir() / SIMILAR_CARS_FILENAME
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+
+    key = (stat.st_mtime_ns, stat.st_size)
+    if _memo["key"] != key:
+        try:
+            _memo["table"] = SimilarCarsTable.from_file(path)
+        except (OSError, ValueError, KeyError):
+            _memo["table"] = None
+        _memo["key"] = key
+
+    table = _memo["table"]
+    if table is None or table.version != get_catalogue_version():
+        return None
+    return table
@@ -0,0 +1,129 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .metrics import record_cache
+
+# Jak często worker czekający na cudze obliczenie sprawdza wynik w cache
+POLL_INTERVAL = 0.05
+
+_MISSING = object()
+
+
+class SingleFlight:
+    """
+    Łączy równoczesne identyczne obliczenia w jednym procesie: pierwsze
+    żądanie liczy, kolejne z tym samym kluczem czekają na jego wynik
+    (albo wyjątek) zamiast zajmować pulę obliczeń.
+
+    Działa między pętlami zdarzeń i wątkami (wspólny concurrent.futures.Future).
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    async def do(self, key, func):
+        """
+        Wynik func() (funkcji async) wspólny dla równoczesnych wywołań z tym samym kluczem.
+
+        Returns:
+            (wynik, czy wynik pochodzi z cudzego wywołania)
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                if call is None:
+                    call = self._calls[key] = concurrent.futures.Future()
+                    break
+            try:
+                return await asyncio.shield(asyncio.wrap_future(call)), True
+            except asyncio.CancelledError:
+                if not call.cancelled():
+                    raise
+                # Liczące żądanie zostało przerwane - liczymy od nowa
+
+        try:
+            result = await func()
+        except Exception as exc:
+            call.set_exception(exc)
+            raise
+        except BaseException:
+            call.cancel()
+            raise
+        else:
+            call.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+_flights = SingleFlight()
+
+
+def _cache_key(key):
+    # Klucz dowolnej długości i treści -> bezpieczny dla memcached/Redis
+    return "cars:flight:" + hashlib.sha1(repr(key).encode()).hexdigest()
+
+
+async def shared_result(key, compute):
+    """
+    Wynik obliczenia wspólny dla identycznych równoczesnych żądań.
+
+    Kolejność:
+    1. wynik w cache (CARS_SINGLEFLIGHT_TTL sekund po obliczeniu),
+    2. obliczenie już trwające w tym procesie (SingleFlight),
+    3. blokada w cache (cache.add) - inne workery czekają na wynik w cache
+       zamiast liczyć; po CARS_SINGLEFLIGHT_LOCK_TIMEOUT (np. po awarii
+       workera z blokadą) liczą same.
+
+    Klucz musi zawierać wszystko, od czego zależy wynik (np. wersję
+    katalogu), bo wynik nie jest unieważniany.
+
+    Args:
+        key: krotka opisująca obliczenie
+        compute: funkcja async bez argumentów zwracająca wynik (picklowalny)
+
+    Przykład:
+        top = await shared_result(("similar", car.id, version), lambda: run_compute(similar_car_ids, car, {}))
+    """
+    result, shared = await _flights.do(key, lambda: _compute_once(_cache_key(key), compute))
+    record_cache("singleflight", shared)
+    return result
+
+
+async def _compute_once(cache_key, compute):
+    ttl = getattr(settings, "CARS_SINGLEFLIGHT_TTL", 30)
+    lock_timeout = getattr(settings, "CARS_SINGLEFLIGHT_LOCK_TIMEOUT", 10)
+    lock_key = cache_key + ":lock"
+    deadline = time.monotonic() + lock_timeout
+
+    locked = False
+    try:
+        while True:
+            result = await cache.aget(cache_key, _MISSING)
+            if result is not _MISSING:
+                # Także po zdobyciu blokady: poprzedni właściciel mógł właśnie zapisać wynik
+                record_cache("singleflight_result", True)
+                return result
+            if locked or time.monotonic() >= deadline:
+                break
+            locked = await cache.aadd(lock_key, os.getpid(), lock_timeout)
+            if not locked:
+                await asyncio.sleep(POLL_INTERVAL)
+
+        record_cache("singleflight_result", False)
+        result = await compute()
+        if ttl:
+            await cache.aset(cache_key, result, ttl)
+        return result
+    finally:
+        if locked:
+            await cache.adelete(lock_key)
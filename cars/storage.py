@@ -0,0 +1,26 @@
+import logging
+
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+logger = logging.getLogger(__name__)
+
+
+class StaticFilesStorage(CompressedManifestStaticFilesStorage):
+    """
+    Pliki statyczne z hashem treści w nazwie (style.3f2a9c.css) oraz
+    wersjami .gz/.br przygotowanymi przy collectstatic.
+
+    Nazwy z hashem zmieniają się razem z treścią, więc WhiteNoise wysyła je
+    z Cache-Control na rok (immutable). Bez manifestu (lokalnie przed
+    collectstatic, testy) {% static %} zwraca zwykłą nazwę pliku zamiast
+    rzucać wyjątek.
+    """
+
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            logger.debug("Brak %s w manifeście plików statycznych", name)
+            return name
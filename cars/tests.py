@@ -1,3 +1,1491 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import importlib
+import json
+import os
+import pickle
+import runpy
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+from unittest import skipUnless
+from unittest.mock import patch
 
-# Create your tests here.
+import numpy as np
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.templatetags.static import static
+from django.test import LiveServerTestCase, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .admission import AdmissionLimiter, get_limiter
+from .benchmarks import (
+    BenchmarkContext, bench_import, build_report, compare_reports, measure_startup, populate_catalogue, populate_ratings,
+    run_benchmarks,
+)
+from .catalogue import (
+    batch_update, bump_catalogue_version, catalogue_changes_since, get_catalogue_version,
+    get_ratings_version, sync_schema_version,
+)
+from .compression import brotli
+from .collaborative_filtering import (
+    RatingsMatrix, get_all_ratings_by_user, get_ratings_matrix, get_top_rated_cars, recommend_cars_collaborative,
+)
+from .facets import FacetStats, get_facet_stats
+from .images import build_derivatives, find_sources
+from .hybrid import recommend_cars_hybrid
+from .jobs import CATALOGUE_JOBS, enqueue, run_pending
+from .leaderboards import LEADERBOARDS_FILENAME, Leaderboards, get_leaderboards, refresh_leaderboards
+from .knn import _find_top_similar_cars_exact, find_top_similar_cars
+from .loadtest import Scenarios, parse_mix, percentile, read_replay_log, run_load
+from .metrics import registry
+from .profiling import StageTimer, add_sink, get_sinks, metrics_sink, remove_sink
+from .models import Brand, Car, FuelType, Job, UserCarRating
+from .records import CarRecord, CatalogueSnapshot, get_catalogue_snapshot, load_shared_snapshot, save_catalogue_snapshot
+from .recommendations import car_vector, recommend_similar_shared, similar_car_ids
+from .singleflight import shared_result
+from .search_index import CarSearchIndex, SuggestIndex, get_search_index, get_suggest_index, search_car_ids
+from .similar_cars import build_similar_cars_table, get_similar_cars_table, save_similar_cars_table
+from .utils import apply_text_search
+from .views import MAX_BATCH_CARS, MAX_BATCH_TOP_N
+from .vector_store import DTYPES, FEATURES as VECTOR_FEATURES, VectorStore
+from . import singleflight, warmup
+
+class IsolatedArtifactsMixin:
+    """
+    Własny, pusty katalog artefaktów (CARS_ARTIFACTS_DIR) dla każdej klasy
+    testów (setUpTestData) i każdego testu - baza testów jest wycofywana,
+    więc artefakty zbudowane przez inne testy nie mogą przetrwać.
+
+    Obliczenia widoków async wykonywane są w wątku żądania (CARS_COMPUTE_WORKERS=0).
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.artifacts_settings = cls._isolated_artifacts(cls.addClassCleanup)
+        super().setUpClass()
+
+    def setUp(self):
+        self._isolated_artifacts(self.addCleanup)
+        super().setUp()
+
+    @staticmethod
+    def _isolated_artifacts(add_cleanup):
+        directory = tempfile.TemporaryDirectory()
+        add_cleanup(directory.cleanup)
+        overridden = override_settings(CARS_ARTIFACTS_DIR=directory.name, CARS_COMPUTE_WORKERS=0)
+        overridden.enable()
+        add_cleanup(overridden.disable)
+        return overridden
+
+
+def create_cars(count, company_name="Marka"):
+    return [
+        Car.objects.create(
+            company_name=company_name,
+            car_name=f"Model {i}",
+            engine="V8" if i % 2 else "R4",
+            horsepower=100 + 10 * i,
+            total_speed=180 + 5 * i,
+            cars_price=50000 + 7000 * i,
+            fuel_type="Petrol" if i % 3 else "Diesel",
+            seats=2 + i % 5,
+        )
+        for i in range(count)
+    ]
+
+
+class RecommendQueryCountTests(IsolatedArtifactsMixin, TestCase):
+    """Strona rekomendacji wykonuje stałą liczbę zapytań niezależnie od wyników."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cars = create_cars(30)
+
+    def setUp(self):
+        super().setUp()
+        # Fragmenty szablonów i wyniki KNN (singleflight) z innych testów
+        # ukryłyby zapytania o listy wyborów i o katalog
+        caches["template_fragments"].clear()
+        caches["default"].clear()
+
+    def post_recommend(self, **constraints):
+        data = {"company_name": "Marka", "car_name": "Model 3", **constraints}
+        return self.client.post(reverse("recommend_car"), data)
+
+    def test_live_knn_results_are_fetched_in_bulk(self):
+        get_catalogue_snapshot()
+        with self.assertNumQueries(5):
+            response = self.post_recommend(max_price=1000000)
+        self.assertEqual(len(response.context["result_cars"]), 5)
+
+    def test_results_keep_rank_order(self):
+        response = self.post_recommend(max_price=1000000)
+        distances = [item["distance"] for item in response.context["result_cars"]]
+        self.assertEqual(distances, sorted(distances))
+
+    def test_precomputed_table_results_are_fetched_in_bulk(self):
+        save_similar_cars_table(build_similar_cars_table(top_k=10))
+        with self.assertNumQueries(3):
+            response = self.post_recommend()
+        result_cars = response.context["result_cars"]
+        self.assertEqual(len(result_cars), 5)
+        self.assertNotIn(self.cars[3].id, [item["car"].id for item in result_cars])
+
+
+class SimilarCarsTableTests(IsolatedArtifactsMixin, TestCase):
+    """Tabela sąsiadów daje ranking KNN na żywo i przestaje obowiązywać po zmianie katalogu."""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Losowe cechy: w create_cars sąsiedzi z obu stron są równo odlegli,
+        # a remisy każda implementacja KNN rozstrzyga inaczej
+        rng = np.random.default_rng(7)
+        cls.cars = [
+            Car.objects.create(
+                company_name="Marka",
+                car_name=f"Model {i}",
+                horsepower=int(rng.integers(80, 600)),
+                total_speed=int(rng.integers(150, 330)),
+                cars_price=int(rng.integers(30000, 900000)),
+                seats=int(rng.integers(2, 8)),
+            )
+            for i in range(30)
+        ]
+
+    def setUp(self):
+        super().setUp()
+        self.table = build_similar_cars_table(top_k=10)
+        save_similar_cars_table(self.table)
+
+    def live_knn(self, car, top_n=5):
+        return find_top_similar_cars(Car.objects.exclude(id=car.id), car_vector(car), top_n=top_n)
+
+    def assertSameRanking(self, found, expected):
+        self.assertEqual([car_id for car_id, _ in found], [car_id for car_id, _ in expected])
+        for (_, distance), (_, expected_distance) in zip(found, expected):
+            self.assertAlmostEqual(distance, expected_distance, places=4)
+
+    def test_lookup_matches_live_knn(self):
+        for car in self.cars:
+            self.assertSameRanking(self.table.lookup(car.id, top_n=5), self.live_knn(car))
+        self.assertSameRanking(similar_car_ids(self.cars[3], {}, top_n=5), self.live_knn(self.cars[3]))
+
+    def test_lookup_needs_known_car_and_enough_neighbours(self):
+        self.assertIsNone(self.table.lookup(self.cars[-1].id + 1000))
+        self.assertIsNone(self.table.lookup(self.cars[0].id, top_n=11))
+
+    def test_table_is_ignored_after_catalogue_bump(self):
+        self.assertIsNotNone(get_similar_cars_table())
+        base = self.cars[3]
+        closest = Car.objects.create(
+            company_name="Marka", car_name="Bliźniak", horsepower=base.horsepower + 1,
+            total_speed=base.total_speed, cars_price=base.cars_price, seats=base.seats,
+        )
+        bump_catalogue_version()
+        self.assertIsNone(get_similar_cars_table())
+        found = similar_car_ids(base, {}, top_n=5)
+        self.assertEqual(found[0][0], closest.id)
+        self.assertSameRanking(found, self.live_knn(base))
+
+
+class CatalogueSnapshotTests(IsolatedArtifactsMixin, TestCase):
+    """Snapshot katalogu zwraca te same dane co ORM."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cars = create_cars(12)
+        cls.cars.append(Car.objects.create(company_name="Bez", car_name="Danych"))
+
+    def test_records_match_model_instances(self):
+        snapshot = get_catalogue_snapshot()
+        self.assertEqual(len(snapshot), len(self.cars))
+        records = snapshot.in_bulk([car.id for car in self.cars])
+        for car in self.cars:
+            record = records[car.id]
+            self.assertIsInstance(record, CarRecord)
+            for field in CarRecord._fields:
+                self.assertEqual(getattr(record, field), getattr(car, field))
+
+    def test_built_with_single_query(self):
+        with self.assertNumQueries(1):
+            get_catalogue_snapshot()
+
+    def test_shared_snapshot_is_memory_mapped(self):
+        save_catalogue_snapshot()
+        snapshot = get_catalogue_snapshot()
+        self.assertIsInstance(snapshot.ids, np.memmap)
+        in_memory = CatalogueSnapshot.from_database()
+        self.assertEqual(
+            [snapshot.record_at(i) for i in range(len(snapshot))],
+            [in_memory.record_at(i) for i in range(len(in_memory))],
+        )
+
+    def test_shared_snapshot_is_ignored_after_catalogue_change(self):
+        save_catalogue_snapshot()
+        bump_catalogue_version()
+        self.assertIsNone(load_shared_snapshot())
+        self.assertNotIsInstance(get_catalogue_snapshot().ids, np.memmap)
+
+    def test_feature_matrix_skips_incomplete_cars(self):
+        X, car_ids = get_catalogue_snapshot().feature_matrix(["horsepower", "seats"])
+        self.assertEqual(X.shape, (12, 2))
+        self.assertNotIn(self.cars[-1].id, car_ids)
+
+
+class LookupNormalizationTests(IsolatedArtifactsMixin, TestCase):
+    """Marki i paliwa są normalizowane do słowników przy zapisie auta."""
+
+    def test_brand_spellings_share_one_brand(self):
+        first = Car.objects.create(company_name="ROLLS ROYCE", car_name="Ghost")
+        second = Car.objects.create(company_name="rolls  royce ", car_name="Phantom")
+        self.assertEqual(first.brand_id, second.brand_id)
+        self.assertEqual(second.company_name, "Rolls Royce")
+        self.assertEqual(Brand.objects.count(), 1)
+
+    def test_backfill_migration_normalizes_without_touching_artifacts(self):
+        car = Car.objects.create(company_name="Marka", car_name="Model", fuel_type="Petrol")
+        Car.objects.filter(id=car.id).update(company_name="MARKA ", fuel_type="petrol")
+        version = get_catalogue_version()
+
+        backfill = importlib.import_module("cars.migrations.0005_backfill_lookups").backfill_lookups
+        backfill(django_apps, None)
+
+        car.refresh_from_db()
+        self.assertEqual((car.company_name, car.fuel_type), ("Marka", "Petrol"))
+        self.assertEqual(get_catalogue_version(), version)
+
+    def test_warm_up_invalidates_artifacts_after_new_migrations(self):
+        car = Car.objects.create(company_name="Marka", car_name="Model", fuel_type="Petrol")
+        self.assertTrue(sync_schema_version())
+        self.assertFalse(sync_schema_version())
+
+        # Migracja danych zmienia pisownię bez sygnałów
+        Car.objects.filter(id=car.id).update(company_name="MARKA ")
+        self.assertEqual(get_catalogue_snapshot().in_bulk([car.id])[car.id].company_name, "MARKA ")
+        Car.objects.filter(id=car.id).update(company_name="Marka")
+        (Path(settings.CARS_ARTIFACTS_DIR) / "schema.version").write_text("0001_initial")
+        version = get_catalogue_version()
+
+        self.assertTrue(sync_schema_version())
+        self.assertEqual(get_catalogue_version(), version + 1)
+        self.assertEqual(get_catalogue_snapshot().in_bulk([car.id])[car.id].company_name, "Marka")
+
+    def test_fuel_type_is_normalized(self):
+        car = Car.objects.create(company_name="Marka", car_name="Model", fuel_type="plug in hyrbrid")
+        self.assertEqual(car.fuel_type, "Plug-in Hybrid")
+        self.assertEqual(car.fuel, FuelType.objects.get(name="Plug-in Hybrid"))
+
+    def test_search_filters_by_lookup_keys(self):
+        Car.objects.create(company_name="Marka", car_name="Hybryda", fuel_type="Petrol/Hybrid")
+        Car.objects.create(company_name="Marka", car_name="Benzyna", fuel_type="Petrol")
+        response = self.client.get(reverse("search"), {"company_name": "Marka", "fuel_type": "Hybrid"})
+        self.assertEqual([car.car_name for car in response.context["results"]], ["Hybryda"])
+
+
+class QuizResultsQueryCountTests(IsolatedArtifactsMixin, TestCase):
+    """Wyniki quizu: liczba zapytań nie zależy od liczby użytkowników ani ocen."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cars = create_cars(20)
+        cls.user = User.objects.create_user("kierowca", password="haslo-testowe-123")
+        for car, rating in zip(cls.cars[:8], [5, 4, 5, 2, 1, 3, 4, 5]):
+            UserCarRating.objects.create(user=cls.user, car=car, rating=rating)
+
+    def add_similar_users(self, count):
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(count):
+                other = User.objects.create_user(f"inny{User.objects.count()}", password="haslo-testowe-123")
+                for car, rating in zip(self.cars[:12], [5, 4, 5, 2, 1, 3, 4, 5, 5, 4, 3, 5]):
+                    UserCarRating.objects.create(user=other, car=car, rating=rating)
+        # Rankingi dogonione jak przez zadanie 'leaderboards' po nowych ocenach
+        get_leaderboards()
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        # Snapshot katalogu (karty wyników) powstaje raz na wersję katalogu,
+        # a rankingi ocen są potem tylko aktualizowane przy nowych ocenach
+        get_catalogue_snapshot()
+        get_leaderboards()
+
+    def get_results(self):
+        return self.client.get(reverse("quiz_results"))
+
+    def test_queries_do_not_grow_with_similar_users(self):
+        self.add_similar_users(2)
+        with self.assertNumQueries(6):
+            response = self.get_results()
+        self.assertTrue(response.context["recommendations"])
+
+        self.add_similar_users(5)
+        with self.assertNumQueries(6):
+            self.get_results()
+
+    def test_user_ratings_are_rendered_without_lazy_car_queries(self):
+        self.add_similar_users(1)
+        with self.assertNumQueries(6):
+            response = self.get_results()
+        self.assertContains(response, "Marka Model 0")
+
+
+@override_settings(CARS_JOB_DEBOUNCE_SECONDS=0)
+class JobQueueTests(IsolatedArtifactsMixin, TestCase):
+    """Zmiany katalogu i ocen planują przebudowę artefaktów w tle."""
+
+    def test_changes_are_debounced_into_one_job(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            create_cars(5)
+        enqueue("similar_cars", delay=60)
+        for name in CATALOGUE_JOBS:
+            self.assertEqual(Job.objects.filter(name=name, status=Job.PENDING).count(), 1)
+
+    @override_settings(CARS_JOB_DEBOUNCE_SECONDS=5, CARS_JOB_MAX_DELAY_SECONDS=12)
+    def test_debounce_is_capped_from_first_enqueue(self):
+        start = timezone.now()
+        with patch("cars.jobs.timezone.now", return_value=start):
+            enqueue("facets")
+        for seconds in (4, 8, 12):
+            # Zmiany częstsze niż debounce przesuwają termin najwyżej do run_by
+            with patch("cars.jobs.timezone.now", return_value=start + timedelta(seconds=seconds)):
+                enqueue("facets")
+        job = Job.objects.get(name="facets", status=Job.PENDING)
+        self.assertEqual(job.run_by, start + timedelta(seconds=12))
+        self.assertEqual(job.run_after, job.run_by)
+
+    def test_steady_state_save_updates_jobs_in_one_query(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            car = create_cars(1)[0]
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            car.save()
+        job_queries = [query["sql"] for query in queries.captured_queries if "cars_job" in query["sql"]]
+        self.assertEqual(len(job_queries), 1)
+        self.assertTrue(job_queries[0].startswith("UPDATE"))
+
+    def test_changes_are_bumped_once_after_commit(self):
+        version = get_catalogue_version()
+        with self.captureOnCommitCallbacks() as callbacks:
+            create_cars(3)
+        # Przed zatwierdzeniem wersja i kolejka bez zmian, potem jedno podbicie na transakcję
+        self.assertEqual(get_catalogue_version(), version)
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertEqual(get_catalogue_version(), version + 1)
+        self.assertEqual(len(catalogue_changes_since(version, version + 1)), 3)
+
+    def test_rolled_back_changes_do_not_bump_version(self):
+        version = get_catalogue_version()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                create_cars(2)
+                transaction.set_rollback(True)
+            car = create_cars(1)[0]
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(get_catalogue_version(), version + 1)
+        self.assertEqual(catalogue_changes_since(version, version + 1), {car.id})
+
+    def test_worker_rebuilds_catalogue_artifacts(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            create_cars(8)
+        self.assertIsNone(get_similar_cars_table())
+        run_pending()
+        self.assertIsNotNone(get_similar_cars_table())
+        self.assertFalse(Job.objects.exclude(status=Job.DONE).exists())
+
+    def test_worker_rebuilds_ratings_matrix(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            cars = create_cars(3)
+            user = User.objects.create_user("oceniajacy", password="haslo-testowe-123")
+            for car, rating in zip(cars, [5, 3, 1]):
+                UserCarRating.objects.create(user=user, car=car, rating=rating)
+        live = get_all_ratings_by_user()
+
+        run_pending()
+        self.assertIsNotNone(get_ratings_matrix())
+        with self.assertNumQueries(0):
+            self.assertEqual(get_all_ratings_by_user(), live)
+
+    def test_ratings_matrix_groups_ratings_once(self):
+        cars = create_cars(3)
+        users = [User.objects.create_user(f"oceniajacy{i}", password="haslo-testowe-123") for i in range(3)]
+        for car, user, rating in [(cars[0], users[2], 4), (cars[1], users[0], 5), (cars[2], users[2], 2), (cars[0], users[1], 1)]:
+            UserCarRating.objects.create(user=user, car=car, rating=rating)
+        matrix = RatingsMatrix.from_database(get_ratings_version())
+
+        grouped = matrix.by_user()
+        self.assertEqual(grouped, {
+            users[2].id: {cars[0].id: 4, cars[2].id: 2},
+            users[0].id: {cars[1].id: 5},
+            users[1].id: {cars[0].id: 1},
+        })
+        # Użytkownicy w kolejności pierwszej oceny, jak w zapytaniu bez macierzy
+        self.assertEqual(list(grouped), list(get_all_ratings_by_user()))
+        self.assertEqual(
+            list(matrix.by_user(exclude_user_id=users[2].id)),
+            list(get_all_ratings_by_user(exclude_user_id=users[2].id)),
+        )
+        self.assertIs(matrix.by_user()[users[0].id], grouped[users[0].id])
+
+
+class PerformanceMiddlewareTests(IsolatedArtifactsMixin, TestCase):
+    """Middleware mierzy czas, zapytania SQL i etapy rekomendacji."""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_cars(10)
+
+    def setUp(self):
+        super().setUp()
+        registry.reset()
+        caches["default"].clear()
+
+    def server_timing(self, response):
+        return dict(
+            (part.split(";")[0], part)
+            for part in response["Server-Timing"].split(", ")
+        )
+
+    def test_server_timing_counts_queries_of_async_view(self):
+        get_catalogue_snapshot()
+        with self.assertNumQueries(5) as queries:
+            response = self.client.post(reverse("recommend_car"), {
+                "company_name": "Marka", "car_name": "Model 3", "max_price": 1000000,
+            })
+        timing = self.server_timing(response)
+        self.assertIn(f'desc="{len(queries.captured_queries)} queries"', timing["db"])
+        self.assertIn("knn", timing)
+
+    def test_metrics_endpoint_exports_request_counters(self):
+        self.client.get(reverse("get_models_by_brand"), {"company_name": "Marka"})
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertRegex(body, r'car4u_requests_total\{view="get_models_by_brand",method="GET",status="200"\} 1')
+        self.assertIn('car4u_db_queries_total{view="get_models_by_brand"} 1', body)
+
+    def test_metrics_endpoint_is_local_only(self):
+        response = self.client.get(reverse("metrics"), REMOTE_ADDR="203.0.113.7")
+        self.assertEqual(response.status_code, 403)
+
+
+class ProfilingTests(IsolatedArtifactsMixin, TestCase):
+    """Czasy etapów KNN trafiają do odbiorców, a X-Profile zapisuje profil żądania."""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_cars(10)
+
+    def setUp(self):
+        super().setUp()
+        caches["default"].clear()
+
+    def post_recommend(self, **extra):
+        data = {"company_name": "Marka", "car_name": "Model 3", "max_price": 1000000}
+        return self.client.post(reverse("recommend_car"), data, **extra)
+
+    def test_stage_timings_reach_custom_sink(self):
+        received = []
+
+        def sink(stage, seconds):
+            received.append(stage)
+
+        add_sink(sink)
+        try:
+            response = self.post_recommend()
+        finally:
+            remove_sink(sink)
+
+        self.assertEqual(received, ["knn.fetch", "knn.matrix", "knn.scale", "knn.distance", "knn.topk"])
+        self.assertIn("knn.distance;dur=", response["Server-Timing"])
+
+    def test_remove_sink_keeps_configured_sinks(self):
+        def sink(stage, seconds):
+            pass
+
+        with patch("cars.profiling._sinks", None):
+            remove_sink(sink)
+            self.assertEqual(get_sinks(), [metrics_sink])
+
+    def test_profile_header_dumps_profile(self):
+        response = self.post_recommend(HTTP_X_PROFILE="cprofile")
+        path = Path(settings.CARS_ARTIFACTS_DIR) / "profiles" / response["X-Profile-File"]
+        self.assertTrue(path.exists())
+
+    def test_old_profiles_are_pruned(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with self.settings(CARS_ARTIFACTS_DIR=directory, CARS_PROFILE_KEEP=2):
+                names = [self.post_recommend(HTTP_X_PROFILE="cprofile")["X-Profile-File"] for _ in range(3)]
+            kept = sorted(path.name for path in (Path(directory) / "profiles").iterdir())
+        self.assertEqual(kept, names[1:])
+
+    def test_profile_header_is_ignored_for_remote_clients(self):
+        response = self.post_recommend(HTTP_X_PROFILE="cprofile", REMOTE_ADDR="203.0.113.7")
+        self.assertNotIn("X-Profile-File", response)
+
+
+class BenchmarkTests(IsolatedArtifactsMixin, TestCase):
+    """Generator danych syntetycznych i porównanie z bazą wyników."""
+
+    def test_synthetic_data_feeds_benchmarks(self):
+        populate_catalogue(200, seed=1)
+        populate_ratings(20, ratings_per_user=5, seed=1)
+        self.assertEqual(Car.objects.count(), 200)
+        self.assertEqual(UserCarRating.objects.count(), 100)
+
+        context = BenchmarkContext(settings.CARS_ARTIFACTS_DIR, seed=1)
+        results = run_benchmarks(
+            context, rounds=1, warmup=0,
+            only=["knn.find_top_similar_cars", "cf.recommend_cars_collaborative"],
+        )
+        self.assertEqual(set(results), {"knn.find_top_similar_cars", "cf.recommend_cars_collaborative"})
+
+    def test_rolled_back_import_leaves_artifacts_alone(self):
+        populate_catalogue(50, seed=1)
+        version = get_catalogue_version()
+        self.assertEqual(len(get_catalogue_snapshot()), 50)
+
+        bench_import(BenchmarkContext(settings.CARS_ARTIFACTS_DIR, seed=1), rows=20)()
+        self.assertEqual(Car.objects.count(), 50)
+        self.assertEqual(get_catalogue_version(), version)
+        self.assertEqual(len(get_catalogue_snapshot()), 50)
+        self.assertIsNone(load_shared_snapshot())
+
+    def test_slower_median_is_reported_as_regression(self):
+        baseline = build_report({"knn": {"median": 0.10}, "cf": {"median": 0.10}}, 1000, 100, 10, 0)
+        report = build_report({"knn": {"median": 0.11}, "cf": {"median": 0.20}}, 1000, 100, 10, 0)
+        regressions = [name for name, *_, regression in compare_reports(report, baseline) if regression]
+        self.assertEqual(regressions, ["cf"])
+
+        with self.assertRaises(ValueError):
+            compare_reports(build_report({}, 10, 1, 10, 0), baseline)
+
+
+class ReplayLogTests(SimpleTestCase):
+    def test_reads_performance_and_access_log_lines(self):
+        lines = [
+            '{"view": "search", "method": "GET", "path": "/search/", "query": "q=bmw", "status": 200}',
+            '{"view": "recommend_car", "method": "POST", "path": "/recommend/", "query": "", "status": 200}',
+            '127.0.0.1 - - [19/Oct/2026:10:00:00 +0000] "GET /get-models/?company_name=Kia HTTP/1.1" 200 15',
+            "Starting gunicorn 23.0.0",
+        ]
+        paths, skipped = read_replay_log(lines)
+        self.assertEqual(paths, ["/search/?q=bmw", "/get-models/?company_name=Kia"])
+        self.assertEqual(skipped, 2)
+
+    def test_percentiles_use_nearest_rank(self):
+        values = [i / 100 for i in range(1, 101)]
+        self.assertEqual(percentile(values, 50), 0.5)
+        self.assertEqual(percentile(values, 99), 0.99)
+        self.assertEqual(percentile([0.3], 99), 0.3)
+
+
+class LoadTestTests(IsolatedArtifactsMixin, LiveServerTestCase):
+    def test_traffic_mix_reports_every_endpoint(self):
+        create_cars(10)
+        scenario = Scenarios([("Marka", "Model 3")], seed=1).weighted(parse_mix("recommend=0,quiz=0"))
+        recorder, elapsed = run_load(self.live_server_url, scenario, concurrency=2, duration=1)
+        summary = recorder.summary(elapsed)
+        self.assertEqual(summary["all"]["errors"], 0)
+        self.assertLessEqual({"search", "get_models", "get_engines"}, set(summary))
+
+
+class StartupTests(SimpleTestCase):
+    def test_heavy_numerical_stack_is_not_imported_at_startup(self):
+        result = measure_startup(rounds=1)
+        self.assertIn("cars", result["modules"])
+        self.assertFalse({"pandas", "sklearn", "scipy"} & set(result["modules"]))
+
+
+class WarmupTests(IsolatedArtifactsMixin, TestCase):
+    """Rozgrzewka przed fork() i sprawdzenie gotowości dla platformy."""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_cars(10)
+
+    def tearDown(self):
+        warmup._status.update(state=warmup.COLD, steps={}, errors={}, duration=None)
+
+    def test_warm_up_builds_artifacts_and_reports_ready(self):
+        result = warmup.warm_up()
+        self.assertEqual(result["state"], warmup.READY)
+        self.assertEqual(set(result["steps"]), {name for name, _ in warmup.WARMUP_STEPS})
+
+        response = self.client.get(reverse("ready"))
+        self.assertEqual(response.status_code, 200)
+        # Snapshot jest już w pamięci - rekomendacja nie buduje go od nowa
+        with self.assertNumQueries(0):
+            get_catalogue_snapshot()
+
+    def test_not_ready_while_warming(self):
+        warmup._status["state"] = warmup.WARMING
+        response = self.client.get(reverse("ready"))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()["state"], warmup.WARMING)
+
+
+class FragmentCacheTests(IsolatedArtifactsMixin, TestCase):
+    """Listy wyborów i wyniki wyszukiwania są renderowane raz na wersję katalogu."""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_cars(15)
+
+    def setUp(self):
+        super().setUp()
+        caches["template_fragments"].clear()
+
+    def test_repeated_search_skips_choice_and_result_queries(self):
+        with CaptureQueriesContext(connection) as cold:
+            self.client.get(reverse("search") + "?min_power=150&page=1")
+        # Te same filtry w innej kolejności trafiają w ten sam fragment
+        with CaptureQueriesContext(connection) as warm:
+            response = self.client.get(reverse("search") + "?page=1&min_power=150&seats=")
+        self.assertLess(len(warm), len(cold))
+        self.assertFalse(any("DISTINCT" in query["sql"] for query in warm.captured_queries))
+        self.assertContains(response, "Wyniki filtracji (10)")
+
+    def test_catalogue_change_renders_fresh_fragments(self):
+        self.client.get(reverse("search"))
+        create_cars(1, company_name="Nowa Marka")
+        bump_catalogue_version()
+        self.assertContains(self.client.get(reverse("search")), "Nowa Marka")
+
+
+class CompressionTests(IsolatedArtifactsMixin, TestCase):
+    """HTML i JSON są kompresowane zgodnie z Accept-Encoding, statyki mają nazwy z hashem."""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Lista modeli dłuższa niż próg kompresji (200 bajtów)
+        create_cars(40)
+
+    def test_html_is_gzipped(self):
+        response = self.client.get(reverse("search"), HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertIn("Marka", gzip.decompress(response.content).decode())
+
+    @skipUnless(brotli, "brotli nie jest zainstalowany")
+    def test_brotli_is_preferred_when_accepted(self):
+        response = self.client.get(reverse("search"), HTTP_ACCEPT_ENCODING="gzip, deflate, br")
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(int(response["Content-Length"]), len(response.content))
+        self.assertIn("Marka", brotli.decompress(response.content).decode())
+
+    def test_json_is_compressed_and_plain_without_accept_encoding(self):
+        url = reverse("get_models_by_brand")
+        compressed = self.client.get(url, {"company_name": "Marka"}, HTTP_ACCEPT_ENCODING="gzip")
+        plain = self.client.get(url, {"company_name": "Marka"})
+        self.assertEqual(compressed["Content-Encoding"], "gzip")
+        self.assertFalse(plain.has_header("Content-Encoding"))
+        self.assertEqual(json.loads(gzip.decompress(compressed.content)), plain.json())
+
+    def test_static_url_without_manifest_falls_back_to_plain_name(self):
+        self.assertEqual(static("cars/style.css"), "/static/cars/style.css")
+
+    @skipUnless(Image, "Pillow nie jest zainstalowany")
+    def test_image_derivatives_are_resized_and_not_upscaled(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            source = Path(workdir) / "photo.jpg"
+            Image.new("RGB", (1200, 600), "red").save(source)
+            written = build_derivatives(source, widths=(600, 2000))
+            self.assertEqual(len(written), 4)
+            with Image.open(Path(workdir) / "photo-600.webp") as image:
+                self.assertEqual(image.size, (600, 300))
+            with Image.open(Path(workdir) / "photo-2000.jpg") as image:
+                self.assertEqual(image.size, (1200, 600))
+            self.assertEqual(find_sources(workdir), [source])
+            # Aktualne pliki nie są generowane ponownie
+            self.assertEqual(build_derivatives(source, widths=(600,)), [])
+
+
+class VectorStoreTests(SimpleTestCase):
+    """Przybliżone przejście na float32/int8 daje ten sam TOP K co pełne float64."""
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        count = 5000
+        self.snapshot = CatalogueSnapshot.from_rows(
+            (i + 1, "Marka", f"Model {i}", "V8", "Petrol",
+             float(rng.integers(70, 900)), int(rng.integers(140, 350)),
+             float(rng.integers(10, 3000) * 1000), int(rng.integers(2, 8)))
+            for i in range(count)
+        )
+        X = np.column_stack([self.snapshot.numeric[field] for field in VECTOR_FEATURES])
+        # Część aut bez ceny - pomijana jak w find_top_similar_cars
+        self.snapshot.numeric["cars_price"][::97] = np.nan
+        self.X = X
+
+    def brute_force(self, positions, user_row, top_n):
+        X = self.X[positions]
+        scale = X.std(axis=0)
+        scale[scale == 0] = 1.0
+        distances = np.sqrt((((X - user_row) / scale) ** 2).sum(axis=1))
+        order = np.argsort(distances, kind="stable")[:top_n]
+        return positions[order], distances[order]
+
+    def test_top_k_matches_full_precision(self):
+        rng = np.random.default_rng(1)
+        for dtype in DTYPES:
+            store = VectorStore.from_snapshot(self.snapshot, dtype=dtype)
+            for _ in range(20):
+                positions = store.positions(self.snapshot.ids[rng.random(len(self.snapshot)) < 0.6])
+                user_row = self.X[rng.integers(len(self.X))] + rng.normal(0, 5, 4)
+                found, distances = store.top_k(positions, user_row, 10)
+                expected, expected_distances = self.brute_force(positions, user_row, 10)
+                np.testing.assert_array_equal(found, expected, err_msg=dtype)
+                np.testing.assert_allclose(distances, expected_distances, rtol=1e-9)
+
+    def test_quantized_store_is_smaller(self):
+        float_store = VectorStore.from_snapshot(self.snapshot, dtype="float32")
+        int_store = VectorStore.from_snapshot(self.snapshot, dtype="int8")
+        full = sum(self.snapshot.numeric[field].nbytes for field in VECTOR_FEATURES)
+        self.assertLess(float_store.codes.nbytes, full)
+        self.assertEqual(int_store.codes.nbytes * 4, float_store.codes.nbytes)
+
+    def test_unknown_ids_are_reported(self):
+        store = VectorStore.from_snapshot(self.snapshot)
+        self.assertIsNone(store.positions([1, 10 ** 9]))
+        self.assertNotIn(0, store.positions(self.snapshot.ids[:200]))  # id 1 nie ma ceny
+
+
+class VectorKnnTests(IsolatedArtifactsMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_cars(40)
+
+    def test_store_path_matches_scikit_learn_path(self):
+        queryset = Car.objects.filter(cars_price__lte=250000)
+        user_vector = {"horsepower": 240, "total_speed": 230, "cars_price": 120000, "seats": 4}
+        found = find_top_similar_cars(queryset, user_vector, top_n=5)
+        expected = _find_top_similar_cars_exact(queryset, user_vector, 5, StageTimer("knn_exact"))
+        self.assertEqual([car_id for car_id, _ in found], [car_id for car_id, _ in expected])
+        np.testing.assert_allclose([d for _, d in found], [d for _, d in expected], rtol=1e-9)
+
+
+class HybridRecommendationTests(IsolatedArtifactsMixin, TestCase):
+    """Kandydaci z KNN, CF i popularności, ocena tylko kandydatów."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cars = create_cars(20)
+        cls.user = User.objects.create_user("kierowca", password="haslo-testowe-123")
+        for car, rating in zip(cls.cars[:8], [5, 4, 5, 2, 1, 3, 4, 5]):
+            UserCarRating.objects.create(user=cls.user, car=car, rating=rating)
+        for n in range(3):
+            other = User.objects.create_user(f"inny{n}", password="haslo-testowe-123")
+            for car, rating in zip(cls.cars[:12], [5, 4, 5, 2, 1, 3, 4, 5, 5, 1, 1, 5]):
+                UserCarRating.objects.create(user=other, car=car, rating=rating)
+
+    def test_recommends_unrated_cars_liked_by_similar_users(self):
+        recommendations = recommend_cars_hybrid(self.user, top_n=5)
+        ids = [car.id for car, _ in recommendations]
+        self.assertEqual(len(ids), 5)
+        self.assertFalse(set(ids) & {car.id for car in self.cars[:8]})
+        self.assertEqual(set(ids[:2]), {self.cars[8].id, self.cars[11].id})
+        scores = [score for _, score in recommendations]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertTrue(all(1 <= score <= 5 for score in scores))
+
+    def test_similar_cars_table_gives_same_candidates_as_vector_store(self):
+        without_table = recommend_cars_hybrid(self.user, top_n=5)
+        save_similar_cars_table(build_similar_cars_table(top_k=20))
+        self.assertEqual(recommend_cars_hybrid(self.user, top_n=5), without_table)
+
+    def test_candidates_are_bounded(self):
+        with patch("cars.hybrid.MAX_CANDIDATES", 3):
+            self.assertEqual(len(recommend_cars_hybrid(self.user, top_n=5)), 3)
+
+    def test_user_without_ratings_is_rejected(self):
+        newcomer = User.objects.create_user("nowy", password="haslo-testowe-123")
+        with self.assertRaises(ValueError):
+            recommend_cars_hybrid(newcomer)
+
+
+class LeaderboardTests(IsolatedArtifactsMixin, TestCase):
+    """Rankingi ocen: średnia bayesowska, segmenty i aktualizacja bez przeliczania wszystkiego."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cars = create_cars(12)
+        cls.users = [User.objects.create_user(f"oceniajacy{n}", password="haslo-testowe-123") for n in range(6)]
+        # Jedna piątka kontra sześć ocen ~4.8
+        UserCarRating.objects.create(user=cls.users[0], car=cls.cars[0], rating=5)
+        for user, rating in zip(cls.users, [5, 5, 5, 5, 4, 5]):
+            UserCarRating.objects.create(user=user, car=cls.cars[1], rating=rating)
+        for user in cls.users[:3]:
+            UserCarRating.objects.create(user=user, car=cls.cars[2], rating=2)
+
+    def test_bayesian_average_prefers_many_good_ratings(self):
+        top = get_leaderboards().top(3)
+        self.assertEqual([car_id for car_id, _ in top], [self.cars[1].id, self.cars[0].id, self.cars[2].id])
+
+    def test_segments_contain_only_their_cars(self):
+        boards = get_leaderboards()
+        diesel = {car.id for car in self.cars if car.fuel_type == "Diesel"}
+        top = boards.top(10, segment=("fuel_type", "Diesel"))
+        self.assertTrue(top)
+        self.assertTrue({car_id for car_id, _ in top} <= diesel)
+        self.assertEqual(boards.top(10, segment=("price_tier", "premium")), [])
+
+    def test_new_ratings_update_rankings_incrementally(self):
+        get_leaderboards()
+        path = Path(settings.CARS_ARTIFACTS_DIR) / LEADERBOARDS_FILENAME
+        saved = path.read_bytes()
+        with self.captureOnCommitCallbacks(execute=True):
+            for user in self.users:
+                UserCarRating.objects.create(user=user, car=self.cars[5], rating=5)
+        # Zapis oceny nie przepisuje pliku rankingów
+        self.assertEqual(path.read_bytes(), saved)
+
+        # Odczyt sumuje oceny tylko zmienionych aut i aktualizuje rankingi w pamięci
+        with self.assertNumQueries(1):
+            updated = get_leaderboards().top(12)
+        self.assertEqual(updated[0][0], self.cars[5].id)
+        self.assertEqual(updated, Leaderboards.from_database().top(12))
+        self.assertEqual(path.read_bytes(), saved)
+
+        # Zadanie 'leaderboards' zapisuje aktualne rankingi do pliku
+        refresh_leaderboards()
+        self.assertNotEqual(path.read_bytes(), saved)
+        self.assertEqual(pickle.loads(path.read_bytes())[1].top(12), updated)
+
+    def test_catalogue_change_is_applied_without_full_rebuild(self):
+        get_leaderboards()
+        path = Path(settings.CARS_ARTIFACTS_DIR) / LEADERBOARDS_FILENAME
+        saved = path.read_bytes()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cars[1].delete()
+            Car.objects.filter(id=self.cars[0].id).update(fuel_type="Diesel")
+            bump_catalogue_version([self.cars[0].id])
+        get_catalogue_snapshot()
+
+        # Tylko sumy ocen usuniętego auta - bez agregacji wszystkich ocen
+        with patch.object(Leaderboards, "from_database", side_effect=AssertionError), self.assertNumQueries(1):
+            boards = get_leaderboards()
+        expected = Leaderboards.from_database()
+        self.assertEqual(boards.top(12), expected.top(12))
+        self.assertEqual(boards.top(12, segment=("fuel_type", "Diesel")), expected.top(12, segment=("fuel_type", "Diesel")))
+        self.assertNotIn(self.cars[1].id, [car_id for car_id, _ in boards.top(12)])
+        self.assertEqual(path.read_bytes(), saved)
+
+        # Zadanie 'leaderboards' przelicza rankingi z bazy i zapisuje plik
+        refresh_leaderboards()
+        self.assertEqual(pickle.loads(path.read_bytes())[1].top(12), expected.top(12))
+
+    def test_fallback_is_a_slice_without_rated_cars(self):
+        get_leaderboards()
+        get_catalogue_snapshot()
+        user = self.users[4]  # ocenił tylko auto 1
+        with self.assertNumQueries(1):
+            recommendations = get_top_rated_cars(user, top_n=5)
+        self.assertEqual([car.id for car, _ in recommendations], [self.cars[0].id, self.cars[2].id])
+
+    def test_collaborative_and_fallback_return_the_same_records(self):
+        similar = User.objects.create_user("podobny", password="haslo-testowe-123")
+        UserCarRating.objects.create(user=similar, car=self.cars[1], rating=5)
+        UserCarRating.objects.create(user=similar, car=self.cars[2], rating=2)
+        lonely = User.objects.create_user("samotny", password="haslo-testowe-123")
+        UserCarRating.objects.create(user=lonely, car=self.cars[3], rating=4)
+
+        collaborative = recommend_cars_collaborative(similar, top_n=5)
+        fallback = recommend_cars_collaborative(lonely, top_n=5)
+        self.assertEqual([car.id for car, _ in collaborative], [self.cars[0].id])
+        self.assertEqual(fallback, get_top_rated_cars(lonely, top_n=5))
+        for car, _ in collaborative + fallback:
+            self.assertIsInstance(car, CarRecord)
+
+
+class QuizSessionTests(IsolatedArtifactsMixin, TestCase):
+    """Quiz: odświeżenie strony nie losuje aut od nowa i nie zapisuje sesji."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cars = create_cars(40)
+        cls.user = User.objects.create_user("kierowca", password="haslo-testowe-123")
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def quiz_ids(self, response):
+        return [car.id for car in response.context["quiz_cars"]]
+
+    def load_settings(self, **environ):
+        """Moduł ustawień wykonany od nowa z podanymi zmiennymi środowiskowymi."""
+        with patch.dict(os.environ):
+            os.environ.pop("CARS_SESSION_BACKEND", None)
+            os.environ.pop("REDIS_URL", None)
+            os.environ.update(environ)
+            return runpy.run_path(str(Path(settings.BASE_DIR) / "car4u" / "settings.py"))
+
+    def test_session_backend_depends_on_shared_cache(self):
+        self.assertEqual(self.load_settings()["SESSION_ENGINE"], "django.contrib.sessions.backends.db")
+        self.assertEqual(
+            self.load_settings(REDIS_URL="redis://localhost:6379/0")["SESSION_ENGINE"],
+            "django.contrib.sessions.backends.cached_db",
+        )
+
+    def test_cache_sessions_without_shared_cache_are_rejected(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.load_settings(CARS_SESSION_BACKEND="cached_db")
+        with self.assertRaises(ImproperlyConfigured):
+            self.load_settings(CARS_SESSION_BACKEND="redis")
+
+    def test_refresh_reuses_cars_without_writing_session(self):
+        first = self.quiz_ids(self.client.get(reverse("quiz")))
+        self.assertEqual(self.client.session["quiz_car_ids"], ",".join(map(str, first)))
+
+        with CaptureQueriesContext(connection) as queries:
+            second = self.quiz_ids(self.client.get(reverse("quiz")))
+        self.assertEqual(second, first)
+        writes = [q["sql"] for q in queries.captured_queries if "django_session" in q["sql"] and "SELECT" not in q["sql"]]
+        self.assertEqual(writes, [])
+
+    def test_reset_draws_new_cars(self):
+        first = self.quiz_ids(self.client.get(reverse("quiz")))
+        with patch("cars.views.get_random_cars_for_quiz", return_value=self.cars[30:40]):
+            reset = self.quiz_ids(self.client.get(reverse("quiz") + "?reset_quiz=1"))
+        self.assertEqual(reset, [car.id for car in self.cars[30:40]])
+        self.assertNotEqual(reset, first)
+        self.assertEqual(self.client.session["quiz_car_ids"], ",".join(map(str, reset)))
+
+    def test_deleted_car_triggers_new_quiz(self):
+        first = self.quiz_ids(self.client.get(reverse("quiz")))
+        Car.objects.filter(id=first[0]).delete()
+        second = self.quiz_ids(self.client.get(reverse("quiz")))
+        self.assertNotIn(first[0], second)
+
+
+class AdmissionLimiterTests(SimpleTestCase):
+    """Limiter: miejsca, kolejka FIFO z czasem oczekiwania i odrzucenia."""
+
+    def setUp(self):
+        registry.reset()
+
+    def test_queue_waits_for_free_slot_and_rejects_overflow(self):
+        limiter = AdmissionLimiter("test", limit=1, queue=1, timeout=5.0)
+
+        async def scenario():
+            first = await limiter.acquire()
+            waiting = asyncio.ensure_future(limiter.acquire())
+            await asyncio.sleep(0)
+            self.assertEqual(limiter.waiting, 1)
+            overflow = await limiter.acquire()
+            limiter.release()
+            second = await waiting
+            self.assertEqual(limiter.active, 1)
+            limiter.release()
+            return first, second, overflow
+
+        self.assertEqual(asyncio.run(scenario()), (True, True, False))
+        self.assertEqual(limiter.active, 0)
+        body = registry.render()
+        for result in ("admitted", "queued", "rejected"):
+            self.assertIn(f'car4u_admission_total{{view="test",result="{result}"}} 1', body)
+        self.assertIn('car4u_admission_limit{view="test"} 1', body)
+
+    def test_waiting_times_out_without_taking_slot(self):
+        limiter = AdmissionLimiter("test", limit=1, queue=1, timeout=0.01)
+
+        async def scenario():
+            await limiter.acquire()
+            timed_out = await limiter.acquire()
+            limiter.release()
+            return timed_out
+
+        self.assertFalse(asyncio.run(scenario()))
+        self.assertEqual((limiter.active, limiter.waiting), (0, 0))
+        self.assertIn('car4u_admission_total{view="test",result="timeout"} 1', registry.render())
+
+
+OVERLOADED_LIMITS = {
+    name: {"limit": 1, "queue": 0, "retry_after": 7}
+    for name in ("recommend_car", "quiz_results", "recommend_batch")
+}
+
+
+@override_settings(CARS_ADMISSION_LIMITS=OVERLOADED_LIMITS)
+class LoadSheddingTests(IsolatedArtifactsMixin, TestCase):
+    """Przy zajętych miejscach widoki korzystają z gotowych wyników albo zwracają 503."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cars = create_cars(12)
+        cls.user = User.objects.create_user("kierowca", password="haslo-testowe-123")
+        for car, rating in zip(cls.cars[:3], [5, 4, 3]):
+            UserCarRating.objects.create(user=cls.user, car=car, rating=rating)
+
+    def setUp(self):
+        super().setUp()
+        caches["default"].clear()
+        # Zajęte jedyne miejsce każdego widoku, jak przy trwających obliczeniach
+        for name in OVERLOADED_LIMITS:
+            get_limiter(name).active = 1
+            self.addCleanup(setattr, get_limiter(name), "active", 0)
+
+    def test_batch_is_rejected_with_retry_after(self):
+        response = self.client.post(
+            reverse("recommend_batch"),
+            json.dumps({"cars": [{"company_name": "Marka", "car_name": "Model 1"}]}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "7")
+
+    def test_quiz_results_fall_back_to_leaderboard(self):
+        self.client.force_login(self.user)
+        with patch("cars.views.recommend_cars_hybrid") as hybrid:
+            response = self.client.get(reverse("quiz_results"))
+        hybrid.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context["degraded"])
+        self.assertEqual(
+            [car.id for car, _ in response.context["recommendations"]],
+            [car.id for car, _ in get_top_rated_cars(self.user, top_n=5)],
+        )
+
+    def test_recommend_uses_precomputed_neighbours(self):
+        save_similar_cars_table(build_similar_cars_table(top_k=5))
+        with patch("cars.recommendations.similar_car_ids") as compute:
+            response = self.client.post(reverse("recommend_car"), {"company_name": "Marka", "car_name": "Model 3"})
+        compute.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["result_cars"]), 5)
+
+    def test_cached_result_does_not_need_a_slot(self):
+        data = {"company_name": "Marka", "car_name": "Model 3", "max_price": 1000000}
+        get_limiter("recommend_car").active = 0
+        first = self.client.post(reverse("recommend_car"), data)
+        get_limiter("recommend_car").active = 1
+        second = self.client.post(reverse("recommend_car"), data)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(
+            [item["car"].id for item in second.context["result_cars"]],
+            [item["car"].id for item in first.context["result_cars"]],
+        )
+
+    async def test_identical_burst_takes_one_slot(self):
+        get_limiter("recommend_car").active = 0
+        calls = []
+
+        async def slow_compute(func, *args, **kwargs):
+            calls.append(args)
+            await asyncio.sleep(0.05)
+            return [(self.cars[1].id, 0.5)]
+
+        with patch("cars.recommendations._shared_key", return_value=(self.cars[0], ("test", "burst"))), \
+                patch("cars.recommendations.run_compute", slow_compute), \
+                patch("cars.recommendations._hydrate", lambda top_results: top_results):
+            results = await asyncio.gather(*(
+                recommend_similar_shared("Marka", "Model 0", {}, admission_name="recommend_car")
+                for _ in range(5)
+            ))
+        # Limit 1 bez kolejki: czekający na wspólne obliczenie nie dostają Overloaded
+        self.assertEqual(results, [[(self.cars[1].id, 0.5)]] * 5)
+        self.assertEqual(len(calls), 1)
+
+    def test_recommend_with_constraints_is_rejected(self):
+        response = self.client.post(reverse("recommend_car"), {
+            "company_name": "Marka", "car_name": "Model 3", "max_price": 1000000,
+        })
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "7")
+        self.assertContains(response, "przeciążony", status_code=503)
+
+
+class SingleFlightTests(SimpleTestCase):
+    """Identyczne równoczesne obliczenia są liczone raz, w procesie i między workerami."""
+
+    def setUp(self):
+        caches["default"].clear()
+
+    def test_concurrent_identical_calls_share_one_computation(self):
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return [(1, 0.5)]
+
+        async def scenario():
+            return await asyncio.gather(*(shared_result(("test", 1), compute) for _ in range(5)))
+
+        self.assertEqual(asyncio.run(scenario()), [[(1, 0.5)]] * 5)
+        self.assertEqual(len(calls), 1)
+        # Wynik zostaje w cache na CARS_SINGLEFLIGHT_TTL
+        self.assertEqual(asyncio.run(shared_result(("test", 1), compute)), [(1, 0.5)])
+        self.assertEqual(len(calls), 1)
+
+    def test_errors_are_shared_but_not_cached(self):
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            raise ValueError("brak aut")
+
+        async def scenario():
+            return await asyncio.gather(
+                *(shared_result(("test", 2), compute) for _ in range(3)), return_exceptions=True
+            )
+
+        self.assertTrue(all(isinstance(error, ValueError) for error in asyncio.run(scenario())))
+        self.assertEqual(len(calls), 1)
+        with self.assertRaises(ValueError):
+            asyncio.run(shared_result(("test", 2), compute))
+        self.assertEqual(len(calls), 2)
+
+    def test_waits_for_result_of_worker_holding_lock(self):
+        key = ("test", 3)
+        cache_key = singleflight._cache_key(key)
+        caches["default"].add(cache_key + ":lock", 1, 10)
+
+        async def compute():
+            raise AssertionError("wynik powinien pochodzić od innego workera")
+
+        async def other_worker():
+            await asyncio.sleep(0.1)
+            await caches["default"].aset(cache_key, [(7, 0.1)], 30)
+            await caches["default"].adelete(cache_key + ":lock")
+
+        async def scenario():
+            result, _ = await asyncio.gather(shared_result(key, compute), other_worker())
+            return result
+
+        self.assertEqual(asyncio.run(scenario()), [(7, 0.1)])
+
+    @override_settings(CARS_SINGLEFLIGHT_LOCK_TIMEOUT=0)
+    def test_abandoned_lock_does_not_block_computation(self):
+        key = ("test", 4)
+        caches["default"].add(singleflight._cache_key(key) + ":lock", 1, 10)
+
+        async def compute():
+            return [(2, 0.2)]
+
+        self.assertEqual(asyncio.run(shared_result(key, compute)), [(2, 0.2)])
+
+
+class SharedRecommendationTests(IsolatedArtifactsMixin, TestCase):
+    """Te same auto bazowe i ograniczenia w recommend_car dają jedno obliczenie KNN."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cars = create_cars(20)
+
+    def setUp(self):
+        super().setUp()
+        caches["default"].clear()
+
+    def post_recommend(self, **constraints):
+        data = {"company_name": "Marka", "car_name": "Model 3", **constraints}
+        return self.client.post(reverse("recommend_car"), data)
+
+    def test_repeated_request_reuses_result(self):
+        with patch("cars.recommendations.similar_car_ids", wraps=similar_car_ids) as compute:
+            first = self.post_recommend(max_price=1000000)
+            second = self.post_recommend(max_price="1000000.00")
+            self.post_recommend(max_price=500000)
+        self.assertEqual(compute.call_count, 2)
+        self.assertEqual(
+            [item["car"].id for item in first.context["result_cars"]],
+            [item["car"].id for item in second.context["result_cars"]],
+        )
+
+    def test_catalogue_change_invalidates_result(self):
+        with patch("cars.recommendations.similar_car_ids", wraps=similar_car_ids) as compute:
+            self.post_recommend(max_price=1000000)
+            bump_catalogue_version()
+            self.post_recommend(max_price=1000000)
+        self.assertEqual(compute.call_count, 2)
+
+
+class RecommendBatchViewTests(IsolatedArtifactsMixin, TestCase):
+    """recommend_batch: wyniki dla wielu aut i 400 dla niepoprawnych danych."""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_cars(12)
+
+    def post_batch(self, payload):
+        body = payload if isinstance(payload, str) else json.dumps(payload)
+        return self.client.post(reverse("recommend_batch"), body, content_type="application/json")
+
+    def test_returns_results_per_base_car(self):
+        response = self.post_batch({
+            "cars": [{"company_name": "Marka", "car_name": "Model 3"}, {"company_name": "Marka", "car_name": "Brak"}],
+            "top_n": 3,
+        })
+        self.assertEqual(response.status_code, 200)
+        first, missing = response.json()["results"]
+        self.assertEqual(len(first["recommendations"]), 3)
+        self.assertIsNone(first["error"])
+        self.assertEqual(missing["recommendations"], [])
+        self.assertTrue(missing["error"])
+
+    def test_malformed_payloads_are_rejected(self):
+        for payload in (
+            "not json",
+            [1, 2],
+            {"cars": {"company_name": "Marka"}},
+            {"cars": [1]},
+            {"cars": [{"company_name": "Marka"}]},
+            {"cars": [{"company_name": ["Marka"], "car_name": "Model 3"}]},
+            {"cars": [{"company_name": "Marka", "car_name": "Model 3"}], "constraints": [1]},
+            {"cars": [{"company_name": "Marka", "car_name": "Model 3"}], "top_n": "pięć"},
+            {"cars": []},
+        ):
+            with self.subTest(payload=payload):
+                self.assertEqual(self.post_batch(payload).status_code, 400)
+
+    def test_batch_size_and_top_n_are_bounded(self):
+        car = {"company_name": "Marka", "car_name": "Model 3"}
+        self.assertEqual(self.post_batch({"cars": [car] * (MAX_BATCH_CARS + 1)}).status_code, 400)
+        self.assertEqual(self.post_batch({"cars": [car], "top_n": 0}).status_code, 400)
+        self.assertEqual(self.post_batch({"cars": [car], "top_n": MAX_BATCH_TOP_N + 1}).status_code, 400)
+        self.assertEqual(self.post_batch({"cars": [car], "top_n": MAX_BATCH_TOP_N}).status_code, 200)
+
+
+class CarSearchIndexTests(SimpleTestCase):
+    """Indeks pełnotekstowy: dopasowania dokładne, prefiksy, literówki i ranking."""
+
+    def setUp(self):
+        self.index = CarSearchIndex([
+            (1, "BMW", "M3", "V8"),
+            (2, "BMW", "M340i", "R6"),
+            (3, "Audi", "RS6", "V8"),
+            (4, "Toyota", "Corolla", "R4"),
+        ])
+
+    def test_exact_match_ranks_above_prefix(self):
+        self.assertEqual(self.index.search("m3"), [1, 2])
+
+    def test_more_matched_words_rank_higher(self):
+        self.assertEqual(self.index.search("v8 audi"), [3, 1])
+
+    def test_typos_are_tolerated(self):
+        self.assertEqual(self.index.search("corrola"), [4])
+
+    def test_limit_none_returns_all_matches(self):
+        self.assertEqual(len(self.index.search("bmw audi toyota", limit=None)), 4)
+        self.assertEqual(self.index.search("bmw audi toyota", limit=2), [1, 2])
+        self.assertEqual(self.index.search("  "), [])
+
+
+class TextSearchViewTests(IsolatedArtifactsMixin, TestCase):
+    """Wyszukiwanie q= obejmuje wszystkie pasujące auta, a indeks nadąża za katalogiem."""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_cars(230)
+
+    def setUp(self):
+        super().setUp()
+        caches["template_fragments"].clear()
+
+    def test_broad_query_is_not_truncated(self):
+        response = self.client.get(reverse("search"), {"q": "marka", "page": 23})
+        self.assertEqual(response.context["page_obj"].paginator.count, 230)
+        self.assertEqual(len(response.context["page_obj"]), 10)
+        self.assertEqual(apply_text_search(Car.objects.all(), "marka").count(), 230)
+
+    def test_csv_export_keeps_rank_order(self):
+        car = Car.objects.create(company_name="Hiperauto", car_name="Marka", engine="V12")
+        bump_catalogue_version()
+        response = self.client.get(reverse("search"), {"q": "marka", "download_csv": "1"})
+        lines = b"".join(response.streaming_content).decode("utf-8-sig").splitlines()
+        self.assertEqual(lines[0], "Marka,Model,Silnik,Moc (KM),Prędkość (km/h),Cena (PLN),Paliwo,Miejsca")
+        self.assertEqual(len(lines), 232)
+        ranked = search_car_ids("marka", limit=None)
+        self.assertEqual(lines[1 + ranked.index(car.id)].split(",")[:2], ["Hiperauto", "Marka"])
+
+    def test_index_is_rebuilt_after_catalogue_bump(self):
+        self.assertEqual(search_car_ids("superauto"), [])
+        self.assertIs(get_search_index(), get_search_index())
+        car = Car.objects.create(company_name="Superauto", car_name="X", engine="V12")
+        bump_catalogue_version()
+        self.assertEqual(search_car_ids("superauto"), [car.id])
+
+
+class LargeTextSearchTests(IsolatedArtifactsMixin, TestCase):
+    """Strona wyników z tysięcy dopasowań pobiera tylko swoje auta, bez rankingu w SQL."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Car.objects.bulk_create(
+            Car(company_name="Marka", car_name=f"Model {i}", engine="V8", horsepower=100 + i % 300, seats=5)
+            for i in range(4000)
+        )
+
+    def setUp(self):
+        super().setUp()
+        caches["template_fragments"].clear()
+
+    def test_page_query_does_not_grow_with_matches(self):
+        ranked = search_car_ids("marka", limit=None)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("search"), {"q": "marka", "page": 3})
+        page = response.context["page_obj"]
+        self.assertEqual(page.paginator.count, 4000)
+        self.assertEqual([car.id for car in page], ranked[20:30])
+        for query in queries.captured_queries:
+            self.assertNotIn("CASE", query["sql"])
+            self.assertLess(len(query["sql"]), 2000)
+
+    def test_other_filters_keep_rank_order(self):
+        results = apply_text_search(Car.objects.filter(horsepower__lt=110), "marka")
+        ranked = search_car_ids("marka", limit=None)
+        allowed = set(Car.objects.filter(horsepower__lt=110).values_list("id", flat=True))
+        expected = [car_id for car_id in ranked if car_id in allowed]
+        self.assertEqual(results.count(), len(allowed))
+        self.assertEqual([car.id for car in results[:5]], expected[:5])
+
+
+class SuggestIndexTests(SimpleTestCase):
+    """Podpowiedzi typeahead: prefiks bez względu na wielkość liter, najczęstsze najpierw."""
+
+    def setUp(self):
+        self.index = SuggestIndex([
+            ("BMW", "M3", "V8"),
+            ("BMW", "M5", "V8"),
+            ("Mazda", "MX-5", "R4"),
+            ("Audi", "RS6", "V8"),
+            ("Mercedes", "B-klasa", "R4"),
+        ])
+
+    def test_prefix_matches_names_by_frequency(self):
+        self.assertEqual(
+            [(s["value"], s["field"], s["count"]) for s in self.index.suggest("m")],
+            [("M3", "car_name", 1), ("M5", "car_name", 1), ("Mazda", "company_name", 1),
+             ("Mercedes", "company_name", 1), ("MX-5", "car_name", 1)],
+        )
+        # BMW (2 auta) przed rzadszym, choć alfabetycznie wcześniejszym "B-klasa"
+        self.assertEqual([s["value"] for s in self.index.suggest("b")], ["BMW", "B-klasa"])
+        self.assertEqual(self.index.suggest("V")[0], {"value": "V8", "field": "engine", "count": 3})
+
+    def test_field_and_limit(self):
+        self.assertEqual([s["value"] for s in self.index.suggest("m", field="company_name")], ["Mazda", "Mercedes"])
+        self.assertEqual([s["value"] for s in self.index.suggest("m", limit=2)], ["M3", "M5"])
+
+    def test_empty_query_suggests_nothing(self):
+        self.assertEqual(self.index.suggest(""), [])
+        self.assertEqual(self.index.suggest("   "), [])
+        self.assertEqual(self.index.suggest("xyz"), [])
+
+
+class SuggestViewTests(IsolatedArtifactsMixin, TestCase):
+    """/suggest/: walidacja pola, granice limitu i przebudowa indeksu po zmianie katalogu."""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_cars(60)
+
+    def suggest(self, **params):
+        return self.client.get(reverse("suggest"), params)
+
+    def test_short_query_and_limit_bounds(self):
+        self.assertEqual(len(self.suggest(q="m").json()), 10)
+        self.assertEqual(len(self.suggest(q="model", limit=100).json()), 50)
+        self.assertEqual(len(self.suggest(q="model", limit=0).json()), 1)
+        self.assertEqual(len(self.suggest(q="model", limit="dużo").json()), 10)
+        self.assertEqual(self.suggest(q="").json(), [])
+        self.assertEqual(self.suggest(q="model 1", field="car_name").json()[0]["value"], "Model 1")
+
+    def test_unknown_field_is_rejected(self):
+        self.assertEqual(self.suggest(q="m", field="cars_price").status_code, 400)
+
+    def test_index_is_rebuilt_after_catalogue_bump(self):
+        self.assertEqual(self.suggest(q="superauto").json(), [])
+        self.assertIs(get_suggest_index(), get_suggest_index())
+        Car.objects.create(company_name="Superauto", car_name="X", engine="V12")
+        bump_catalogue_version()
+        self.assertEqual(
+            self.suggest(q="super").json(),
+            [{"value": "Superauto", "field": "company_name", "count": 1}],
+        )
+
+
+class FacetTests(IsolatedArtifactsMixin, TestCase):
+    """Facety: histogram i licznik bez COUNT, dopisywanie nowych aut bez pełnej przebudowy."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cars = create_cars(30)
+
+    def histogram_total(self, stats, field):
+        return sum(bin["count"] for bin in stats.histogram(field))
+
+    def test_facets_view_counts_cars_in_range(self):
+        response = self.client.get(reverse("facets"), {"field": "horsepower", "min": 150, "max": 250})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["count"], Car.objects.filter(horsepower__gte=150, horsepower__lte=250).count())
+        self.assertEqual(sum(bin["count"] for bin in data["bins"]), 30)
+
+        diesel = self.client.get(reverse("facets"), {"field": "seats", "fuel_type": "Diesel"}).json()
+        self.assertEqual(diesel["count"], Car.objects.filter(fuel_type="Diesel").count())
+
+    def test_facets_view_combines_brand_and_fuel(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Car.objects.create(company_name="Inna", car_name="Ropniak", horsepower=150, fuel_type="Diesel", seats=5)
+        data = self.client.get(
+            reverse("facets"), {"field": "horsepower", "min": 150, "company_name": "Marka", "fuel_type": "Diesel"}
+        ).json()
+        expected = Car.objects.filter(company_name="Marka", fuel_type="Diesel", horsepower__gte=150)
+        self.assertEqual(data["count"], expected.count())
+        self.assertGreater(data["count"], 0)
+        self.assertLess(data["count"], Car.objects.filter(fuel_type="Diesel", horsepower__gte=150).count())
+        brand_fuel = Car.objects.filter(company_name="Marka", fuel_type="Diesel")
+        self.assertEqual(sum(bin["count"] for bin in data["bins"]), brand_fuel.count())
+
+    def test_facets_view_rejects_bad_input(self):
+        self.assertEqual(self.client.get(reverse("facets"), {"field": "engine"}).status_code, 400)
+        self.assertEqual(self.client.get(reverse("facets"), {"field": "seats", "min": "dużo"}).status_code, 400)
+
+    def test_new_cars_are_added_incrementally(self):
+        get_facet_stats()
+        with self.captureOnCommitCallbacks(execute=True):
+            Car.objects.create(company_name="Marka", car_name="Rakieta", horsepower=5000, total_speed=400,
+                               cars_price=9000000, fuel_type="Petrol", seats=2)
+        # Tylko nowe auta z bazy, a granice obejmują wartość spoza dotychczasowego zakresu
+        with self.assertNumQueries(1):
+            stats = get_facet_stats()
+        self.assertEqual(stats.histogram("horsepower")[-1]["max"], 5000)
+        self.assertEqual(stats.count_between("horsepower", min_value=1000), 1)
+        self.assertEqual(self.histogram_total(stats, "horsepower"), 31)
+        self.assertEqual(stats.histogram("horsepower"), FacetStats.from_database().histogram("horsepower"))
+
+    def test_changed_car_rebuilds_stats(self):
+        get_facet_stats()
+        car = self.cars[0]
+        car.horsepower = 4000
+        with self.captureOnCommitCallbacks(execute=True):
+            car.save()
+        stats = get_facet_stats()
+        self.assertEqual(stats.count_between("horsepower", min_value=4000), 1)
+        self.assertEqual(self.histogram_total(stats, "horsepower"), 30)
+
+    def test_change_log_lists_cars_of_each_version(self):
+        start = get_catalogue_version()
+        bump_catalogue_version(car_ids=[3, 1])
+        bump_catalogue_version(car_ids=[7])
+        self.assertEqual(catalogue_changes_since(start, start + 2), {1, 3, 7})
+        self.assertEqual(catalogue_changes_since(start + 2, start + 2), set())
+        bump_catalogue_version()
+        self.assertIsNone(catalogue_changes_since(start, start + 3))
+        self.assertIsNone(catalogue_changes_since(None, start + 3))
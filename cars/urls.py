@@ -1,5 +1,7 @@
 from django.urls import path
 from . import views
+from .metrics import metrics_view
+from .warmup import readiness_view
 
 urlpatterns = [
     path('', views.home, name='home'),
@@ -8,9 +10,14 @@ urlpatterns = [
     path('login/', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
     path("recommend/", views.recommend_car, name="recommend_car"),
+    path("recommend/batch/", views.recommend_batch, name="recommend_batch"),
     path('search/', views.search, name='search'),
     path('get-models/', views.get_models_by_brand, name='get_models_by_brand'),
     path("get-engines/", views.get_engines, name="get_engines"),
+    path("suggest/", views.suggest, name="suggest"),
+    path("facets/", views.facets, name="facets"),
+    path("metrics/", metrics_view, name="metrics"),
+    path("ready/", readiness_view, name="ready"),
     path('quiz/', views.quiz_view, name='quiz'),
     path('quiz/results/', views.quiz_results_view, name='quiz_results'),
 
@@ -1,6 +1,13 @@
+from urllib.parse import urlencode
+
+from django.db.models import Q
+
+from .lookups import normalize_fuel_type
+from .models import Brand, FuelType
+
 def apply_filters(queryset, form_data):
     if form_data.get("company_name"):
-        queryset = queryset.filter(company_name__in=form_data["company_name"])
+        queryset = queryset.filter(lookup_filter("brand", Brand, name__in=form_data["company_name"]))
 
     if form_data.get("car_name"):
         queryset = queryset.filter(car_name__in=form_data["car_name"])
@@ -9,13 +16,47 @@ def apply_filters(queryset, form_data):
         queryset = queryset.filter(engine__in=form_data["engine"])
 
     if form_data.get("fuel_type"):
-        queryset = queryset.filter(fuel_type=form_data["fuel_type"])
+        queryset = queryset.filter(fuel_type_filter(form_data["fuel_type"]))
 
     if form_data.get("seats"):
         queryset = queryset.filter(seats=form_data["seats"])
 
     return queryset
 
+def lookup_filter(field, model, **name_lookup):
+    """
+    Warunek na kluczu do słownika (brand, car_model, fuel) zamiast na tekście.
+
+    Przykład:
+        lookup_filter("brand", Brand, name="Kia")
+        -> brand_id IN (SELECT id FROM cars_brand WHERE name = 'Kia')
+    """
+    return Q(**{f"{field}_id__in": model.objects.filter(**name_lookup).values("id")})
+
+
+def fuel_type_filter(fuel_type):
+    """Filtr paliwa; akceptuje też stare zapisy typu "plug in hybrid"."""
+    return lookup_filter("fuel", FuelType, name=normalize_fuel_type(fuel_type))
+
+
+def canonical_query(params, exclude=()):
+    """
+    Parametry żądania w stałej postaci (posortowane, bez pustych wartości) -
+    te same filtry podane w innej kolejności dają ten sam klucz cache.
+
+    Przykład:
+        canonical_query(QueryDict("page=2&q=bmw&seats="))  -> "page=2&q=bmw"
+    """
+    items = sorted(
+        (key, value)
+        for key in params
+        if key not in exclude
+        for value in params.getlist(key)
+        if value != ""
+    )
+    return urlencode(items)
+
+
 def build_user_vector(form_data):
     def midpoint(min_val, max_val):
         if min_val is not None and max_val is not None:
@@ -26,4 +67,75 @@ def build_user_vector(form_data):
         "horsepower": midpoint(form_data.get("min_power"), form_data.get("max_power")),
         "total_speed": midpoint(form_data.get("min_speed"), form_data.get("max_speed")),
         "cars_price": midpoint(form_data.get("min_price"), form_data.get("max_price")),
-    }
\ No newline at end of file
+    }
+
+class RankedResults:
+    """
+    Auta z querysetu w kolejności trafności wyszukiwania pełnotekstowego.
+
+    Ranking jest listą id w Pythonie: licznik to jej długość, a strona
+    (wycinek) pobiera z bazy tylko swoje auta przez in_bulk - bez
+    sortowania CASE po wszystkich dopasowaniach w SQL. Obiekt nadaje się
+    jako object_list dla Paginatora.
+    """
+
+    def __init__(self, queryset, ranked_ids):
+        self.queryset = queryset
+        self.ranked_ids = ranked_ids
+
+    def count(self):
+        return len(self.ranked_ids)
+
+    def __len__(self):
+        return len(self.ranked_ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._fetch(self.ranked_ids[index])
+        return self._fetch([self.ranked_ids[index]])[0]
+
+    def _fetch(self, car_ids):
+        cars_by_id = self.queryset.in_bulk(car_ids)
+        return [cars_by_id[car_id] for car_id in car_ids if car_id in cars_by_id]
+
+    def iter_values(self, *fields, chunk_size=2000):
+        """
+        Słowniki pól (jak queryset.values) w kolejności rankingu, pobierane
+        porcjami po chunk_size aut - np. do strumieniowania CSV.
+        """
+        for start in range(0, len(self.ranked_ids), chunk_size):
+            chunk = self.ranked_ids[start:start + chunk_size]
+            rows = {
+                row["id"]: row
+                for row in self.queryset.filter(id__in=chunk).values("id", *fields)
+            }
+            for car_id in chunk:
+                if car_id in rows:
+                    row = rows[car_id]
+                    yield {field: row[field] for field in fields}
+
+
+def apply_text_search(queryset, query):
+    """
+    Auta z querysetu pasujące do wyszukiwania pełnotekstowego, posortowane
+    według trafności.
+
+    Ranking obejmuje wszystkie pasujące auta - stronicowanie, licznik
+    wyników i eksport CSV widzą pełny wynik, a nie tylko jego początek.
+    Wywoływane po pozostałych filtrach: wynik nie jest już querysetem.
+
+    Returns:
+        RankedResults
+
+    Przykład:
+        results = apply_text_search(Car.objects.filter(seats=5), "bmw m3")
+        page = Paginator(results, 10).get_page(1)
+    """
+    from .search_index import search_car_ids
+
+    ranked_ids = search_car_ids(query, limit=None)
+    if ranked_ids and queryset.query.has_filters():
+        # Pozostałe filtry: id spełniających je aut, bez listy dopasowań w SQL
+        allowed = set(queryset.values_list("id", flat=True))
+        ranked_ids = [car_id for car_id in ranked_ids if car_id in allowed]
+    return RankedResults(queryset, ranked_ids)
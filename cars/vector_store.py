@@ -0,0 +1,211 @@
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from .catalogue import VersionedArtifact
+from .records import get_catalogue_snapshot
+
+FEATURES = ("horsepower", "total_speed", "cars_price", "seats")
+DTYPES = ("float32", "int8")
+
+# Wiersze liczone naraz: 4096 x 4 cechy x float32 = 64 KB, mieści się w L2
+BLOCK_ROWS = 4096
+# Zapas na błędy zaokrągleń float32 przy sumowaniu kwadratów w bloku
+ROUNDING_MARGIN = 1e-4
+FLOAT32_EPS = float(np.finfo(np.float32).eps)
+
+
+class VectorStore:
+    """
+    Cechy liczbowe katalogu w zwartej postaci do wyszukiwania sąsiadów.
+
+    Każda cecha jest zapisana jako kod: x ~= offset + step * code, gdzie kod
+    to float32 (x - średnia, 16 B na auto) albo int8 (256 poziomów między
+    minimum a maksimum, 4 B na auto). Dokładne wartości float64 zostają
+    w snapshocie katalogu (współdzielony memmap) i są czytane tylko dla
+    kandydatów z przybliżonego przejścia.
+
+    Przybliżona odległość różni się od dokładnej najwyżej o znaną granicę
+    błędu kwantyzacji, więc po przebadaniu kandydatów w granicy od k-tego
+    wyniku TOP K jest taki sam jak przy liczeniu wszystkiego w float64.
+    """
+
+    def __init__(self, ids, codes, offset, step, half_step, complete, exact):
+        self.ids = ids
+        self.codes = codes
+        self.offset = offset
+        self.step = step
+        # Maksymalny błąd kwantyzacji w jednostkach kodu, per cecha
+        self.half_step = half_step
+        self.complete = complete
+        self.exact = exact
+        self._buffers = threading.local()
+
+    @classmethod
+    def from_snapshot(cls, snapshot, features=FEATURES, dtype="float32"):
+        if dtype not in DTYPES:
+            raise ValueError(f"Nieobsługiwany typ wektorów: {dtype} (dostępne: {', '.join(DTYPES)})")
+        exact = [snapshot.numeric[field] for field in features]
+        complete = np.ones(len(snapshot), dtype=bool)
+        for column in exact:
+            complete &= ~np.isnan(column)
+
+        count = len(snapshot)
+        codes = np.zeros((count, len(features)), dtype=dtype)
+        offset = np.zeros(len(features))
+        step = np.ones(len(features))
+        half_step = np.zeros(len(features))
+        for j, column in enumerate(exact):
+            values = column[complete]
+            if not len(values):
+                continue
+            if dtype == "int8":
+                low, high = float(values.min()), float(values.max())
+                step[j] = (high - low) / 255 or 1.0
+                offset[j] = low + 128 * step[j]
+                half_step[j] = 0.5
+            else:
+                # Centrowanie zmniejsza wartości (ceny ~1e6), a z nimi błąd float32
+                offset[j] = float(values.mean())
+                half_step[j] = float(np.abs(values - offset[j]).max()) * FLOAT32_EPS
+            quantized = (values - offset[j]) / step[j]
+            if dtype == "int8":
+                quantized = np.clip(np.rint(quantized), -128, 127)
+            codes[complete, j] = quantized
+
+        return cls(snapshot.ids, codes, offset, step, half_step, complete, exact)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self):
+        """Pamięć kodów (dokładne kolumny należą do snapshotu)."""
+        return self.codes.nbytes + self.complete.nbytes
+
+    def positions(self, car_ids):
+        """Pozycje aut z kompletem cech; None, jeśli któregoś id nie ma w magazynie."""
+        car_ids = np.asarray(car_ids, dtype=np.int64)
+        positions = np.searchsorted(self.ids, car_ids)
+        positions = np.minimum(positions, max(len(self.ids) - 1, 0))
+        if len(car_ids) and (not len(self.ids) or not np.array_equal(self.ids[positions], car_ids)):
+            return None
+        positions = positions[self.complete[positions]]
+        positions.sort()
+        return positions
+
+    def scaling(self, positions):
+        """
+        Wariancje cech w podzbiorze (populacyjne, jak StandardScaler).
+
+        Liczone blokami na dokładnych wartościach, z centrowaniem na
+        offsecie magazynu, bez kopiowania całego podzbioru.
+        """
+        count = len(positions)
+        sums = np.zeros(len(self.exact))
+        sums_sq = np.zeros(len(self.exact))
+        for start in range(0, count, BLOCK_ROWS):
+            block = positions[start:start + BLOCK_ROWS]
+            for j, column in enumerate(self.exact):
+                values = column[block] - self.offset[j]
+                sums[j] += values.sum()
+                sums_sq[j] += values @ values
+        means = sums / count
+        variances = sums_sq / count - means ** 2
+        # Stała cecha: skala 1, tak jak StandardScaler
+        variances[variances <= 1e-12 * np.maximum(sums_sq / count, 1.0)] = 1.0
+        return variances
+
+    def _block_buffers(self):
+        buffers = getattr(self._buffers, "value", None)
+        if buffers is None:
+            buffers = self._buffers.value = (
+                np.empty((BLOCK_ROWS, self.codes.shape[1]), dtype=self.codes.dtype),
+                np.empty((BLOCK_ROWS, self.codes.shape[1]), dtype=np.float32),
+            )
+        return buffers
+
+    def approximate_distances(self, positions, target, weights, out):
+        """
+        Kwadraty ważonych odległości na kodach, blok po bloku.
+
+        Args:
+            positions: pozycje aut (posortowane)
+            target: wektor zapytania w jednostkach kodu
+            weights: waga cechy w jednostkach kodu (step^2 / wariancja)
+            out: tablica float32 o długości len(positions) na wyniki
+        """
+        code_buffer, work = self._block_buffers()
+        target = target.astype(np.float32)
+        weights = weights.astype(np.float32)
+        for start in range(0, len(positions), BLOCK_ROWS):
+            block = positions[start:start + BLOCK_ROWS]
+            rows = len(block)
+            np.take(self.codes, block, axis=0, out=code_buffer[:rows])
+            np.subtract(code_buffer[:rows], target, out=work[:rows], casting="unsafe")
+            np.square(work[:rows], out=work[:rows])
+            np.dot(work[:rows], weights, out=out[start:start + rows])
+        return out
+
+    def exact_distances(self, positions, user_row, variances):
+        """Odległości po standaryzacji liczone w float64 dla wybranych aut."""
+        squared = np.zeros(len(positions))
+        for j, column in enumerate(self.exact):
+            diff = column[positions] - user_row[j]
+            squared += diff * diff / variances[j]
+        return np.sqrt(squared)
+
+    def top_k(self, positions, user_row, top_n, timer=None):
+        """
+        TOP N najbliższych aut wśród positions w metryce find_top_similar_cars
+        (cechy standaryzowane na tym samym podzbiorze).
+
+        Args:
+            positions: niepusta tablica pozycji z positions()
+            user_row: wartości cech zapytania (kolejność FEATURES)
+            top_n: liczba wyników
+            timer: opcjonalny StageTimer (etapy scale, distance, topk)
+
+        Returns:
+            (pozycje, odległości) posortowane rosnąco po odległości
+        """
+        user_row = np.asarray(user_row, dtype=np.float64)
+        variances = self.scaling(positions)
+        weights = self.step ** 2 / variances
+        target = (user_row - self.offset) / self.step
+        if timer is not None:
+            timer.mark("scale")
+
+        approximate = np.empty(len(positions), dtype=np.float32)
+        self.approximate_distances(positions, target, weights, approximate)
+        if timer is not None:
+            timer.mark("distance")
+
+        k = min(top_n, len(positions))
+        kth = float(np.partition(approximate, k - 1)[k - 1])
+        # Błąd odległości <= ||błąd kodów|| w tej samej metryce; auto z prawdziwego
+        # TOP K ma przybliżoną odległość najwyżej o 2 * bound większą od k-tej
+        code_error = self.half_step + np.abs(target) * FLOAT32_EPS
+        bound = float(np.sqrt(np.sum(weights * code_error ** 2)))
+        limit = (np.sqrt(kth) + 2 * bound) ** 2 * (1 + ROUNDING_MARGIN)
+        candidates = positions[approximate <= limit]
+
+        distances = self.exact_distances(candidates, user_row, variances)
+        order = np.lexsort((candidates, distances))[:k]
+        if timer is not None:
+            timer.mark("topk")
+        return candidates[order], distances[order]
+
+
+def _build_vector_store():
+    dtype = getattr(settings, "CARS_VECTOR_STORE_DTYPE", "float32")
+    return VectorStore.from_snapshot(get_catalogue_snapshot(), dtype=dtype)
+
+
+_vector_store = VersionedArtifact(_build_vector_store, name="vector_store")
+
+
+def get_vector_store():
+    """Magazyn wektorów dla bieżącej wersji katalogu."""
+    return _vector_store.get()
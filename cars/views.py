@@ -2,13 +2,23 @@ from django.shortcuts import render, redirect
 from django.contrib.auth import login as auth_login, authenticate, logout as auth_logout
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse
-from .models import Car, UserCarRating
-from .forms import CarFilterForm, CarSelectForm, CompanyConstraintsForm
-import pandas as pd
-from .knn import find_most_similar_car
-from .collaborative_filtering import get_random_cars_for_quiz, recommend_cars_collaborative
-from .utils import apply_filters, build_user_vector
+from django.http import StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+import csv
+import json
+from asgiref.sync import sync_to_async
+from .models import Brand, Car, CarModel, UserCarRating
+from .forms import CarFilterForm, CarSelectForm, CompanyConstraintsForm, company_choices
+from .admission import Overloaded, admission, reject
+from .collaborative_filtering import get_random_cars_for_quiz, get_top_rated_cars
+from .hybrid import recommend_cars_hybrid
+from .utils import apply_filters, apply_text_search, build_user_vector, canonical_query, fuel_type_filter, lookup_filter
+from .search_index import SUGGEST_FIELDS, get_suggest_index
+from .facets import FACET_FIELDS, get_facet_stats
+from .recommendations import recommend_similar_batch, recommend_similar_precomputed, recommend_similar_shared
+from .executor import run_compute
+from .catalogue import batch_update
 
 def index(request):
     qs = Car.objects.all()
@@ -29,7 +39,7 @@ def index(request):
         data = form.cleaned_data
         # filtrowanie po wielu polach
         if data.get('company_name'):
-            qs = qs.filter(company_name__in=data['company_name'])
+            qs = qs.filter(lookup_filter('brand', Brand, name__in=data['company_name']))
             filtered = True
         if data.get('car_name'):
             qs = qs.filter(car_name__in=data['car_name'])
@@ -57,7 +67,7 @@ def index(request):
             filtered = True
         if data.get('fuel_type'):
             if data['fuel_type'] != '':
-                qs = qs.filter(fuel_type=data['fuel_type'])
+                qs = qs.filter(fuel_type_filter(data['fuel_type']))
                 filtered = True
         if data.get('seats'):
             qs = qs.filter(seats__icontains=data['seats'])
@@ -74,32 +84,75 @@ def index(request):
     return render(request, 'cars/index.html', context)
 
 
+def car_name_choices(company_name, car_name):
+    """
+    Modele potrzebne do walidacji formularza: tylko modele wybranej marki
+    (albo sam przesłany model), zamiast wszystkich modeli z bazy.
+    """
+    if company_name:
+        return sorted(
+            Car.objects.filter(lookup_filter('brand', Brand, name=company_name))
+            .values_list('car_name', flat=True)
+            .distinct()
+        )
+    if car_name and get_suggest_index().contains('car_name', car_name):
+        return [car_name]
+    return []
+
+
+def engine_names(company_name, car_name):
+    engines = Car.objects.all()
+    if company_name:
+        engines = engines.filter(lookup_filter('brand', Brand, name=company_name))
+    if car_name:
+        engines = engines.filter(car_name=car_name)
+    return sorted(engine for engine in engines.values_list("engine", flat=True).distinct() if engine)
+
+
+def set_filter_choices(form, params):
+    """
+    Wybory pól marki, modelu i silnika w formularzu filtrów.
+
+    Listy są liczone leniwie: przy walidacji przesłanej wartości albo przy
+    renderowaniu listy, której fragment zwykle jest już w cache szablonów.
+    """
+    company_name = params.get("company_name")
+    car_name = params.get("car_name")
+    form.fields['company_name'].choices = company_choices
+    form.fields['car_name'].choices = lambda: [(c, c) for c in car_name_choices(company_name, car_name) if c]
+    form.fields['engine'].choices = lambda: [("", "Wszystkie")] + [(c, c) for c in engine_names(company_name, car_name)]
+
+
+CSV_COLUMNS = [
+    ('company_name', 'Marka'), ('car_name', 'Model'), ('engine', 'Silnik'),
+    ('horsepower', 'Moc (KM)'), ('total_speed', 'Prędkość (km/h)'), ('cars_price', 'Cena (PLN)'),
+    ('fuel_type', 'Paliwo'), ('seats', 'Miejsca'),
+]
+
+
+class _Echo:
+    """Bufor dla csv.writer, który oddaje wiersz zamiast go zapisywać."""
+
+    def write(self, value):
+        return value
+
+
 def download_csv(request):
     qs = Car.objects.all()
     
-    companies = sorted(Car.objects.values_list('company_name', flat=True).distinct())
-    car_names = sorted(Car.objects.values_list('car_name', flat=True).distinct())
-    
-    engines_qs = Car.objects.all()
-    if request.GET.get("company_name"):
-        engines_qs = engines_qs.filter(company_name=request.GET.get("company_name"))
-    if request.GET.get("car_name"):
-        engines_qs = engines_qs.filter(car_name=request.GET.get("car_name"))
-    engines = sorted(engines_qs.values_list("engine", flat=True).distinct())
-    
     form = CarFilterForm(request.GET or None)
-    form.fields['company_name'].choices = [(c, c) for c in companies if c]
-    form.fields['car_name'].choices = [(c, c) for c in car_names if c]
-    form.fields['engine'].choices = [("", "Wszystkie")] + [(c, c) for c in engines if c]
+    set_filter_choices(form, request.GET)
     
     # ✅ TA SAMA LOGIKA FILTROWANIA CO W search()
+    query = None
     if form.is_valid():
         data = form.cleaned_data
         
+        query = data.get('q')
         if data.get('company_name'):
-            qs = qs.filter(company_name__iexact=data['company_name'])
+            qs = qs.filter(lookup_filter('brand', Brand, name__iexact=data['company_name']))
         if data.get('car_name'):
-            qs = qs.filter(car_name__iexact=data['car_name'])
+            qs = qs.filter(lookup_filter('car_model', CarModel, name__iexact=data['car_name']))
         
         engine_list = data.get('engine')
         if engine_list:
@@ -120,27 +173,25 @@ def download_csv(request):
         if data.get('max_price') is not None:
             qs = qs.filter(cars_price__lte=data['max_price'])
         if data.get('fuel_type'):
-            qs = qs.filter(fuel_type=data['fuel_type'])
+            qs = qs.filter(fuel_type_filter(data['fuel_type']))
         if data.get('seats'):
             qs = qs.filter(seats=data['seats'])
     
-    # ✅ Tworzenie CSV
-    if qs.exists():
-        df = pd.DataFrame(list(qs.values(
-            'company_name', 'car_name', 'engine', 'horsepower', 
-            'total_speed', 'cars_price', 'fuel_type', 'seats'
-        )))
-        
-        # Polskie nazwy kolumn
-        df.columns = ['Marka', 'Model', 'Silnik', 'Moc (KM)', 
-                      'Prędkość (km/h)', 'Cena (PLN)', 'Paliwo', 'Miejsca']
+    # ✅ Tworzenie CSV - strumieniowo, porcjami (wyniki wyszukiwania w kolejności trafności)
+    fields = [field for field, _ in CSV_COLUMNS]
+    if query:
+        rows = apply_text_search(qs, query).iter_values(*fields)
     else:
-        df = pd.DataFrame(columns=['Marka', 'Model', 'Silnik', 'Moc (KM)', 
-                                   'Prędkość (km/h)', 'Cena (PLN)', 'Paliwo', 'Miejsca'])
-    
-    csv = df.to_csv(index=False, encoding='utf-8-sig')
-    
-    response = HttpResponse(csv, content_type='text/csv; charset=utf-8-sig')
+        rows = qs.values(*fields).iterator(chunk_size=2000)
+
+    def lines():
+        writer = csv.writer(_Echo())
+        yield '\ufeff'  # BOM - Excel rozpoznaje UTF-8
+        yield writer.writerow([label for _, label in CSV_COLUMNS])
+        for row in rows:
+            yield writer.writerow([row[field] for field in fields])
+
+    response = StreamingHttpResponse(lines(), content_type='text/csv; charset=utf-8')
     response['Content-Disposition'] = 'attachment; filename="wyniki_filtrowania.csv"'
     
     return response
@@ -182,38 +233,19 @@ def search(request):
         return download_csv(request)
     qs = Car.objects.all()
 
-    companies = sorted(Car.objects.values_list('company_name', flat=True).distinct())
-    car_names = sorted(Car.objects.values_list('car_name', flat=True).distinct())
-    engines_qs = Car.objects.all()
-
-    if request.GET.get("company_name"):
-        engines_qs = engines_qs.filter(company_name=request.GET.get("company_name"))
-
-    if request.GET.get("car_name"):
-        engines_qs = engines_qs.filter(car_name=request.GET.get("car_name"))
-
-    engines = sorted(engines_qs.values_list("engine", flat=True).distinct())
-
-
     form = CarFilterForm(request.GET or None)
-    form.fields['company_name'].choices = [(c, c) for c in companies if c]
-    form.fields['car_name'].choices = [(c, c) for c in car_names if c]
-    form.fields['engine'].choices = [("", "Wszystkie")] + [(c, c) for c in engines if c]
+    set_filter_choices(form, request.GET)
 
     filtered = False
 
-    print("IS VALID:", form.is_valid())
-    print("FORM ERRORS:", form.errors)
-
     if form.is_valid():
         data = form.cleaned_data
-        print("CLEANED DATA:", data)
 
         if data.get('company_name'):
-            qs = qs.filter(company_name__iexact=data['company_name'])
+            qs = qs.filter(lookup_filter('brand', Brand, name__iexact=data['company_name']))
             filtered = True
         if data.get('car_name'):
-            qs = qs.filter(car_name__iexact=data['car_name'])
+            qs = qs.filter(lookup_filter('car_model', CarModel, name__iexact=data['car_name']))
             filtered = True
 
         engine_list = data.get('engine')
@@ -244,14 +276,15 @@ def search(request):
             qs = qs.filter(cars_price__lte=data['max_price'])
             filtered = True
         if data.get('fuel_type'):
-            qs = qs.filter(fuel_type=data['fuel_type'])
+            qs = qs.filter(fuel_type_filter(data['fuel_type']))
             filtered = True
         if data.get('seats'):
             qs = qs.filter(seats=data['seats'])
             filtered = True
-
-    print("FINAL QS:", qs.query)
-
+        # Na końcu: ranking trafności to lista id, strona pobiera tylko swoje auta
+        if data.get('q'):
+            qs = apply_text_search(qs, data['q'])
+            filtered = True
 
     paginator = Paginator(qs, 10)  # 10 wyników na stronę
     page_number = request.GET.get("page")
@@ -262,14 +295,12 @@ def search(request):
     "results": page_obj,
     "filtered": filtered,
     "page_obj": page_obj,
+    "filter_key": canonical_query(request.GET),
 })
 
 
-def recommend_car(request):
-    from .knn import find_top_similar_cars  # Nowa funkcja zwracająca top 5
-    
+async def recommend_car(request):
     constraints_form = CompanyConstraintsForm()
-    select_form = CarSelectForm()
     
     result_cars = []  # Lista top 5 aut
     error = None
@@ -277,106 +308,74 @@ def recommend_car(request):
     company = request.POST.get("company_name")
     model = request.POST.get("car_name")
     
-    # Inicjalizacja formularzy
+    # Inicjalizacja formularzy (wybory marek i modeli CarSelectForm są liczone
+    # dopiero przy renderowaniu, więc konstruktor nie odpytuje bazy)
+    select_form = CarSelectForm(company_name=company)
     if request.method == "POST":
         constraints_form = CompanyConstraintsForm(request.POST)
-        
-        # Dynamiczne ustawienie wyborów dla marki
-        company_choices = sorted(set(
-            Car.objects.exclude(company_name__isnull=True)
-            .values_list('company_name', flat=True)
-        ))
-        select_form.fields['company_name'].choices = [(c, c) for c in company_choices]
-        
-        # Dynamiczne ustawienie wyborów dla modelu
-        if company:
-            model_choices = sorted(set(
-                Car.objects.filter(company_name=company)
-                .values_list('car_name', flat=True)
-            ))
-            select_form.fields['car_name'].choices = [(m, m) for m in model_choices]
     
-    # Przetwarzanie rekomendacji
+    # Przetwarzanie rekomendacji (KNN w puli wątków, poza pętlą zdarzeń; identyczne
+    # równoczesne żądania dzielą jedno obliczenie, a limit dotyczy tylko liczących)
+    overloaded = False
     if company and model and constraints_form.is_valid():
         try:
-            # 1. Znajdź auto bazowe
-            base_car = Car.objects.filter(
-                company_name=company, 
-                car_name=model
-            ).first()
-            
-            if not base_car:
-                raise ValueError("❌ Nie znaleziono wybranego auta!")
-            
-            # 2. Przygotuj wektor użytkownika (z auta bazowego)
-            user_vector = {}
-            for field in ["horsepower", "total_speed", "cars_price", "seats"]:
-                val = getattr(base_car, field)
-                try:
-                    user_vector[field] = float(val) if val is not None else None
-                except (ValueError, TypeError):
-                    user_vector[field] = None
-            
-            # 3. Zastosuj ograniczenia firmowe
-            cars_queryset = Car.objects.exclude(id=base_car.id)
-            constraints = constraints_form.cleaned_data
-            
-            if constraints.get('max_price') is not None:
-                cars_queryset = cars_queryset.filter(
-                    cars_price__lte=constraints['max_price']
-                )
-            if constraints.get('min_price') is not None:
-                cars_queryset = cars_queryset.filter(
-                    cars_price__gte=constraints['min_price']
-                )
-            if constraints.get('max_horsepower') is not None:
-                cars_queryset = cars_queryset.filter(
-                    horsepower__lte=constraints['max_horsepower']
+            try:
+                result_cars = await recommend_similar_shared(
+                    company, model, constraints_form.cleaned_data, top_n=5, admission_name="recommend_car"
                 )
-            if constraints.get('min_horsepower') is not None:
-                cars_queryset = cars_queryset.filter(
-                    horsepower__gte=constraints['min_horsepower']
-                )
-            if constraints.get('fuel_type'):
-                cars_queryset = cars_queryset.filter(
-                    fuel_type=constraints['fuel_type']
-                )
-            if constraints.get('max_seats') is not None:
-                cars_queryset = cars_queryset.filter(
-                    seats__lte=constraints['max_seats']
-                )
-            if constraints.get('min_seats') is not None:
-                cars_queryset = cars_queryset.filter(
-                    seats__gte=constraints['min_seats']
-                )
-            
-            # Sprawdź czy są dostępne auta po filtracji
-            if cars_queryset.count() == 0:
-                raise ValueError(
-                    "⚠️ Brak aut spełniających ograniczenia firmowe! "
-                    "Spróbuj złagodzić kryteria."
-                )
-            
-            # 4. Znajdź TOP 5 podobnych aut
-            top_results = find_top_similar_cars(cars_queryset, user_vector, top_n=5)
-            
-            # 5. Pobierz obiekty Car z wynikami
-            for car_id, distance in top_results:
-                car = Car.objects.get(id=car_id)
-                result_cars.append({
-                    'car': car,
-                    'distance': distance
-                })
-        
+            except Overloaded:
+                # Przeciążenie: tylko gotowa tabela sąsiadów, bez liczenia KNN
+                result_cars = await sync_to_async(recommend_similar_precomputed)(
+                    company, model, constraints_form.cleaned_data, top_n=5
+                ) or []
+                overloaded = not result_cars
         except Exception as e:
             error = str(e)
+    if overloaded:
+        error = "⏳ Serwer jest chwilowo przeciążony. Spróbuj ponownie za kilka sekund."
     
-    return render(request, "cars/recommend.html", {
+    response = await sync_to_async(render)(request, "cars/recommend.html", {
         "constraints_form": constraints_form,
         "select_form": select_form,
         "result_cars": result_cars,
-        "error": error
+        "error": error,
+        "filter_key": canonical_query(request.POST, exclude=("csrfmiddlewaretoken",)),
     })
+    return reject(response, "recommend_car") if overloaded else response
+
+
+QUIZ_SESSION_KEY = 'quiz_car_ids'
+
+
+def load_quiz_cars(session):
+    """
+    Auta bieżącego quizu z sesji w zapisanej kolejności albo None (brak
+    quizu, auto usunięte z katalogu, stary format listy).
+    """
+    value = session.get(QUIZ_SESSION_KEY)
+    if not isinstance(value, str) or not value:
+        return None
+    try:
+        car_ids = [int(car_id) for car_id in value.split(',')]
+    except ValueError:
+        return None
+    cars_by_id = Car.objects.in_bulk(car_ids)
+    if len(cars_by_id) != len(set(car_ids)):
+        return None
+    return [cars_by_id[car_id] for car_id in car_ids]
+
+
+def store_quiz_cars(session, cars):
+    """
+    Zapisuje id aut quizu jako krótki napis "12,7,40".
+
+    Sesja jest oznaczana jako zmieniona (i zapisywana) tylko wtedy, gdy
+    zestaw aut faktycznie się zmienił.
+    """
+    value = ','.join(str(car.id) for car in cars)
+    if session.get(QUIZ_SESSION_KEY) != value:
+        session[QUIZ_SESSION_KEY] = value
+
 
 @login_required
 def quiz_view(request):
@@ -391,29 +390,31 @@ def quiz_view(request):
         # Zapisz oceny użytkownika
         saved_count = 0
         
-        for key, value in request.POST.items():
-            if key.startswith('rating_'):
-                car_id = int(key.split('_')[1])
-                rating = int(value)
-                
-                # Zapisz lub zaktualizuj ocenę
-                UserCarRating.objects.update_or_create(
-                    user=request.user,
-                    car_id=car_id,
-                    defaults={'rating': rating}
-                )
-                saved_count += 1
+        # Jedno podbicie wersji ocen (i jedna przebudowa w tle) na cały quiz
+        with batch_update():
+            for key, value in request.POST.items():
+                if key.startswith('rating_'):
+                    car_id = int(key.split('_')[1])
+                    rating = int(value)
+                    
+                    # Zapisz lub zaktualizuj ocenę
+                    UserCarRating.objects.update_or_create(
+                        user=request.user,
+                        car_id=car_id,
+                        defaults={'rating': rating}
+                    )
+                    saved_count += 1
         
         # Przekieruj do wyników
         return redirect('quiz_results')
     
     # ETAP 2: Generuj quiz (jeśli użytkownik nie ocenił jeszcze lub chce powtórzyć)
     if 'reset_quiz' in request.GET or user_ratings_count == 0:
-        # Pobierz losowe auta do oceny
-        quiz_cars = get_random_cars_for_quiz(n=10)
-        
-        # Zapisz ID aut w sesji (żeby zachować te same auta przy odświeżeniu)
-        request.session['quiz_car_ids'] = [car.id for car in quiz_cars]
+        # Odświeżenie strony pokazuje te same auta (bez losowania i zapisu sesji)
+        quiz_cars = None if 'reset_quiz' in request.GET else load_quiz_cars(request.session)
+        if quiz_cars is None:
+            quiz_cars = get_random_cars_for_quiz(n=10)
+            store_quiz_cars(request.session, quiz_cars)
         
         return render(request, 'cars/quiz.html', {
             'quiz_cars': quiz_cars,
@@ -425,75 +426,205 @@ def quiz_view(request):
 
 
 @login_required
-def quiz_results_view(request):
-    """Wyświetla rekomendacje na podstawie collaborative filtering"""
+async def quiz_results_view(request):
+    """Wyświetla rekomendacje na podstawie ocen z quizu (pipeline hybrydowy)"""
     
-    user_ratings_count = UserCarRating.objects.filter(user=request.user).count()
+    user = await request.auser()
+    request.user = user  # szablon nie pobiera użytkownika drugi raz przez leniwe request.user
+    user_ratings_count = await UserCarRating.objects.filter(user=user).acount()
     
     if user_ratings_count == 0:
         # Użytkownik nie wypełnił jeszcze quizu
         return redirect('quiz')
     
     try:
-        # Generuj rekomendacje używając collaborative filtering
-        recommendations = recommend_cars_collaborative(request.user, top_n=5)
+        # Rekomendacje hybrydowe: kandydaci z KNN, CF i popularności (w puli wątków);
+        # przy przeciążeniu gotowy ranking najlepiej ocenianych aut
+        async with admission("quiz_results") as admitted:
+            if admitted:
+                recommendations = await run_compute(recommend_cars_hybrid, user, top_n=5)
+            else:
+                recommendations = await sync_to_async(get_top_rated_cars)(user, top_n=5)
         
         # Pobierz oceny użytkownika do wyświetlenia
-        user_ratings = UserCarRating.objects.filter(user=request.user).order_by('-rating')[:10]
+        user_ratings = [
+            rating async for rating in
+            UserCarRating.objects.filter(user=user)
+            .select_related('car')
+            .order_by('-rating')[:10]
+        ]
         
-        return render(request, 'cars/quiz_results.html', {
+        return await sync_to_async(render)(request, 'cars/quiz_results.html', {
             'recommendations': recommendations,
             'user_ratings': user_ratings,
-            'total_ratings': user_ratings_count
+            'total_ratings': user_ratings_count,
+            'degraded': not admitted,
         })
     
     except ValueError as e:
-        return render(request, 'cars/quiz_results.html', {
+        user_ratings = [
+            rating async for rating in
+            UserCarRating.objects.filter(user=user).select_related('car').order_by('-rating')
+        ]
+        return await sync_to_async(render)(request, 'cars/quiz_results.html', {
             'error': str(e),
-            'user_ratings': UserCarRating.objects.filter(user=request.user).order_by('-rating')
+            'user_ratings': user_ratings
         })
     
 from django.http import JsonResponse
 
 
-def get_models_by_brand(request):
+async def get_models_by_brand(request):
     brand = request.GET.get('company_name')
 
     models = []
     if brand:
-        models = (
+        models = [
+            name async for name in
             Car.objects
-            .filter(company_name=brand)
+            .filter(lookup_filter('brand', Brand, name=brand))
             .values_list('car_name', flat=True)
             .distinct()
             .order_by('car_name')
-        )
+        ]
 
-    return JsonResponse(list(models), safe=False)
+    return JsonResponse(models, safe=False)
 
 from django.http import JsonResponse
 
 
-def get_engines(request):
+async def get_engines(request):
     brand = request.GET.get("company_name")
     model = request.GET.get("car_name")
 
     engines = Car.objects.all()
 
     if brand:
-        engines = engines.filter(company_name=brand)
+        engines = engines.filter(lookup_filter('brand', Brand, name=brand))
 
     if model:
         engines = engines.filter(car_name=model)
 
-    engines = (
+    engines = [
+        engine async for engine in
         engines
         .values_list("engine", flat=True)
         .distinct()
         .order_by("engine")
-    )
+    ]
+
+    return JsonResponse(engines, safe=False)
+
+
+def suggest(request):
+    """Podpowiedzi typeahead: ?q=prefiks[&field=company_name|car_name|engine][&limit=10]"""
+    field = request.GET.get("field") or None
+    if field is not None and field not in SUGGEST_FIELDS:
+        return JsonResponse({"error": f"Nieznane pole: {field}"}, status=400)
+
+    try:
+        limit = min(max(int(request.GET.get("limit", 10)), 1), 50)
+    except ValueError:
+        limit = 10
+
+    suggestions = get_suggest_index().suggest(request.GET.get("q", ""), field=field, limit=limit)
+    return JsonResponse(suggestions, safe=False)
+
+
+def facets(request):
+    """
+    Histogram cechy i przybliżona liczba pasujących aut:
+    ?field=horsepower[&min=..][&max=..][&company_name=..][&fuel_type=..]
+
+    Marka i paliwo zawężają rozkład (także razem), ale licznik uwzględnia
+    zakres tylko jednej cechy (field) - zakresy pozostałych cech i inne
+    filtry wyszukiwania są pomijane.
+    """
+    field = request.GET.get("field")
+    if field not in FACET_FIELDS:
+        return JsonResponse({"error": f"Nieznane pole: {field}"}, status=400)
+
+    try:
+        min_value = float(request.GET["min"]) if request.GET.get("min") else None
+        max_value = float(request.GET["max"]) if request.GET.get("max") else None
+    except ValueError:
+        return JsonResponse({"error": "Niepoprawny zakres"}, status=400)
+
+    company_name = request.GET.get("company_name") or None
+    fuel_type = request.GET.get("fuel_type") or None
+
+    stats = get_facet_stats()
+    return JsonResponse({
+        "field": field,
+        "bins": stats.histogram(field, company_name=company_name, fuel_type=fuel_type),
+        "count": stats.count_between(
+            field, min_value, max_value, company_name=company_name, fuel_type=fuel_type
+        ),
+    })
+
 
-    return JsonResponse(list(engines), safe=False)
+MAX_BATCH_CARS = 1000
+MAX_BATCH_TOP_N = 50
 
 
+@csrf_exempt
+@require_POST
+async def recommend_batch(request):
+    """
+    Rekomendacje dla wielu aut bazowych w jednym żądaniu (JSON):
 
+        {"cars": [{"company_name": "BMW", "car_name": "M3"}, ...],
+         "constraints": {"max_price": 200000, ...},
+         "top_n": 5}
+    """
+    try:
+        payload = json.loads(request.body or b"{}")
+        if not isinstance(payload, dict):
+            raise TypeError("oczekiwano obiektu JSON")
+        cars = payload.get("cars", [])
+        constraints = payload.get("constraints") or {}
+        if not isinstance(cars, list) or not all(isinstance(item, dict) for item in cars):
+            raise TypeError("cars musi być listą obiektów")
+        if not isinstance(constraints, dict):
+            raise TypeError("constraints musi być obiektem")
+        base_cars = [(item["company_name"], item["car_name"]) for item in cars]
+        if not all(isinstance(name, str) for pair in base_cars for name in pair):
+            raise TypeError("company_name i car_name muszą być tekstem")
+        top_n = int(payload.get("top_n", 5))
+    except (ValueError, TypeError, KeyError):
+        return JsonResponse({"error": "Niepoprawne dane wejściowe"}, status=400)
+
+    if not base_cars:
+        return JsonResponse({"error": "Brak aut bazowych"}, status=400)
+    if len(base_cars) > MAX_BATCH_CARS:
+        return JsonResponse({"error": f"Maksymalnie {MAX_BATCH_CARS} aut w jednym żądaniu"}, status=400)
+    if not 1 <= top_n <= MAX_BATCH_TOP_N:
+        return JsonResponse({"error": f"top_n musi być w zakresie 1-{MAX_BATCH_TOP_N}"}, status=400)
+
+    constraints_form = CompanyConstraintsForm(constraints)
+    if not constraints_form.is_valid():
+        return JsonResponse({"error": constraints_form.errors}, status=400)
+
+    async with admission("recommend_batch") as admitted:
+        if not admitted:
+            return reject(JsonResponse({"error": "Serwer jest przeciążony, spróbuj ponownie później"}), "recommend_batch")
+        entries = await run_compute(recommend_similar_batch, base_cars, constraints_form.cleaned_data, top_n=top_n)
+
+    return JsonResponse({"results": [
+        {
+            "company_name": entry["company_name"],
+            "car_name": entry["car_name"],
+            "base_car_id": entry["base_car"].id if entry["base_car"] else None,
+            "error": entry["error"],
+            "recommendations": [
+                {
+                    "id": item["car"].id,
+                    "company_name": item["car"].company_name,
+                    "car_name": item["car"].car_name,
+                    "distance": round(item["distance"], 6),
+                }
+                for item in entry["results"]
+            ],
+        }
+        for entry in entries
+    ]})
@@ -0,0 +1,165 @@
+import logging
+import threading
+import time
+
+from django.db import connections
+from django.http import JsonResponse
+
+logger = logging.getLogger(__name__)
+
+COLD = "cold"
+WARMING = "warming"
+READY = "ready"
+FAILED = "failed"
+
+_lock = threading.Lock()
+_status = {"state": COLD, "steps": {}, "errors": {}, "duration": None}
+
+
+def _numeric_stack():
+    # scikit-learn jest ładowany leniwie (knn.py); w masterze gunicorna
+    # import raz przed fork() daje workerom gotowe moduły bez kosztu
+    import sklearn.neighbors  # noqa: F401
+    import sklearn.preprocessing  # noqa: F401
+
+
+def _schema():
+    # Po migracjach danych artefakty ze starą pisownią nie mogą zostać użyte
+    from .catalogue import sync_schema_version
+    sync_schema_version()
+
+
+def _catalogue_snapshot():
+    from .records import get_catalogue_snapshot
+    get_catalogue_snapshot()
+
+
+def _vector_store():
+    from .vector_store import get_vector_store
+    get_vector_store()
+
+
+def _facets():
+    from .facets import get_facet_stats
+    get_facet_stats()
+
+
+def _search_indexes():
+    from .search_index import get_search_index, get_suggest_index
+    get_search_index()
+    get_suggest_index()
+
+
+def _similar_cars():
+    from .similar_cars import get_similar_cars_table
+    get_similar_cars_table()
+
+
+def _ratings_matrix():
+    # Indeks ocen wczytuje też macierz (albo buduje ją z bazy)
+    from .hybrid import get_ratings_index
+    get_ratings_index()
+
+
+def _leaderboards():
+    from .leaderboards import get_leaderboards
+    get_leaderboards()
+
+
+# Kolejność ma znaczenie: unieważnienie po migracjach przed wczytaniem
+# artefaktów, a snapshot katalogu jest potrzebny tabeli sąsiadów
+# i rekomendacjom, więc powstaje zaraz po bibliotekach
+WARMUP_STEPS = (
+    ("schema", _schema),
+    ("numeric_stack", _numeric_stack),
+    ("catalogue_snapshot", _catalogue_snapshot),
+    ("vector_store", _vector_store),
+    ("facets", _facets),
+    ("search_indexes", _search_indexes),
+    ("similar_cars", _similar_cars),
+    ("ratings_matrix", _ratings_matrix),
+    ("leaderboards", _leaderboards),
+)
+
+
+def _claim(states):
+    with _lock:
+        if _status["state"] not in states:
+            return False
+        _status.update(state=WARMING, steps={}, errors={}, duration=None)
+        return True
+
+
+def _run():
+    started = time.perf_counter()
+    errors = {}
+    try:
+        for name, step in WARMUP_STEPS:
+            step_started = time.perf_counter()
+            try:
+                step()
+            except Exception as exc:
+                errors[name] = f"{type(exc).__name__}: {exc}"
+                logger.exception("Rozgrzewka: krok %s nie powiódł się", name)
+            _status["steps"][name] = time.perf_counter() - step_started
+    finally:
+        # Połączenia z bazą nie mogą przejść przez fork() do workerów
+        for connection in connections.all(initialized_only=True):
+            if not connection.in_atomic_block:
+                connection.close()
+        with _lock:
+            _status.update(
+                state=FAILED if errors else READY,
+                errors=errors,
+                duration=time.perf_counter() - started,
+            )
+    logger.info("Rozgrzewka zakończona w %.2f s: %s", _status["duration"], _status["state"])
+
+
+def warm_up():
+    """
+    Buduje albo wczytuje artefakty, z których korzystają żądania.
+
+    Wywoływane w masterze gunicorna przed fork() (preload_app), więc
+    workery dostają gotowe obiekty współdzielone przez copy-on-write.
+    Błąd kroku nie przerywa pozostałych - stan "failed" oznacza, że
+    worker spróbuje ponownie (ensure_started).
+
+    Returns:
+        dict ze stanem, czasami kroków (sekundy) i błędami
+    """
+    if _claim((COLD, READY, FAILED)):
+        _run()
+    return status()
+
+
+def ensure_started():
+    """Uruchamia rozgrzewkę w tle, jeśli jeszcze się nie odbyła albo się nie udała."""
+    if not _claim((COLD, FAILED)):
+        return False
+    threading.Thread(target=_run, name="cars-warmup", daemon=True).start()
+    return True
+
+
+def is_ready():
+    return _status["state"] == READY
+
+
+def status():
+    with _lock:
+        return {
+            "state": _status["state"],
+            "steps": {name: round(seconds, 4) for name, seconds in _status["steps"].items()},
+            "errors": dict(_status["errors"]),
+            "duration": _status["duration"],
+        }
+
+
+def readiness_view(request):
+    """
+    Sprawdzenie gotowości dla load balancera / platformy: 200 dopiero po
+    rozgrzewce, wcześniej 503 (i start rozgrzewki, jeśli proces jej nie miał).
+    """
+    ensure_started()
+    current = status()
+    return JsonResponse(current, status=200 if current["state"] == READY else 503)
@@ -0,0 +1,77 @@
+"""
+Konfiguracja produkcyjna gunicorna (Procfile, railway.json).
+
+Aplikacja jest ładowana raz w masterze (preload_app) i tam rozgrzewana
+(CarsConfig.ready -> cars.warmup.warm_up): snapshot katalogu, statystyki
+facetów, indeksy wyszukiwania, tabela sąsiadów, macierz ocen i
+scikit-learn. Workery po fork() współdzielą te strony pamięci
+(copy-on-write), więc pierwsze żądanie po wdrożeniu nie buduje niczego.
+
+Master uruchamia też worker zadań w tle (manage.py run_worker) w tym
+samym kontenerze, więc przebudowy artefaktów trafiają do tego samego
+CARS_ARTIFACTS_DIR, z którego czytają workery HTTP. Osobny proces na
+innej maszynie (np. dyno "worker") nie widziałby tych plików.
+CARS_JOB_WORKER=0 wyłącza go (np. gdy worker zadań ma wspólny wolumen
+z artefaktami i działa osobno).
+"""
+import gc
+import os
+import subprocess
+import sys
+import threading
+import time
+
+os.environ.setdefault('CARS_PRELOAD', '1')
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = 'uvicorn_worker.UvicornWorker'
+preload_app = True
+errorlog = '-'
+
+
+# Przerwa przed ponownym startem workera zadań, który się zakończył
+JOB_WORKER_RESTART_DELAY = 5
+
+_job_worker = {"process": None, "stopping": False}
+
+
+def _supervise_job_worker(server):
+    while not _job_worker["stopping"]:
+        process = _job_worker["process"] = subprocess.Popen(
+            [sys.executable, 'manage.py', 'run_worker'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        code = process.wait()
+        if not _job_worker["stopping"]:
+            server.log.warning("run_worker zakończył się (kod %s), restart za %s s", code, JOB_WORKER_RESTART_DELAY)
+            time.sleep(JOB_WORKER_RESTART_DELAY)
+
+
+def when_ready(server):
+    # Obiekty z rozgrzewki trafiają do stałej generacji GC: zbieranie
+    # śmieci w workerach ich nie przegląda, więc nie zapisuje do ich
+    # stron i nie rozbija współdzielenia copy-on-write
+    gc.collect()
+    gc.freeze()
+
+    if os.environ.get('CARS_JOB_WORKER', '1') != '0':
+        threading.Thread(target=_supervise_job_worker, args=(server,), daemon=True).start()
+
+
+def on_exit(server):
+    _job_worker["stopping"] = True
+    process = _job_worker["process"]
+    if process is not None and process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def post_fork(server, worker):
+    # Jeśli rozgrzewka w masterze się nie udała (np. baza niedostępna przy
+    # starcie), worker ponawia ją w tle; /ready/ zwraca 503 do jej końca
+    from cars.warmup import ensure_started
+    ensure_started()